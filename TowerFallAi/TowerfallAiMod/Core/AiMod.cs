@@ -19,7 +19,7 @@ namespace TowerfallAi.Core {
     public const string Version = "0.1.1";
     public const string BaseDirectory = "aimod";
     private const string defaultConfigName = "config.json";
-    private const string poolName = "default";
+    private static string poolName = "default";
 
     // If this is set to false, this mod should do no effect.
     public static bool Enabled { get; private set;}
@@ -39,8 +39,10 @@ namespace TowerfallAi.Core {
     public static ConnectionDispatcher ConnectionDispatcher;
 
     public static bool IsNoConfig { get { return true; } }
-    public static bool IsFastrun { get { return true; } }
-    public static bool NoGraphics { get { return false; } }
+    static bool isFastrun = true;
+    static bool noGraphics = false;
+    public static bool IsFastrun { get { return isFastrun; } }
+    public static bool NoGraphics { get { return noGraphics; } }
 
     private static object ongoingOperationLock = new object();
 
@@ -76,6 +78,12 @@ namespace TowerfallAi.Core {
       for (int i = 0; i < args.Length; i++) {
         if (args[i] == "--aimod") {
           Enabled = true;
+        } else if (args[i] == "--pool" && i + 1 < args.Length) {
+          poolName = args[++i];
+        } else if (args[i] == "--no-fastrun") {
+          isFastrun = false;
+        } else if (args[i] == "--nographics") {
+          noGraphics = true;
         }
       }
     }
@@ -2,6 +2,7 @@ import logging
 import random
 from typing import Any, Mapping
 
+from common.entity_index import EntityIndex
 from towerfall import Connection
 
 class SimpleAgent:
@@ -19,6 +20,8 @@ class SimpleAgent:
     self.state_init: Mapping[str, Any] = {}
     self.state_scenario: Mapping[str, Any] = {}
     self.state_update: Mapping[str, Any] = {}
+    # Lookups into the entities of the last update.
+    self.entity_index: EntityIndex[Mapping[str, Any]] = EntityIndex()
     self.pressed = set()
     self.connection = connection
     self.attack_archers = attack_archers
@@ -50,6 +53,7 @@ class SimpleAgent:
     if game_state['type'] == 'update':
       # 'update' informs the state of entities in the map (players, arrows, enemies, etc).
       self.state_update = game_state
+      self.entity_index.update(game_state['entities'])
 
     # After receiving an 'update', your bot is expected to output string with the pressed buttons.
     # Each button is represented by a character:
@@ -70,16 +74,9 @@ class SimpleAgent:
     #  - Dashes randomly.
     #  - Jumps randomly.
 
-    my_state = None
     enemy_state = None
-
-    players = []
-
-    for state in self.state_update['entities']:
-      if state['type'] == 'archer':
-        players.append(state)
-        if state['playerIndex'] == self.state_init['index']:
-          my_state = state
+    players = self.entity_index.of_type('archer')
+    my_state = self.entity_index.archer(self.state_init['index'])
 
     # If the agent is not present, it means it is dead.
     if my_state == None:
@@ -96,10 +93,8 @@ class SimpleAgent:
         break
 
     # If no enemy archer is found, try to find another enemy.
-    if not enemy_state:
-      for state in self.state_update['entities']:
-        if state['isEnemy']:
-          enemy_state = state
+    if not enemy_state and self.entity_index.enemies:
+      enemy_state = self.entity_index.enemies[-1]
 
     # If no enemy is found, means all are dead.
     if enemy_state == None:
@@ -4,6 +4,7 @@ import math
 
 from typing import Any, Mapping
 
+from common.entity_index import EntityIndex
 from towerfall import Connection
 
 from common.utils import (
@@ -25,6 +26,8 @@ class TestAgent:
     self.state_init: Mapping[str, Any] = {}
     self.state_scenario: Mapping[str, Any] = {}
     self.state_update: Mapping[str, Any] = {}
+    # Lookups into the entities of the last update.
+    self.entity_index: EntityIndex[Mapping[str, Any]] = EntityIndex()
     self.pressed = set()
     self.connection = connection
     self.attack_archers = attack_archers
@@ -64,6 +67,7 @@ class TestAgent:
     if game_state['type'] == 'update':
       # 'update' informs the state of entities in the map (players, arrows, enemies, etc).
       self.state_update = game_state
+      self.entity_index.update(game_state['entities'])
 
     # After receiving an 'update', your bot is expected to output string with the pressed buttons.
     # Each button is represented by a character:
@@ -84,22 +88,10 @@ class TestAgent:
     #  - Dashes randomly.
     #  - Jumps randomly.
 
-    my_state = None
     enemy_state = None
-
-    players = []
-    arrows = []
-
-
-    for state in self.state_update['entities']:
-
-      if state['type'] == 'arrow':
-        arrows.append(state)
-
-      if state['type'] == 'archer':
-        players.append(state)
-        if state['playerIndex'] == self.state_init['index']:
-          my_state = state
+    players = self.entity_index.of_type('archer')
+    arrows = self.entity_index.of_type('arrow')
+    my_state = self.entity_index.archer(self.state_init['index'])
 
     # If the agent is not present, it means it is dead.
     if my_state == None:
@@ -117,10 +109,8 @@ class TestAgent:
         break
 
     # If no enemy archer is found, try to find another enemy.
-    if not enemy_state:
-      for state in self.state_update['entities']:
-        if state['isEnemy']:
-          enemy_state = state
+    if not enemy_state and self.entity_index.enemies:
+      enemy_state = self.entity_index.enemies[-1]
 
     # If no enemy is found, means all are dead.
     if enemy_state == None:
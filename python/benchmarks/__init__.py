@@ -0,0 +1,10 @@
+from .harness import (BenchmarkResult, Recorder, find_regressions,
+                      load_results, save_results)
+
+__all__ = [
+  'BenchmarkResult',
+  'Recorder',
+  'find_regressions',
+  'load_results',
+  'save_results',
+]
@@ -0,0 +1,264 @@
+'''
+Measures the throughput of the Python client stack against the fake server, which runs in its own process.
+Run from the python directory with: python -m benchmarks.client_benchmarks --output results.json
+'''
+import argparse
+import logging
+import random
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Sequence, Tuple
+
+from common.logging_options import default_logging
+from gym_wrapper import KillEnemyObjective, PlayerObservation, TowerfallBlankEnv
+from towerfall import Connection, ReplayConnection, Towerfall
+from towerfall.fake_server import spawn_fake_server
+
+from agents import SimpleAgent, TestAgent
+
+from .harness import (BenchmarkResult, Recorder, find_regressions,
+                      format_result, load_results, save_results)
+
+
+_POOL_NAME = 'benchmark'
+_KEYS = ['u', 'd', 'l', 'r', 'j', 'z', 's']
+
+
+def get_config(agent_count: int) -> Dict[str, Any]:
+  return dict(
+    mode='sandbox',
+    level='2',
+    fps=0,
+    agents=[dict(type='remote', team='blue')] * agent_count)
+
+
+def get_random_actions() -> str:
+  return ''.join(key for key in _KEYS if random.random() < 0.1)
+
+
+@contextmanager
+def fake_towerfall(n_entities: int, agent_count: int) -> Iterator[Towerfall]:
+  '''
+  Starts a fake server with n_entities extra entities and configures it for agent_count agents.
+  '''
+  with tempfile.TemporaryDirectory() as towerfall_path:
+    process = spawn_fake_server(towerfall_path, _POOL_NAME, n_entities=n_entities, timeout=10)
+    try:
+      towerfall = Towerfall(get_config(agent_count), towerfall_path=towerfall_path, pool_name=_POOL_NAME, timeout=10)
+      try:
+        yield towerfall
+      finally:
+        towerfall.close()
+    finally:
+      process.kill()
+      process.wait()
+
+
+def join(towerfall: Towerfall, agent_count: int) -> List[Connection]:
+  connections = [towerfall.join(timeout=10) for _ in range(agent_count)]
+  for message_type in ['init', 'scenario']:
+    for connection in connections:
+      message = connection.read_json()
+      assert message['type'] == message_type, message['type']
+      connection.send_json(dict(type='result', success=True))
+  return connections
+
+
+def bench_connection(n_entities: int, agent_count: int, n_frames: int, warmup: int) -> BenchmarkResult:
+  '''
+  Raw round trips: every agent reads an update and replies with random actions. A sample is a whole frame.
+  '''
+  recorder = Recorder()
+  with fake_towerfall(n_entities, agent_count) as towerfall:
+    connections = join(towerfall, agent_count)
+    for i in range(warmup + n_frames):
+      if i >= warmup:
+        recorder.start()
+      for connection in connections:
+        state_update = connection.read_json()
+        connection.send_json(dict(type='actions', actions=get_random_actions(), id=state_update['id']))
+      if i >= warmup:
+        recorder.stop()
+    for connection in connections:
+      connection.close()
+  return recorder.result('connection_round_trip', dict(entities=n_entities, agents=agent_count))
+
+
+def bench_blank_env(name: str, frame_skip: int = 1) -> Callable[[int, int, int, int], BenchmarkResult]:
+  '''
+  Creates a benchmark of TowerfallBlankEnv.step with the player observation and the kill enemy objective. A sample is a step,
+  resets are not measured. With frame_skip, each frame the step covers is a sample of the step's duration divided by the
+  frames, so fps counts game frames.
+  '''
+  def bench(n_entities: int, agent_count: int, n_frames: int, warmup: int) -> BenchmarkResult:
+    assert agent_count == 1, 'TowerfallBlankEnv drives a single agent.'
+    recorder = Recorder()
+    with fake_towerfall(n_entities, agent_count) as towerfall:
+      env = TowerfallBlankEnv(
+        towerfall=towerfall,
+        observations=[PlayerObservation()],
+        objective=KillEnemyObjective(enemy_count=3, episode_max_len=60*10),
+        frame_skip=frame_skip)
+      env.reset()
+      for i in range(warmup + n_frames):
+        actions = env.action_space.sample()
+        start = time.perf_counter_ns()
+        _, _, done, _ = env.step(actions)
+        if i >= warmup:
+          per_frame = (time.perf_counter_ns() - start) // frame_skip
+          for _ in range(frame_skip):
+            recorder.add(per_frame)
+        if done:
+          env.reset()
+      env.connection.close()
+    return recorder.result(name, dict(entities=n_entities, agents=agent_count))
+  return bench
+
+
+def bench_blank_env_reset(n_entities: int, agent_count: int, n_frames: int, warmup: int) -> BenchmarkResult:
+  '''
+  TowerfallBlankEnv.reset, from the reset request to the observation of the first update. A sample is a reset.
+  '''
+  assert agent_count == 1, 'TowerfallBlankEnv drives a single agent.'
+  recorder = Recorder()
+  with fake_towerfall(n_entities, agent_count) as towerfall:
+    env = TowerfallBlankEnv(
+      towerfall=towerfall,
+      observations=[PlayerObservation()],
+      objective=KillEnemyObjective(enemy_count=3, episode_max_len=60*10))
+    env.reset()
+    for i in range(warmup + n_frames):
+      env.step(env.action_space.sample())
+      if i >= warmup:
+        recorder.start()
+      env.reset()
+      if i >= warmup:
+        recorder.stop()
+    env.connection.close()
+  return recorder.result('blank_env_reset', dict(entities=n_entities, agents=agent_count))
+
+
+def bench_replay_env(n_entities: int, agent_count: int, n_frames: int, warmup: int) -> BenchmarkResult:
+  '''
+  TowerfallBlankEnv.step replaying a recording of the fake server with ReplayConnection, so only observations, objective and
+  decoding are measured. A sample is a step, resets are not measured.
+  '''
+  assert agent_count == 1, 'TowerfallBlankEnv drives a single agent.'
+  recorder = Recorder()
+
+  def create_env(towerfall, connection=None, record_path=None) -> TowerfallBlankEnv:
+    return TowerfallBlankEnv(
+      towerfall=towerfall,
+      observations=[PlayerObservation()],
+      objective=KillEnemyObjective(enemy_count=3, episode_max_len=60*10),
+      record_path=record_path,
+      connection=connection)
+
+  with tempfile.TemporaryDirectory() as record_dir:
+    record_path = f'{record_dir}/replay.tfr'
+    with fake_towerfall(n_entities, agent_count) as towerfall:
+      env = create_env(towerfall, record_path=record_path)
+      env.reset()
+      for _ in range(min(warmup + n_frames, 1000)):
+        _, _, done, _ = env.step(env.action_space.sample())
+        if done:
+          env.reset()
+      env.connection.close()
+
+    env = create_env(None, connection=ReplayConnection(record_path, loop=True))
+    env.reset()
+    for i in range(warmup + n_frames):
+      actions = env.action_space.sample()
+      if i >= warmup:
+        recorder.start()
+      _, _, done, _ = env.step(actions)
+      if i >= warmup:
+        recorder.stop()
+      if done:
+        env.reset()
+  return recorder.result('replay_env_step', dict(entities=n_entities, agents=agent_count))
+
+
+def bench_agent(name: str, agent_cls: Callable[[Connection], Any]) -> Callable[[int, int, int, int], BenchmarkResult]:
+  '''
+  Creates a benchmark of agent.act, which decides and sends the actions. A sample is the time all agents spent in act during a
+  frame. Reading the updates is not measured.
+  '''
+  def bench(n_entities: int, agent_count: int, n_frames: int, warmup: int) -> BenchmarkResult:
+    recorder = Recorder()
+    with fake_towerfall(n_entities, agent_count) as towerfall:
+      connections = [towerfall.join(timeout=10) for _ in range(agent_count)]
+      agents = [agent_cls(connection) for connection in connections]
+      frame = 0
+      while frame < warmup + n_frames:
+        duration = 0
+        measured = frame >= warmup
+        for connection, agent in zip(connections, agents):
+          game_state = connection.read_json()
+          if game_state['type'] != 'update':
+            measured = False
+          start = time.perf_counter_ns()
+          agent.act(game_state)
+          duration += time.perf_counter_ns() - start
+        if measured:
+          recorder.add(duration)
+        frame += 1
+      for connection in connections:
+        connection.close()
+    return recorder.result(name, dict(entities=n_entities, agents=agent_count))
+  return bench
+
+
+_BENCHMARKS: Dict[str, Tuple[Callable[[int, int, int, int], BenchmarkResult], bool]] = {
+  # name: (benchmark, whether it sweeps agent count)
+  'connection_round_trip': (bench_connection, True),
+  'blank_env_step': (bench_blank_env('blank_env_step'), False),
+  'blank_env_frame_skip_4': (bench_blank_env('blank_env_frame_skip_4', frame_skip=4), False),
+  'blank_env_reset': (bench_blank_env_reset, False),
+  'replay_env_step': (bench_replay_env, False),
+  'simple_agent_act': (bench_agent('simple_agent_act', SimpleAgent), True),
+  'test_agent_act': (bench_agent('test_agent_act', TestAgent), True),
+}
+
+
+def run(names: Sequence[str], entity_counts: Sequence[int], agent_counts: Sequence[int], n_frames: int, warmup: int) -> List[BenchmarkResult]:
+  results = []
+  for name in names:
+    benchmark, sweeps_agents = _BENCHMARKS[name]
+    for n_entities in entity_counts:
+      for agent_count in (agent_counts if sweeps_agents else [1]):
+        result = benchmark(n_entities, agent_count, n_frames, warmup)
+        logging.info(format_result(result))
+        results.append(result)
+  return results
+
+
+def main():
+  default_logging()
+  parser = argparse.ArgumentParser(description='Benchmarks the Python client stack against the fake Towerfall server.')
+  parser.add_argument('--benchmarks', nargs='+', default=list(_BENCHMARKS), choices=list(_BENCHMARKS))
+  parser.add_argument('--entities', type=int, nargs='+', default=[0, 20, 100])
+  parser.add_argument('--agents', type=int, nargs='+', default=[1, 2, 4])
+  parser.add_argument('--frames', type=int, default=1000)
+  parser.add_argument('--warmup', type=int, default=100)
+  parser.add_argument('--output', help='Path of the JSON file to save the results to.')
+  parser.add_argument('--compare', help='Path of a JSON file with baseline results. Exits with 1 if p50 regressed.')
+  parser.add_argument('--tolerance', type=float, default=0.1, help='Fraction by which p50 may grow before it is a regression.')
+  args = parser.parse_args()
+
+  random.seed(0)
+  results = run(args.benchmarks, args.entities, args.agents, args.frames, args.warmup)
+  if args.output:
+    save_results(results, args.output)
+  if args.compare:
+    regressions = find_regressions(load_results(args.compare), results, args.tolerance)
+    for regression in regressions:
+      logging.error(f'Regression: {regression}')
+    if regressions:
+      sys.exit(1)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,134 @@
+'''
+Microbenchmarks of the entity classes, comparing the slotted Entity and Vec2 with the previous __dict__ based ones and with
+EntityFrame. Run from the python directory with: python -m benchmarks.entity_benchmarks
+'''
+import argparse
+import logging
+import random
+import tracemalloc
+from math import sqrt
+from typing import Any, Callable, Dict, List, Sequence
+
+from common.entity import Entity, Vec2, distances, to_entities
+from common.entity_frame import EntityFrame
+from common.logging_options import default_logging
+
+from .harness import BenchmarkResult, Recorder, format_result, save_results
+
+
+class _DictVec2:
+  '''
+  Vec2 as it was before __slots__, kept as the baseline.
+  '''
+  def __init__(self, x: float, y: float):
+    self.x = x
+    self.y = y
+
+  def __sub__(self, o):
+    return _DictVec2(self.x - o.x, self.y - o.y)
+
+  def __mul__(self, o):
+    if isinstance(o, float) or isinstance(o, int):
+      return _DictVec2(self.x * o, self.y * o)
+    raise NotImplementedError()
+
+  def length(self):
+    return sqrt(self.x**2 + self.y**2)
+
+
+class _DictEntity:
+  '''
+  Entity as it was before __slots__, kept as the baseline.
+  '''
+  def __init__(self, e: Dict[str, Any]):
+    self.p = _DictVec2(e['pos']['x'], e['pos']['y'])
+    self.v = _DictVec2(e['vel']['x'], e['vel']['y'])
+    self.s = _DictVec2(e['size']['x'], e['size']['y'])
+    self.isEnemy = e['isEnemy']
+    self.type = e['type']
+    self.e = e
+
+
+def _dict_to_entities(entities: List[Dict[str, Any]]) -> List[_DictEntity]:
+  result = []
+  for e in entities:
+    result.append(_DictEntity(e))
+  return result
+
+
+def _random_entities(n_entities: int) -> List[Dict[str, Any]]:
+  def vec():
+    return dict(x=random.uniform(0, 320), y=random.uniform(0, 240))
+  return [dict(type=random.choice(['arrow', 'slime', 'archer']), id=i, isEnemy=False, pos=vec(), vel=vec(), size=vec())
+          for i in range(n_entities)]
+
+
+def _measure(name: str, n_entities: int, n_frames: int, fn: Callable[[], Any]) -> BenchmarkResult:
+  recorder = Recorder()
+  for _ in range(n_frames):
+    recorder.start()
+    fn()
+    recorder.stop()
+  return recorder.result(name, dict(entities=n_entities))
+
+
+def _allocated_bytes(fn: Callable[[], Any]) -> int:
+  '''
+  Bytes still allocated by the objects that fn returns.
+  '''
+  tracemalloc.start()
+  before = tracemalloc.get_traced_memory()[0]
+  result = fn()
+  allocated = tracemalloc.get_traced_memory()[0] - before
+  tracemalloc.stop()
+  del result
+  return allocated
+
+
+def run(entity_counts: Sequence[int], n_frames: int) -> List[BenchmarkResult]:
+  results = []
+  for n_entities in entity_counts:
+    raw = _random_entities(n_entities)
+    builders: Dict[str, Callable[[], Any]] = {
+      'dict_entities': lambda: _dict_to_entities(raw),
+      'slotted_entities': lambda: to_entities(raw),
+      'entity_frame': lambda: EntityFrame(raw),
+    }
+    for name, build in builders.items():
+      results.append(_measure(f'{name}_build', n_entities, n_frames, build))
+      logging.info(format_result(results[-1]))
+      logging.info(f'{name} memory: {_allocated_bytes(build) / max(1, n_entities):.0f}B per entity')
+
+    dict_entities = _dict_to_entities(raw)
+    entities = to_entities(raw)
+    frame = EntityFrame(raw)
+    p = _DictVec2(160, 120)
+    v = Vec2(160, 120)
+    distance_fns: Dict[str, Callable[[], Any]] = {
+      'dict_vec2_distances': lambda: [((e.p - p) * 1.0).length() for e in dict_entities],
+      'slotted_vec2_distances': lambda: [((e.p - v) * 1.0).length() for e in entities],
+      'batch_distances': lambda: distances(v, entities),
+      'entity_frame_distances': lambda: frame.distances(v.x, v.y),
+    }
+    for name, fn in distance_fns.items():
+      results.append(_measure(name, n_entities, n_frames, fn))
+      logging.info(format_result(results[-1]))
+  return results
+
+
+def main():
+  default_logging()
+  parser = argparse.ArgumentParser(description='Benchmarks building and querying entities.')
+  parser.add_argument('--entities', type=int, nargs='+', default=[10, 100, 500])
+  parser.add_argument('--frames', type=int, default=2000)
+  parser.add_argument('--output', help='Path of the JSON file to save the results to.')
+  args = parser.parse_args()
+
+  random.seed(0)
+  results = run(args.entities, args.frames)
+  if args.output:
+    save_results(results, args.output)
+
+
+if __name__ == '__main__':
+  main()
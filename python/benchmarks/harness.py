@@ -0,0 +1,121 @@
+import json
+import os
+import platform
+import sys
+import time
+from typing import Any, Dict, Iterable, List, Mapping, NamedTuple, Optional
+
+from towerfall import get_codec
+
+
+class BenchmarkResult(NamedTuple):
+  name: str
+  params: Dict[str, Any]
+  frames: int
+  # Frames per second over the whole run, including the time not spent in the measured section.
+  fps: float
+  # Latencies of the measured section, in milliseconds.
+  mean: float
+  p50: float
+  p99: float
+  max: float
+
+
+class Recorder:
+  '''
+  Collects the duration of a measured section on every frame. Use start and stop around the section, or add for a duration
+  measured elsewhere.
+  '''
+  def __init__(self):
+    self.samples: List[int] = []
+    self._start = 0
+    self._run_start: Optional[float] = None
+    self._run_end = 0.0
+
+  def start(self):
+    self._start = time.perf_counter_ns()
+    if self._run_start is None:
+      self._run_start = time.perf_counter()
+
+  def stop(self):
+    self.add(time.perf_counter_ns() - self._start)
+
+  def add(self, duration_ns: int):
+    now = time.perf_counter()
+    if self._run_start is None:
+      self._run_start = now - duration_ns / 1e9
+    self.samples.append(duration_ns)
+    self._run_end = now
+
+  def result(self, name: str, params: Mapping[str, Any]) -> BenchmarkResult:
+    samples = sorted(self.samples)
+    assert samples, f'No samples recorded for {name}'
+    elapsed = self._run_end - (self._run_start if self._run_start is not None else self._run_end)
+    return BenchmarkResult(
+      name=name,
+      params=dict(params),
+      frames=len(samples),
+      fps=len(samples) / elapsed if elapsed > 0 else float('inf'),
+      mean=sum(samples) / len(samples) / 1e6,
+      p50=percentile(samples, 50) / 1e6,
+      p99=percentile(samples, 99) / 1e6,
+      max=samples[-1] / 1e6)
+
+
+def percentile(sorted_samples: List[int], q: float) -> float:
+  '''
+  Nearest-rank percentile of samples sorted in ascending order.
+  '''
+  rank = max(0, min(len(sorted_samples) - 1, int(round(q / 100 * len(sorted_samples))) - 1))
+  return sorted_samples[rank]
+
+
+def machine_info() -> Dict[str, Any]:
+  return dict(
+    python=sys.version.split()[0],
+    implementation=platform.python_implementation(),
+    platform=platform.platform(),
+    processor=platform.processor(),
+    cpu_count=os.cpu_count(),
+    codec=get_codec().name)
+
+
+def save_results(results: Iterable[BenchmarkResult], path: str):
+  '''
+  Saves results as JSON, with the machine they ran on.
+  '''
+  with open(path, 'w') as file:
+    json.dump(dict(
+      machine_info=machine_info(),
+      datetime=time.strftime('%Y-%m-%dT%H:%M:%S'),
+      benchmarks=[result._asdict() for result in results]), file, indent=2)
+
+
+def load_results(path: str) -> List[BenchmarkResult]:
+  with open(path, 'r') as file:
+    return [BenchmarkResult(**result) for result in json.load(file)['benchmarks']]
+
+
+def find_regressions(baseline: Iterable[BenchmarkResult], results: Iterable[BenchmarkResult], tolerance: float = 0.1) -> List[str]:
+  '''
+  Compares the p50 latency of every benchmark that is in both runs.
+
+  params tolerance: Fraction by which p50 may grow before it is reported.
+
+  returns: A description of every regression.
+  '''
+  def key(result: BenchmarkResult):
+    return result.name, tuple(sorted(result.params.items()))
+
+  baseline_by_key = {key(result): result for result in baseline}
+  regressions = []
+  for result in results:
+    base = baseline_by_key.get(key(result))
+    if base and result.p50 > base.p50 * (1 + tolerance):
+      regressions.append(f'{result.name} {result.params}: p50 {base.p50:.3f}ms -> {result.p50:.3f}ms')
+  return regressions
+
+
+def format_result(result: BenchmarkResult) -> str:
+  params = ' '.join(f'{k}={v}' for k, v in result.params.items())
+  return f'{result.name:<24} {params:<24} fps: {result.fps:9.1f}  p50: {result.p50:7.3f}ms  p99: {result.p99:7.3f}ms'
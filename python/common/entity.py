@@ -1,18 +1,23 @@
 from __future__ import annotations
 
 import sys
-from math import sqrt
-from typing import Any, Dict, List, Tuple
+from math import hypot
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
 
 import numpy as np
 from numpy.typing import NDArray
 
 
 class Entity:
+  __slots__ = ('p', 'v', 's', 'isEnemy', 'type', 'e')
+
   def __init__(self, e: Dict[str, Any]):
-    self.p: Vec2 = vec2_from_dict(e['pos'])
-    self.v: Vec2 = vec2_from_dict(e['vel'])
-    self.s: Vec2 = vec2_from_dict(e['size'])
+    pos = e['pos']
+    vel = e['vel']
+    size = e['size']
+    self.p: Vec2 = Vec2(pos['x'], pos['y'])
+    self.v: Vec2 = Vec2(vel['x'], vel['y'])
+    self.s: Vec2 = Vec2(size['x'], size['y'])
     self.isEnemy: bool = e['isEnemy']
     self.type: str = e['type']
     self.e: Any = e
@@ -28,6 +33,8 @@ class Entity:
 
 
 class Vec2:
+  __slots__ = ('x', 'y')
+
   def __init__(self, x: float, y: float):
     self.x: float = x
     self.y: float = y
@@ -48,22 +55,18 @@ class Vec2:
     return Vec2(-self.x, -self.y)
 
   def __mul__(self, o):
-    if isinstance(o, float) or isinstance(o, int):
+    if isinstance(o, (float, int)):
       return Vec2(self.x * o, self.y * o)
     raise NotImplementedError()
 
   def __truediv__(self, o):
-    if isinstance(o, float) or isinstance(o, int):
+    if isinstance(o, (float, int)):
       return Vec2(self.x / o, self.y / o)
     raise NotImplementedError()
 
   def __eq__(self, other):
     if isinstance(other, Vec2):
-      if self.x != other.x:
-        return False
-      if self.y != other.y:
-        return False
-      return True
+      return self.x == other.x and self.y == other.y
     return NotImplemented
 
   def tupleint(self) -> Tuple[int, int]:
@@ -81,7 +84,10 @@ class Vec2:
     self.y *= l/d
 
   def length(self):
-    return sqrt(self.x**2 + self.y**2)
+    return hypot(self.x, self.y)
+
+  def distance(self, o: Vec2) -> float:
+    return hypot(self.x - o.x, self.y - o.y)
 
   def copy(self):
     return Vec2(self.x, self.y)
@@ -112,8 +118,31 @@ def vec2_from_dict(p: Dict[str, Any]) -> Vec2:
 
 
 def to_entities(entities: List[Dict[str, Any]]) -> List[Entity]:
-  result = []
-  for e in entities:
-    result.append(Entity(e))
-
-  return result
+  return [Entity(e) for e in entities]
+
+
+def positions(entities: Sequence[Entity]) -> NDArray[np.float64]:
+  '''
+  Positions of the entities as an (n, 2) array.
+  '''
+  return np.array([(e.p.x, e.p.y) for e in entities], dtype=np.float64).reshape((len(entities), 2))
+
+
+def distances(p: Vec2, entities: Iterable[Entity]) -> NDArray[np.float64]:
+  '''
+  Distance from a point to each of the entities.
+  '''
+  entities = list(entities)
+  delta = positions(entities) - (p.x, p.y)
+  return np.hypot(delta[:, 0], delta[:, 1])
+
+
+def closest(p: Vec2, entities: Sequence[Entity], k: int) -> List[Entity]:
+  '''
+  The k entities closest to a point, closest first.
+  '''
+  if not entities:
+    return []
+  d = distances(p, entities)
+  order = np.argsort(d, kind='stable')[:k]
+  return [entities[i] for i in order]
@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Sequence
+
+import numpy as np
+from numpy.typing import NDArray
+
+from .entity import Vec2
+
+# Type codes are shared by all frames, so they can be compared across frames and processes that see types in the same order.
+_TYPE_CODES: Dict[str, int] = {}
+_TYPES: List[str] = []
+
+
+def type_code(type: str) -> int:
+  '''
+  Code of an entity type in EntityFrame.type_code. Types get a code the first time they are seen.
+  '''
+  code = _TYPE_CODES.get(type)
+  if code is None:
+    code = _TYPE_CODES[type] = len(_TYPES)
+    _TYPES.append(type)
+  return code
+
+
+def type_name(code: int) -> str:
+  return _TYPES[code]
+
+
+class EntityView:
+  '''
+  Entity compatible view of one row of an EntityFrame. The Vec2 attributes are only created when accessed.
+  '''
+  __slots__ = ('_frame', '_i', '_p', '_v', '_s')
+
+  def __init__(self, frame: EntityFrame, i: int):
+    self._frame = frame
+    self._i = i
+    self._p: Optional[Vec2] = None
+    self._v: Optional[Vec2] = None
+    self._s: Optional[Vec2] = None
+
+  @property
+  def p(self) -> Vec2:
+    if self._p is None:
+      x, y = self._frame.pos[self._i]
+      self._p = Vec2(float(x), float(y))
+    return self._p
+
+  @property
+  def v(self) -> Vec2:
+    if self._v is None:
+      x, y = self._frame.vel[self._i]
+      self._v = Vec2(float(x), float(y))
+    return self._v
+
+  @property
+  def s(self) -> Vec2:
+    if self._s is None:
+      x, y = self._frame.size[self._i]
+      self._s = Vec2(float(x), float(y))
+    return self._s
+
+  @property
+  def isEnemy(self) -> bool:
+    return bool(self._frame.is_enemy[self._i])
+
+  @property
+  def type(self) -> str:
+    return self._frame.raw[self._i]['type']
+
+  @property
+  def e(self) -> Mapping[str, Any]:
+    return self._frame.raw[self._i]
+
+  @property
+  def frame(self) -> EntityFrame:
+    return self._frame
+
+  @property
+  def index(self) -> int:
+    '''
+    Row of the entity in its frame.
+    '''
+    return self._i
+
+  def __getitem__(self, key):
+    return self._frame.raw[self._i][key]
+
+  def bot_left(self) -> Vec2:
+    x, y = self._frame.pos[self._i] - self._frame.size[self._i] / 2
+    return Vec2(float(x), float(y))
+
+  def top_right(self) -> Vec2:
+    x, y = self._frame.pos[self._i] + self._frame.size[self._i] / 2
+    return Vec2(float(x), float(y))
+
+
+class EntityFrame(Sequence[EntityView]):
+  '''
+  Entities of an update stored as a struct of arrays, one row per entity, instead of an Entity and three Vec2 per entity.
+  Indexing and iterating give EntityView objects that behave like Entity, created lazily. Fields that are not unpacked into
+  arrays are read from the decoded json in raw.
+
+  params raw: The entities of the update message.
+  '''
+  def __init__(self, raw: List[Mapping[str, Any]]):
+    n = len(raw)
+    self.raw = raw
+    codes = _TYPE_CODES
+    # A single pass over the dicts. Ids, type codes, flags and player indices are exact in float64.
+    values = np.array([
+      (p['x'], p['y'], v['x'], v['y'], s['x'], s['y'], e['id'], codes.get(e['type'], -1), e['isEnemy'], e.get('playerIndex', -1))
+      for e in raw for p, v, s in ((e['pos'], e['vel'], e['size']),)], dtype=np.float64).reshape((n, 10))
+    self.pos: NDArray[np.float64] = values[:, 0:2]
+    self.vel: NDArray[np.float64] = values[:, 2:4]
+    self.size: NDArray[np.float64] = values[:, 4:6]
+    self.id: NDArray[np.int64] = values[:, 6].astype(np.int64)
+    self.type_code: NDArray[np.int16] = values[:, 7].astype(np.int16)
+    self.is_enemy: NDArray[np.bool_] = values[:, 8].astype(np.bool_)
+    self.player_index: NDArray[np.int8] = values[:, 9].astype(np.int8)
+    for i in np.flatnonzero(self.type_code < 0):
+      self.type_code[i] = type_code(raw[i]['type'])
+    self._views: List[Optional[EntityView]] = [None] * n
+
+  def __len__(self) -> int:
+    return len(self.raw)
+
+  def __getitem__(self, i):
+    if isinstance(i, slice):
+      views = self._views
+      for j in range(*i.indices(len(self))):
+        if views[j] is None:
+          views[j] = EntityView(self, j)
+      return views[i]
+    view = self._views[i]
+    if view is None:
+      if i < 0:
+        i += len(self)
+      view = self._views[i] = EntityView(self, i)
+    return view
+
+  def __iter__(self) -> Iterator[EntityView]:
+    for i in range(len(self)):
+      yield self[i]
+
+  def of_type(self, type: str) -> NDArray[np.bool_]:
+    '''
+    Mask of the entities of a type.
+    '''
+    code = _TYPE_CODES.get(type)
+    if code is None:
+      return np.zeros((len(self),), dtype=np.bool_)
+    return self.type_code == code
+
+  def select(self, mask: NDArray[np.bool_]) -> List[EntityView]:
+    return [self[int(i)] for i in np.flatnonzero(mask)]
+
+  def find_archer(self, player_index: int) -> Optional[EntityView]:
+    '''
+    The archer of a player, or None if it is not in the frame.
+    '''
+    rows = np.flatnonzero(self.of_type('archer') & (self.player_index == player_index))
+    return self[int(rows[0])] if len(rows) else None
+
+  def distances(self, x: float, y: float) -> NDArray[np.float64]:
+    '''
+    Distance from a point to every entity.
+    '''
+    return np.hypot(self.pos[:, 0] - x, self.pos[:, 1] - y)
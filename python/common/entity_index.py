@@ -0,0 +1,125 @@
+from typing import Any, Dict, Generic, Iterable, List, Optional, TypeVar
+
+import numpy as np
+
+from .entity_frame import EntityFrame, type_code, type_name
+
+# Anything indexable by key like an entity: the json dict of an update, Entity or EntityView.
+T = TypeVar('T')
+
+_EMPTY: List[Any] = []
+
+
+class EntityIndex(Generic[T]):
+  '''
+  Lookups into the entities of the last update, rebuilt with a single pass on every update. Entities are carried across
+  updates by id, which gives the entities that spawned and despawned since the previous update and the update in which
+  each entity was first seen.
+
+  Works on the json dicts of update messages as well as on Entity and EntityView. An EntityFrame is indexed from its column
+  arrays instead of reading every entity.
+  '''
+  def __init__(self):
+    self.by_id: Dict[int, T] = {}
+    self.by_type: Dict[str, List[T]] = {}
+    # Archers by playerIndex.
+    self.by_player_index: Dict[int, T] = {}
+    # Entities with isEnemy, in update order.
+    self.enemies: List[T] = []
+    # Entities whose id was not in the previous update.
+    self.spawned: List[T] = []
+    # Entities of the previous update whose id is gone.
+    self.despawned: List[T] = []
+    # Update count when each current id was first seen.
+    self.first_seen: Dict[int, int] = {}
+    self.updates = 0
+
+  def __len__(self) -> int:
+    return len(self.by_id)
+
+  def __contains__(self, id: int) -> bool:
+    return id in self.by_id
+
+  def update(self, entities: Iterable[T]) -> 'EntityIndex[T]':
+    '''
+    Indexes the entities of a new update.
+    '''
+    if isinstance(entities, EntityFrame):
+      return self._update_frame(entities)
+    by_id: Dict[int, T] = {}
+    by_type: Dict[str, List[T]] = {}
+    by_player_index: Dict[int, T] = {}
+    enemies: List[T] = []
+    for e in entities:
+      by_id[e['id']] = e
+      type = e['type']
+      of_type = by_type.get(type)
+      if of_type is None:
+        by_type[type] = [e]
+      else:
+        of_type.append(e)
+      if type == 'archer':
+        by_player_index[e['playerIndex']] = e
+      if e['isEnemy']:
+        enemies.append(e)
+    return self._set(by_id, by_type, by_player_index, enemies)
+
+  def _update_frame(self, frame: EntityFrame) -> 'EntityIndex[T]':
+    views: List[Any] = frame[:]
+    by_id: Dict[int, T] = dict(zip(frame.id.tolist(), views))
+    by_type: Dict[str, List[T]] = {}
+    codes = frame.type_code
+    for code in np.unique(codes).tolist():
+      by_type[type_name(code)] = [views[i] for i in np.flatnonzero(codes == code).tolist()]
+    archers = np.flatnonzero(codes == type_code('archer')).tolist()
+    player_indices = frame.player_index.tolist()
+    by_player_index: Dict[int, T] = {player_indices[i]: views[i] for i in archers}
+    enemies: List[T] = [views[i] for i in np.flatnonzero(frame.is_enemy).tolist()]
+    return self._set(by_id, by_type, by_player_index, enemies)
+
+  def _set(self,
+      by_id: Dict[int, T],
+      by_type: Dict[str, List[T]],
+      by_player_index: Dict[int, T],
+      enemies: List[T]) -> 'EntityIndex[T]':
+    previous = self.by_id
+    first_seen = self.first_seen
+    self.spawned = [e for id, e in by_id.items() if id not in previous]
+    self.despawned = [e for id, e in previous.items() if id not in by_id]
+    for id in previous:
+      if id not in by_id:
+        del first_seen[id]
+    for id in by_id:
+      if id not in previous:
+        first_seen[id] = self.updates
+
+    self.by_id = by_id
+    self.by_type = by_type
+    self.by_player_index = by_player_index
+    self.enemies = enemies
+    self.updates += 1
+    return self
+
+  def clear(self):
+    '''
+    Forgets the previous update, so every entity of the next one is reported as spawned.
+    '''
+    self.by_id = {}
+    self.by_type = {}
+    self.by_player_index = {}
+    self.enemies = []
+    self.spawned = []
+    self.despawned = []
+    self.first_seen = {}
+
+  def get(self, id: int) -> Optional[T]:
+    return self.by_id.get(id)
+
+  def of_type(self, type: str) -> List[T]:
+    '''
+    Entities of a type, in update order. The list must not be modified.
+    '''
+    return self.by_type.get(type, _EMPTY)
+
+  def archer(self, player_index: int) -> Optional[T]:
+    return self.by_player_index.get(player_index)
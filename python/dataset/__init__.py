@@ -0,0 +1,10 @@
+from .exporter import DatasetExporter, export_recordings
+from .loader import iter_shards, load_manifest, load_table
+
+__all__ = [
+  'DatasetExporter',
+  'export_recordings',
+  'iter_shards',
+  'load_manifest',
+  'load_table',
+]
@@ -0,0 +1,331 @@
+import argparse
+import json
+import logging
+import os
+from array import array
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+from numpy.typing import NDArray
+
+from common.constants import DASH, DOWN, JUMP, LEFT, RIGHT, SHOOT, UP
+from common.logging_options import default_logging
+from towerfall import Codec, ReplayReader, get_codec
+from towerfall.recording import BINARY_RECORD_EXTENSION, RECEIVED, SENT
+
+MANIFEST_NAME = 'dataset.json'
+_ACTION_KEYS = [LEFT, RIGHT, DOWN, UP, JUMP, DASH, SHOOT]
+_GAME_MESSAGE_TYPES = ('init', 'scenario', 'update')
+
+# name: array typecode, numpy dtype
+FRAME_COLUMNS: Dict[str, Tuple[str, str]] = {
+  'frame': ('q', 'int64'),
+  'episode': ('i', 'int32'),
+  'step': ('i', 'int32'),
+  'update_id': ('q', 'int64'),
+  'dt': ('f', 'float32'),
+  'n_entities': ('i', 'int32'),
+  'archer_present': ('b', 'bool'),
+  'archer_x': ('f', 'float32'),
+  'archer_y': ('f', 'float32'),
+  'archer_vx': ('f', 'float32'),
+  'archer_vy': ('f', 'float32'),
+  'archer_facing': ('b', 'int8'),
+  'archer_on_ground': ('b', 'bool'),
+  'archer_on_wall': ('b', 'bool'),
+  'archer_dodging': ('b', 'bool'),
+  'archer_dodge_cooldown': ('b', 'bool'),
+  'archer_arrows': ('h', 'int16'),
+  'acted': ('b', 'bool'),
+  **{f'action_{key}': ('b', 'bool') for key in _ACTION_KEYS},
+}
+
+ENTITY_COLUMNS: Dict[str, Tuple[str, str]] = {
+  'frame': ('q', 'int64'),
+  'episode': ('i', 'int32'),
+  'id': ('q', 'int64'),
+  'type': ('h', 'int16'),
+  'x': ('f', 'float32'),
+  'y': ('f', 'float32'),
+  'vx': ('f', 'float32'),
+  'vy': ('f', 'float32'),
+  'w': ('f', 'float32'),
+  'h': ('f', 'float32'),
+  'is_enemy': ('b', 'bool'),
+  'player_index': ('b', 'int8'),
+}
+
+
+class _Table:
+  '''
+  Columns of the current shard, in typed arrays so memory stays bounded by the shard size.
+  '''
+  def __init__(self, columns: Mapping[str, Tuple[str, str]]):
+    self.columns = columns
+    self.data: Dict[str, array] = {}
+    self.clear()
+
+  def __len__(self) -> int:
+    return len(self.data['frame'])
+
+  def clear(self):
+    self.data = {name: array(typecode) for name, (typecode, _) in self.columns.items()}
+
+  def numpy(self) -> Dict[str, NDArray]:
+    return {name: np.frombuffer(self.data[name], dtype=self.data[name].typecode).astype(dtype)
+            for name, (_, dtype) in self.columns.items()}
+
+
+class _NpzWriter:
+  extension = '.npz'
+
+  def write(self, path: str, columns: Dict[str, NDArray]):
+    np.savez_compressed(path, **columns)
+
+
+class _ParquetWriter:
+  extension = '.parquet'
+
+  def __init__(self):
+    import pyarrow
+    import pyarrow.parquet
+    self._pyarrow = pyarrow
+    self._parquet = pyarrow.parquet
+
+  def write(self, path: str, columns: Dict[str, NDArray]):
+    self._parquet.write_table(self._pyarrow.table(columns), path)
+
+
+def _get_writer(format: Optional[str]):
+  if format == 'npz':
+    return _NpzWriter()
+  if format == 'parquet':
+    return _ParquetWriter()
+  if format is None:
+    try:
+      return _ParquetWriter()
+    except ImportError:
+      return _NpzWriter()
+  raise ValueError(f'Unknown format: {format}')
+
+
+class DatasetExporter:
+  '''
+  Streams recordings into columnar shards for offline training. Every shard holds two tables:
+
+  - frames: one row per update, with the state of the recording agent's archer, the actions it replied with and the episode.
+  - entities: one row per entity per update, keyed by frame and entity id. Entity types are stored as codes into the types
+    list of the manifest.
+
+  Shards are Parquet files if pyarrow is installed, or compressed npz files otherwise. Only the current shard is kept in
+  memory, so recordings of any size can be exported. A dataset.json manifest lists the shards and the entity types.
+
+  Binary recordings carry episode boundaries. Text recordings do not, so a new episode is assumed whenever the agent's archer
+  gets a new id, which happens on every reset.
+
+  params output_dir: Directory of the dataset. It is created if needed.
+  params format: 'parquet', 'npz', or None to pick Parquet when available.
+  params shard_frames: Number of frames per shard.
+  params codec: Json codec used to decode the updates. If None, the fastest installed codec is used.
+  '''
+  def __init__(self, output_dir: str, format: Optional[str] = None, shard_frames: int = 10000, codec: Optional[Codec] = None):
+    self.output_dir = output_dir
+    self.shard_frames = shard_frames
+    self.codec = codec if codec else get_codec()
+    self._writer = _get_writer(format)
+    self.format = self._writer.extension[1:]
+    os.makedirs(output_dir, exist_ok=True)
+    self._frames = _Table(FRAME_COLUMNS)
+    self._entities = _Table(ENTITY_COLUMNS)
+    self._shards: List[Dict[str, Any]] = []
+    self._types: Dict[str, int] = {}
+    self._sources: List[str] = []
+    self.n_frames = 0
+    self.n_episodes = 0
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+  def add_recording(self, path: str):
+    '''
+    Appends the updates of a recording, as written by Connection with record_path.
+    '''
+    player_index = 0
+    archer_id = None
+    episode_started = False
+    step = 0
+    last_update_id = None
+    for direction, msg, episode_start in _iter_messages(path, self.codec):
+      if direction == SENT:
+        if last_update_id is not None:
+          self._add_actions(msg, last_update_id)
+        continue
+      if msg['type'] == 'init':
+        player_index = msg.get('index', 0)
+        continue
+      if msg['type'] != 'update':
+        continue
+      archer = _find_archer(msg['entities'], player_index)
+      if episode_start is None:
+        # Text recordings: a reset respawns the archer with a new id.
+        episode_start = archer is not None and archer['id'] != archer_id
+      if archer is not None:
+        archer_id = archer['id']
+      if episode_start or not episode_started:
+        self.n_episodes += 1
+        episode_started = True
+        step = 0
+      if len(self._frames) >= self.shard_frames:
+        self._flush()
+      self._add_update(msg, archer, step)
+      last_update_id = msg['id']
+      step += 1
+    self._sources.append(os.path.abspath(path))
+
+  def close(self):
+    '''
+    Writes the last shard and the manifest.
+    '''
+    self._flush()
+    manifest = dict(
+      format=self.format,
+      n_frames=self.n_frames,
+      n_episodes=self.n_episodes,
+      types=sorted(self._types, key=self._types.__getitem__),
+      frame_columns=list(FRAME_COLUMNS),
+      entity_columns=list(ENTITY_COLUMNS),
+      shards=self._shards,
+      sources=self._sources)
+    with open(os.path.join(self.output_dir, MANIFEST_NAME), 'w') as file:
+      json.dump(manifest, file, indent=2)
+
+  def _add_update(self, msg: Mapping[str, Any], archer: Optional[Mapping[str, Any]], step: int):
+    frame = self.n_frames
+    episode = self.n_episodes - 1
+    entities = msg['entities']
+    columns = self._frames.data
+    columns['frame'].append(frame)
+    columns['episode'].append(episode)
+    columns['step'].append(step)
+    columns['update_id'].append(msg['id'])
+    columns['dt'].append(msg.get('dt', 0))
+    columns['n_entities'].append(len(entities))
+    columns['archer_present'].append(archer is not None)
+    if archer is not None:
+      columns['archer_x'].append(archer['pos']['x'])
+      columns['archer_y'].append(archer['pos']['y'])
+      columns['archer_vx'].append(archer['vel']['x'])
+      columns['archer_vy'].append(archer['vel']['y'])
+      columns['archer_facing'].append(archer.get('facing', 0))
+      columns['archer_on_ground'].append(bool(archer.get('onGround')))
+      columns['archer_on_wall'].append(bool(archer.get('onWall')))
+      columns['archer_dodging'].append(archer.get('state') == 'dodging')
+      columns['archer_dodge_cooldown'].append(bool(archer.get('dodgeCooldown')))
+      columns['archer_arrows'].append(len(archer.get('arrows', ())))
+    else:
+      for name in ['archer_x', 'archer_y', 'archer_vx', 'archer_vy']:
+        columns[name].append(np.nan)
+      for name in ['archer_facing', 'archer_on_ground', 'archer_on_wall', 'archer_dodging', 'archer_dodge_cooldown', 'archer_arrows']:
+        columns[name].append(0)
+    columns['acted'].append(False)
+    for key in _ACTION_KEYS:
+      columns[f'action_{key}'].append(False)
+
+    columns = self._entities.data
+    for e in entities:
+      type_code = self._types.get(e['type'])
+      if type_code is None:
+        type_code = self._types[e['type']] = len(self._types)
+      pos, vel, size = e['pos'], e['vel'], e['size']
+      columns['frame'].append(frame)
+      columns['episode'].append(episode)
+      columns['id'].append(e['id'])
+      columns['type'].append(type_code)
+      columns['x'].append(pos['x'])
+      columns['y'].append(pos['y'])
+      columns['vx'].append(vel['x'])
+      columns['vy'].append(vel['y'])
+      columns['w'].append(size['x'])
+      columns['h'].append(size['y'])
+      columns['is_enemy'].append(bool(e['isEnemy']))
+      columns['player_index'].append(e.get('playerIndex', -1))
+    self.n_frames += 1
+
+  def _add_actions(self, msg: Mapping[str, Any], update_id: int):
+    if msg.get('type') != 'actions' or msg.get('id') != update_id or not len(self._frames):
+      return
+    columns = self._frames.data
+    columns['acted'][-1] = True
+    actions = msg.get('actions', '')
+    for key in _ACTION_KEYS:
+      columns[f'action_{key}'][-1] = key in actions
+
+  def _flush(self):
+    if not len(self._frames):
+      return
+    index = len(self._shards)
+    shard = dict(n_frames=len(self._frames), n_entities=len(self._entities))
+    for table_name, table in [('frames', self._frames), ('entities', self._entities)]:
+      file_name = f'{table_name}_{index:05d}{self._writer.extension}'
+      self._writer.write(os.path.join(self.output_dir, file_name), table.numpy())
+      shard[table_name] = file_name
+      table.clear()
+    self._shards.append(shard)
+
+
+def _find_archer(entities: Sequence[Mapping[str, Any]], player_index: int) -> Optional[Mapping[str, Any]]:
+  for e in entities:
+    if e['type'] == 'archer' and e.get('playerIndex') == player_index:
+      return e
+  return None
+
+
+def _iter_messages(path: str, codec: Codec) -> Iterator[Tuple[int, Mapping[str, Any], Optional[bool]]]:
+  '''
+  Yields the direction, decoded message and whether the message starts an episode, which is None if the recording does not say.
+  '''
+  if path.endswith(BINARY_RECORD_EXTENSION):
+    with ReplayReader(path, codec=codec) as reader:
+      episode_starts = set(reader.episode_frames(i).start for i in range(reader.n_episodes))
+      for i, frame in enumerate(reader):
+        yield frame.direction, codec.loads(frame.payload), i in episode_starts
+    return
+
+  with open(path, 'rb') as file:
+    for line in file:
+      line = line.rstrip(b'\n')
+      if not line:
+        continue
+      # Text recordings do not store the direction. Messages from the game are told apart by type, wherever the field is.
+      msg = codec.loads(line)
+      yield RECEIVED if msg.get('type') in _GAME_MESSAGE_TYPES else SENT, msg, None
+
+
+def export_recordings(paths: Sequence[str], output_dir: str, format: Optional[str] = None, shard_frames: int = 10000) -> DatasetExporter:
+  '''
+  Exports recordings into a dataset. See DatasetExporter.
+  '''
+  with DatasetExporter(output_dir, format=format, shard_frames=shard_frames) as exporter:
+    for path in paths:
+      logging.info(f'Exporting {path}')
+      exporter.add_recording(path)
+  logging.info(f'Exported {exporter.n_frames} frames in {exporter.n_episodes} episodes to {output_dir}')
+  return exporter
+
+
+def main():
+  default_logging()
+  parser = argparse.ArgumentParser(description='Exports Towerfall recordings into a columnar dataset.')
+  parser.add_argument('output_dir')
+  parser.add_argument('recordings', nargs='+')
+  parser.add_argument('--format', choices=['parquet', 'npz'])
+  parser.add_argument('--shard-frames', type=int, default=10000)
+  args = parser.parse_args()
+  export_recordings(args.recordings, args.output_dir, format=args.format, shard_frames=args.shard_frames)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,45 @@
+import json
+import os
+from typing import Any, Dict, Iterator
+
+import numpy as np
+from numpy.typing import NDArray
+
+from .exporter import MANIFEST_NAME
+
+
+def load_manifest(dataset_dir: str) -> Dict[str, Any]:
+  with open(os.path.join(dataset_dir, MANIFEST_NAME), 'r') as file:
+    return json.load(file)
+
+
+def iter_shards(dataset_dir: str, table: str = 'frames') -> Iterator[Dict[str, NDArray]]:
+  '''
+  Yields the columns of every shard of a table, one shard at a time.
+
+  params table: 'frames' or 'entities'.
+  '''
+  manifest = load_manifest(dataset_dir)
+  for shard in manifest['shards']:
+    yield _read_shard(os.path.join(dataset_dir, shard[table]), manifest['format'])
+
+
+def load_table(dataset_dir: str, table: str = 'frames') -> Dict[str, NDArray]:
+  '''
+  Loads all the shards of a table into one array per column.
+
+  params table: 'frames' or 'entities'.
+  '''
+  shards = list(iter_shards(dataset_dir, table))
+  if not shards:
+    return {}
+  return {name: np.concatenate([shard[name] for shard in shards]) for name in shards[0]}
+
+
+def _read_shard(path: str, format: str) -> Dict[str, NDArray]:
+  if format == 'parquet':
+    import pyarrow.parquet
+    table = pyarrow.parquet.read_table(path)
+    return {name: table.column(name).to_numpy() for name in table.column_names}
+  with np.load(path) as npz:
+    return {name: npz[name] for name in npz.files}
@@ -1,17 +1,23 @@
 from .actions import Actions
 from .base_env import TowerfallEnv
 from .blank_env import TowerfallBlankEnv
+from .instrumentation import Instrumentation
 from .kill_enemy_objective import KillEnemyObjective
 from .objective import Objective
 from .observation import Observation
 from .player_observation import PlayerObservation
+from .subproc_vec_env import TowerfallSubprocVecEnv
+from .vec_env import TowerfallVecEnv
 
 __all__ = [
   'Actions',
+  'Instrumentation',
   'KillEnemyObjective',
   'Objective',
   'Observation',
   'PlayerObservation',
   'TowerfallBlankEnv',
   'TowerfallEnv',
+  'TowerfallSubprocVecEnv',
+  'TowerfallVecEnv',
 ]
\ No newline at end of file
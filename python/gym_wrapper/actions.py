@@ -1,5 +1,6 @@
-from typing import Any, Dict
+from typing import Any, Dict, List, Sequence
 
+import numpy as np
 from common.constants import DASH, DOWN, JUMP, LEFT, RIGHT, SHOOT, UP
 from gym import spaces
 from numpy.typing import NDArray
@@ -32,9 +33,18 @@ class Actions:
       actions.append(2)
     self.action_space = spaces.MultiDiscrete(actions)
 
+    # Every combination of actions gets a code in mixed radix, at most 3*3*2*2*2 = 72. The tables map codes to actions and to
+    # serialized strings in both directions.
+    nvec = np.array(actions, dtype=np.int64)
+    self._strides = np.concatenate([np.cumprod(nvec[::-1])[::-1][1:], [1]]).astype(np.int64)
+    self._combinations = np.stack(np.unravel_index(np.arange(int(np.prod(nvec))), tuple(nvec)), axis=1).astype(np.int64)
+    self._serialized: List[str] = [self.to_serialized_actions(combination) for combination in self._combinations]
+    self._codes: Dict[str, int] = {actions_str: code for code, actions_str in enumerate(self._serialized)}
+
   def to_serialized_actions(self, actions: NDArray) -> str:
     '''
     Converts a list of actions to a the serialized string of pressed buttons that the game expects.
+    For a single action, branching is faster than the lookup of to_serialized_actions_batch.
     '''
     actions_str = ''
     if actions[0] == 0:
@@ -52,4 +62,50 @@ class Actions:
       actions_str += DASH
     if self.can_shoot and actions[self.action_map[SHOOT]]:
       actions_str += SHOOT
-    return actions_str
\ No newline at end of file
+    return actions_str
+
+  def to_serialized_actions_batch(self, actions: NDArray) -> List[str]:
+    '''
+    Converts a batch of actions of shape (N, k) to N serialized strings, with a single lookup per row.
+    '''
+    serialized = self._serialized
+    return [serialized[code] for code in self.encode(actions).tolist()]
+
+  def encode(self, actions: NDArray) -> NDArray[np.int64]:
+    '''
+    Code of each row of a batch of actions of shape (N, k), in [0, action_space.nvec.prod()).
+    '''
+    return np.asarray(actions, dtype=np.int64) @ self._strides
+
+  def decode(self, codes: NDArray) -> NDArray[np.int64]:
+    '''
+    Actions of shape (N, k) for N codes given by encode.
+    '''
+    return self._combinations[codes]
+
+  def _code_of(self, actions_str: str) -> int:
+    code = self._codes.get(actions_str)
+    if code is not None:
+      return code
+    # Buttons in another order or disabled buttons. Opposite directions are resolved like to_serialized_actions does.
+    actions = [
+      0 if LEFT in actions_str else 2 if RIGHT in actions_str else 1,
+      0 if DOWN in actions_str else 2 if UP in actions_str else 1]
+    for key in self.action_map:
+      actions.append(int(key in actions_str))
+    code = int(np.dot(actions, self._strides))
+    self._codes[actions_str] = code
+    return code
+
+  def from_serialized_actions(self, actions_str: str) -> NDArray[np.int64]:
+    '''
+    Converts a serialized string of pressed buttons to actions. Buttons that are disabled are ignored.
+    '''
+    return self._combinations[self._code_of(actions_str)].copy()
+
+  def from_serialized_actions_batch(self, actions_strs: Sequence[str]) -> NDArray[np.int64]:
+    '''
+    Converts N serialized strings, for example the recorded actions of a dataset, to actions of shape (N, k).
+    '''
+    code_of = self._code_of
+    return self._combinations[np.array([code_of(actions_str) for actions_str in actions_strs], dtype=np.int64)]
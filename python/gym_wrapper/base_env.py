@@ -1,12 +1,17 @@
 from abc import ABC, abstractmethod
-from typing import Any, Dict, List, Optional, Tuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple, Union
 
 from common.entity import Entity, to_entities
+from common.entity_frame import EntityFrame
+from common.entity_index import EntityIndex
 from gym import Env
 from numpy.typing import NDArray
-from towerfall import Towerfall
+from towerfall import Connection, ReplayConnection, Towerfall
+from towerfall.codec import peek_update_id
 
 from .actions import Actions
+from .instrumentation import Instrumentation
 
 
 class TowerfallEnv(Env, ABC):
@@ -14,19 +19,51 @@ class TowerfallEnv(Env, ABC):
   Interacts with the Towerfall.exe process to create an interface with the agent that follows the gym API.
   Inherit from this class to choose the appropriate observations and reward functions.
 
-  params towerfall: The Towerfall instance to connect to.
+  params towerfall: The Towerfall instance to connect to. It can be None if a connection is given, in which case resets are not
+    sent to the game.
   params actions: The actions that the agent can take. If None, the default actions are used.
   params record_path: The path to record the game to. If None, no recording is done.
   params verbose: The verbosity level. 0: no logging, 1: much logging.
+  params instrumentation: If set, records the duration of each phase of step and reset. Phases are send, wait, decode and
+    entities, plus the ones marked by the subclass in _post_step and _post_reset. Reset also records reset and handshake.
+  params connection: Used instead of joining towerfall, for example a ReplayConnection to replay a recording offline.
+  params entity_frame: If True, entities is an EntityFrame holding the entities in numpy arrays, instead of a list of Entity.
+  params frame_skip: Number of game frames each step repeats the actions for. Only the update of the last frame is decoded and
+    observed; the ones before are acknowledged with the same actions as soon as their id is read. The objective sees the
+    changes of all the frames at once, and step_frames tells it how many frames the step covered.
+  params pipeline: If True, send_actions starts reading the next update on a background thread, which also decodes it and
+    builds the entities, so the wait and the parsing overlap with whatever the caller does before receive_step. With
+    instrumentation, the wait phase is then the time receive_step blocks on the read-ahead, and there is no decode phase.
   '''
   def __init__(self,
-      towerfall: Towerfall,
+      towerfall: Optional[Towerfall],
       actions: Optional[Actions] = None,
       record_path: Optional[str] = None,
-      verbose: int = 0):
+      verbose: int = 0,
+      instrumentation: Optional[Instrumentation] = None,
+      connection: Optional[Union[Connection, ReplayConnection]] = None,
+      entity_frame: bool = False,
+      frame_skip: int = 1,
+      pipeline: bool = False):
+    assert frame_skip >= 1, f'frame_skip must be at least 1, got {frame_skip}'
     self.towerfall = towerfall
     self.verbose = verbose
-    self.connection = self.towerfall.join(timeout=5)
+    self.instrumentation = instrumentation
+    self.entity_frame = entity_frame
+    self.frame_skip = frame_skip
+    # Game frames covered by the last step, and by the episode so far.
+    self.step_frames = 0
+    self.frame = 0
+    self.pipeline = pipeline
+    self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='towerfall-read-ahead') if pipeline else None
+    # The update being read by the background thread, between send_actions and receive_step.
+    self.read_ahead: Optional[Future] = None
+    self.entity_index: EntityIndex[Entity] = EntityIndex()
+    if connection:
+      self.connection = connection
+    else:
+      assert towerfall, 'Either towerfall or connection is required.'
+      self.connection = towerfall.join(timeout=5)
     self.connection.record_path = record_path
     if actions:
       self.actions = actions
@@ -35,12 +72,22 @@ class TowerfallEnv(Env, ABC):
     self.action_space = self.actions.action_space
     self._draw_elems = []
     self.is_init_sent = False
+    # Resets are only split into a request and its confirmation when _send_reset is not overwritten.
+    self._split_reset = type(self)._send_reset is TowerfallEnv._send_reset
 
   def _send_reset(self):
     '''
-    Sends the reset instruction to the game. Overwrite this to change the starting conditions.
+    Sends the reset instruction to the game. Overwrite this to change the starting conditions. The resets of an environment
+    that overwrites it are not overlapped with the ones of other environments.
+    '''
+    self.towerfall.send_reset(self._get_reset_entities())
+
+  def _get_reset_entities(self) -> Optional[List[Dict[str, Any]]]:
+    '''
+    Entities to reset the game with. Overwrite this to change the starting conditions while keeping resets overlapped. None
+    keeps the ones of the last reset.
     '''
-    self.towerfall.send_reset()
+    return None
 
   @abstractmethod
   def _post_reset(self) -> Tuple[NDArray, dict]:
@@ -72,8 +119,34 @@ class TowerfallEnv(Env, ABC):
     '''
     Gym reset. This is called by the agent to reset the environment.
     '''
+    self.request_reset()
+    self.confirm_reset()
+    return self.receive_reset()
 
-    self._send_reset()
+  def request_reset(self):
+    '''
+    First part of reset. Sends the reset to the game without waiting for the result, so the resets of several environments can
+    be in flight at once. If _send_reset is overwritten, it is called instead and the reset is done when this returns.
+    '''
+    if self.instrumentation:
+      self.instrumentation.begin('reset')
+    if not self.towerfall:
+      return
+    if self._split_reset:
+      self.towerfall.request_reset(self._get_reset_entities())
+    else:
+      self._send_reset()
+
+  def confirm_reset(self):
+    '''
+    Second part of reset. Waits for the result of the reset, then does the handshake of the first episode or replies to the
+    last update of the previous one, after which the game sends the first update of the episode.
+    '''
+    instrumentation = self.instrumentation
+    if self.towerfall and self._split_reset:
+      self.towerfall.wait_reset()
+    if instrumentation:
+      instrumentation.mark('reset')
     if not self.is_init_sent:
       state_init = self.connection.read_json()
       assert state_init['type'] == 'init', state_init['type']
@@ -85,21 +158,55 @@ class TowerfallEnv(Env, ABC):
       self.connection.send_json(dict(type='result', success=True))
       self.is_init_sent = True
     else:
-      self.connection.send_json(dict(type='actions', actions="", id=self.state_update['id']))
+      self._send_reset_ack()
+    if instrumentation:
+      instrumentation.mark('handshake')
 
+  def receive_reset(self) -> Tuple[NDArray, dict]:
+    '''
+    Last part of reset. Waits for the first update of the episode and returns its observation.
+    '''
     self.frame = 0
-    self.state_update = self.connection.read_json()
-    assert self.state_update['type'] == 'update', self.state_update['type']
-    self.entities = to_entities(self.state_update['entities'])
-    self.me = self._get_own_archer(self.entities)
+    self.step_frames = 0
+    self.entity_index.clear()
+    self.connection.mark_episode()
+    self._receive_update()
+    obs = self._post_reset()
+    if self.instrumentation:
+      self.instrumentation.end()
+    return obs
 
-    return self._post_reset()
+  def _send_reset_ack(self):
+    '''
+    Replies to the last update of the episode, which is still waiting for actions.
+    '''
+    self.connection.send_json(dict(type='actions', actions="", id=self.state_update['id']))
 
   def step(self, actions: NDArray) -> Tuple[NDArray, float, bool, object]:
     '''
     Gym step. This is called by the agent to take an action in the environment.
     '''
-    actions_str = self.actions.to_serialized_actions(actions)
+    self.send_actions(actions)
+    return self.receive_step()
+
+  def send_actions(self, actions: NDArray, actions_str: Optional[str] = None):
+    '''
+    First half of a step. Sends the actions to the game without waiting for the next update.
+
+    params actions_str: The actions already serialized, for example by Actions.to_serialized_actions_batch.
+    '''
+    if self.instrumentation:
+      self.instrumentation.begin('step')
+      self._send_actions(actions, actions_str)
+      self.instrumentation.mark('send')
+    else:
+      self._send_actions(actions, actions_str)
+    if self._executor:
+      self.read_ahead = self._executor.submit(self._read_ahead)
+
+  def _send_actions(self, actions: NDArray, actions_str: Optional[str] = None):
+    if actions_str is None:
+      actions_str = self.actions.to_serialized_actions(actions)
 
     resp: Dict[str, Any] = dict(
       type='actions',
@@ -110,25 +217,105 @@ class TowerfallEnv(Env, ABC):
       resp['draws'] = self._draw_elems
     self.connection.send_json(resp)
     self._draw_elems.clear()
-    self.state_update = self.connection.read_json()
     self.actions_str = actions_str
-    assert self.state_update['type'] == 'update'
-    self.entities = to_entities(self.state_update['entities'])
-    self.me = self._get_own_archer(self.entities)
-    return self._post_step()
 
-  def _get_own_archer(self, entities: List[Entity]) -> Optional[Entity]:
+  def receive_step(self) -> Tuple[NDArray, float, bool, object]:
     '''
-    Iterates over all entities to find the archer that matches the index specified in init.
+    Second half of a step. Waits for the update that follows the actions sent in send_actions, after repeating the actions for
+    frame_skip frames.
     '''
-    for e in entities:
-      if e.type == 'archer':
-        if e['playerIndex'] == self.index:
-          return e
-    return None
+    if self.read_ahead:
+      read_ahead, self.read_ahead = self.read_ahead, None
+      step_frames, state_update, entities = read_ahead.result()
+      if self.instrumentation:
+        self.instrumentation.mark('wait')
+      self.step_frames = step_frames
+      self.state_update = state_update
+      self._set_entities(entities)
+    else:
+      self.step_frames, payload = self._skip_frames()
+      self._receive_update(payload)
+    self.frame += self.step_frames
+    result = self._post_step()
+    if self.instrumentation:
+      self.instrumentation.end()
+    return result
+
+  def _skip_frames(self) -> Tuple[int, Optional[bytes]]:
+    '''
+    Acknowledges the updates of the frames that frame_skip repeats the actions for, without decoding them.
+
+    returns: The number of frames the step covers, and the payload of the last update if it was read.
+    '''
+    step_frames = 1
+    while step_frames < self.frame_skip:
+      payload = self.connection.read_bytes()
+      update_id = peek_update_id(payload, self.connection.codec)
+      if update_id is None:
+        # Not an update, left to the caller to report.
+        return step_frames, payload
+      self.connection.send_json(dict(type='actions', actions=self.actions_str, id=update_id))
+      step_frames += 1
+    return step_frames, None
+
+  def _read_ahead(self) -> Tuple[int, Mapping[str, Any], Sequence[Entity]]:
+    '''
+    Runs on the background thread in pipeline mode. Does everything of a step up to the entities that doesn't touch the state
+    of the environment.
+    '''
+    step_frames, payload = self._skip_frames()
+    if payload is None:
+      payload = self.connection.read_bytes()
+    state_update = self.connection.codec.loads(payload)
+    assert state_update['type'] == 'update', state_update['type']
+    return step_frames, state_update, self._to_entities(state_update)
+
+  def _to_entities(self, state_update: Mapping[str, Any]) -> Sequence[Entity]:
+    if self.entity_frame:
+      return EntityFrame(state_update['entities'])
+    return to_entities(state_update['entities'])
+
+  def _set_entities(self, entities: Sequence[Entity]):
+    self.entities = entities
+    self.entity_index.update(entities)
+    self.me = self._get_own_archer()
+    if self.instrumentation:
+      self.instrumentation.mark('entities')
+
+  def _receive_update(self, payload: Optional[bytes] = None):
+    '''
+    Reads and decodes the next update, unless its payload was already read.
+    '''
+    instrumentation = self.instrumentation
+    if instrumentation:
+      if payload is None:
+        payload = self.connection.read_bytes()
+      instrumentation.mark('wait')
+      self.state_update = self.connection.codec.loads(payload)
+      instrumentation.mark('decode')
+    elif payload is None:
+      self.state_update = self.connection.read_json()
+    else:
+      self.state_update = self.connection.codec.loads(payload)
+    assert self.state_update['type'] == 'update', self.state_update['type']
+    self._set_entities(self._to_entities(self.state_update))
+
+  def _get_own_archer(self) -> Optional[Entity]:
+    '''
+    Finds the archer that matches the index specified in init in the entities of entity_index.
+    '''
+    return self.entity_index.archer(self.index)
 
   def render(self, mode='human'):
     '''
     This is a no-op since the game is rendered independenly by MonoGame/XNA.
     '''
-    pass
\ No newline at end of file
+    pass
+
+  def close(self):
+    '''
+    Stops the read-ahead thread of pipeline mode. The connection and the game are left to their owners.
+    '''
+    if self._executor:
+      self._executor.shutdown(wait=False, cancel_futures=True)
+      self._executor = None
\ No newline at end of file
@@ -1,50 +1,117 @@
 import logging
-from typing import List, Optional, Tuple
+from typing import Any, Dict, List, Optional, Tuple, Union
 
+import numpy as np
 from gym import spaces
-from towerfall import Towerfall
+from numpy.typing import NDArray
+from towerfall import Connection, ReplayConnection, Towerfall
 
 from .actions import Actions
 from .base_env import TowerfallEnv
+from .instrumentation import Instrumentation
 from .objective import Objective
+from .obs_buffers import create_obs_buffers, flat_obs_views, flatten_space
 from .observation import Observation
 
 
 class TowerfallBlankEnv(TowerfallEnv):
   '''
   A modular implementation of TowerfallEnv that can be customized with the addition of observations and an objective.
+
+  params preallocate: If True, observations are written in place into arrays allocated once from the observation space, and
+    reset and step return the same dict every time. Copy it to keep an observation across steps.
+  params flatten: If True, observations are a single float32 array with the keys one after the other, and the observation
+    space is the matching Box. Implies preallocate.
   '''
   def __init__(self,
-      towerfall: Towerfall,
+      towerfall: Optional[Towerfall],
       observations: List[Observation],
       objective: Objective,
       actions: Optional[Actions]=None,
       record_path: Optional[str]=None,
-      verbose: int = 0):
-    super().__init__(towerfall, actions, record_path, verbose)
+      verbose: int = 0,
+      instrumentation: Optional[Instrumentation] = None,
+      connection: Optional[Union[Connection, ReplayConnection]] = None,
+      entity_frame: bool = False,
+      preallocate: bool = False,
+      flatten: bool = False,
+      frame_skip: int = 1,
+      pipeline: bool = False):
+    super().__init__(towerfall, actions, record_path, verbose, instrumentation, connection, entity_frame, frame_skip, pipeline)
     obs_space = {}
+    self.observations = list(observations)
     self.components = list(observations)
     self.components.append(objective)
     self.objective = objective
     self.objective.env = self
     for obs in self.components:
       obs.extend_obs_space(obs_space)
-    self.observation_space = spaces.Dict(obs_space)
+    self.dict_observation_space = spaces.Dict(obs_space)
+    self.observation_space = self.dict_observation_space
+    self.preallocate = preallocate or flatten
+    self.flatten = flatten
+    self._flat_obs: Optional[NDArray] = None
+    self._obs_buffers: Optional[Dict[str, NDArray]] = None
+    if flatten:
+      self.observation_space = flatten_space(self.dict_observation_space)
+      self.set_obs_buffers(np.zeros(self.observation_space.shape, dtype=np.float32))
+    elif preallocate:
+      self.set_obs_buffers(create_obs_buffers(self.dict_observation_space))
     logging.info('Action space: %s', str(self.action_space))
     logging.info('Observation space: %s', str(self.observation_space))
 
-  def _send_reset(self):
-    reset_entities = self.objective.get_reset_entities()
-    self.towerfall.send_reset(reset_entities)
+  def _get_reset_entities(self) -> Optional[List[Dict[str, Any]]]:
+    return self.objective.get_reset_entities()
 
-  def _post_reset(self) -> dict:
-    obs_dict = {}
-    for obs in self.components:
+  def set_obs_buffers(self, buffers: Union[NDArray, Dict[str, NDArray]]):
+    '''
+    Sets the arrays that observations are written into. Vectorized environments pass views into their batch, so observations
+    are stacked without copying.
+
+    params buffers: An array per key of the Dict observation space, or a single flat array if flatten is set.
+    '''
+    assert self.preallocate, 'Observation buffers need preallocate or flatten.'
+    if self.flatten:
+      assert isinstance(buffers, np.ndarray)
+      self._flat_obs = buffers
+      self._obs_buffers = flat_obs_views(self.dict_observation_space, buffers)
+    else:
+      assert isinstance(buffers, dict)
+      self._obs_buffers = buffers
+    self._obs_buffer_items = list(self._obs_buffers.items())
+
+  def _new_obs_dict(self) -> Dict[str, Any]:
+    return self._obs_buffers if self._obs_buffers is not None else {}
+
+  def _obs_result(self, obs_dict: Dict[str, Any]) -> Any:
+    if self._obs_buffers is None:
+      return obs_dict
+    # Observations that don't write in place replace the buffer, so their value is copied back into it.
+    for key, buffer in self._obs_buffer_items:
+      value = obs_dict[key]
+      if value is not buffer:
+        buffer[...] = value
+        obs_dict[key] = buffer
+    return self._flat_obs if self.flatten else obs_dict
+
+  def _post_reset(self) -> Any:
+    obs_dict = self._new_obs_dict()
+    for obs in self.observations:
       obs.post_reset(self.state_scenario, self.me, self.entities, obs_dict)
-    return obs_dict
+    if self.instrumentation:
+      self.instrumentation.mark('observations')
+    self.objective.post_reset(self.state_scenario, self.me, self.entities, obs_dict)
+    if self.instrumentation:
+      self.instrumentation.mark('objective')
+    return self._obs_result(obs_dict)
 
   def _post_step(self) -> Tuple[object, float, bool, object]:
-    obs_dict = {}
-    for obs in self.components:
+    obs_dict = self._new_obs_dict()
+    for obs in self.observations:
       obs.post_step(self.me, self.entities, self.actions_str, obs_dict)
-    return obs_dict, self.objective.reward, self.objective.done, {}
+    if self.instrumentation:
+      self.instrumentation.mark('observations')
+    self.objective.post_step(self.me, self.entities, self.actions_str, obs_dict)
+    if self.instrumentation:
+      self.instrumentation.mark('objective')
+    return self._obs_result(obs_dict), self.objective.reward, self.objective.done, {}
@@ -0,0 +1,144 @@
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+from numpy.typing import NDArray
+
+# Upper bounds of the histogram buckets, in seconds.
+_DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25)
+
+
+class PhaseStats:
+  '''
+  Timings of one phase. The last samples are kept in a ring buffer, while count, sum and bucket counts cover the whole run.
+  '''
+  def __init__(self, capacity: int, buckets: Sequence[float]):
+    self.ring = np.zeros((capacity,), dtype=np.float64)
+    self.index = 0
+    self.count = 0
+    self.sum = 0.0
+    self.buckets = buckets
+    # One more bucket for +Inf.
+    self.bucket_counts = [0] * (len(buckets) + 1)
+
+  def add(self, duration: float):
+    self.ring[self.index] = duration
+    self.index += 1
+    if self.index == len(self.ring):
+      self.index = 0
+    self.count += 1
+    self.sum += duration
+    self.bucket_counts[bisect_left(self.buckets, duration)] += 1
+
+  def samples(self) -> NDArray[np.float64]:
+    '''
+    The samples in the ring buffer, oldest first.
+    '''
+    if self.count < len(self.ring):
+      return self.ring[:self.count].copy()
+    return np.concatenate((self.ring[self.index:], self.ring[:self.index]))
+
+
+class Instrumentation:
+  '''
+  Records how long each phase of a step or reset takes, to tell apart network wait, decoding, entity parsing, observations
+  and the objective. Pass it to TowerfallEnv to enable it. Environments without one skip the instrumented code path entirely.
+
+  A frame starts with begin, each phase ends with mark, and the frame ends with end, which also records the total.
+
+  params capacity: Number of samples kept per phase for the rolling percentiles and histograms.
+  params buckets: Upper bounds of the histogram buckets in seconds.
+  params on_frame: Called at the end of every frame with the kind of frame and the duration of each phase in seconds.
+  '''
+  def __init__(self,
+      capacity: int = 1024,
+      buckets: Sequence[float] = _DEFAULT_BUCKETS,
+      on_frame: Optional[Callable[[str, Mapping[str, float]], None]] = None):
+    self.capacity = capacity
+    self.buckets = tuple(sorted(buckets))
+    self.on_frame = on_frame
+    self.stats: Dict[Tuple[str, str], PhaseStats] = {}
+    self._kind = ''
+    self._start = 0.0
+    self._last = 0.0
+    self._frame: Dict[str, float] = {}
+
+  def begin(self, kind: str):
+    '''
+    Starts a frame. kind is 'step' or 'reset'.
+    '''
+    self._kind = kind
+    self._frame = {}
+    self._start = self._last = time.perf_counter()
+
+  def mark(self, phase: str):
+    '''
+    Records the time since the previous mark, or since begin, as the duration of phase.
+    '''
+    now = time.perf_counter()
+    duration = now - self._last
+    self._last = now
+    self._frame[phase] = duration
+    self._stats(phase).add(duration)
+
+  def end(self):
+    '''
+    Ends the frame and records its total duration.
+    '''
+    total = time.perf_counter() - self._start
+    self._frame['total'] = total
+    self._stats('total').add(total)
+    if self.on_frame:
+      self.on_frame(self._kind, self._frame)
+
+  def percentiles(self, kind: str, phase: str, qs: Sequence[float] = (50, 99)) -> List[float]:
+    '''
+    Percentiles of the samples in the ring buffer, in seconds.
+    '''
+    samples = self.stats[(kind, phase)].samples()
+    return [float(v) for v in np.percentile(samples, qs)]
+
+  def histogram(self, kind: str, phase: str) -> List[Tuple[float, int]]:
+    '''
+    Rolling histogram over the samples in the ring buffer, as (upper bound, count) pairs. The last bound is infinity.
+    '''
+    samples = self.stats[(kind, phase)].samples()
+    bounds = list(self.buckets) + [float('inf')]
+    counts = np.bincount(np.searchsorted(self.buckets, samples, side='left'), minlength=len(bounds))
+    return list(zip(bounds, (int(c) for c in counts)))
+
+  def summary(self) -> Dict[str, Dict[str, float]]:
+    '''
+    Count, mean, p50 and p99 in milliseconds of every phase, keyed by kind/phase.
+    '''
+    result = {}
+    for (kind, phase), stats in self.stats.items():
+      p50, p99 = self.percentiles(kind, phase)
+      result[f'{kind}/{phase}'] = dict(count=stats.count, mean=stats.sum / stats.count * 1000, p50=p50 * 1000, p99=p99 * 1000)
+    return result
+
+  def prometheus_text(self, name: str = 'towerfall_env_phase_seconds') -> str:
+    '''
+    Dumps the cumulative histograms in the Prometheus text exposition format, labeled by kind and phase.
+    '''
+    lines = [f'# HELP {name} Duration of the phases of a Towerfall environment step or reset.', f'# TYPE {name} histogram']
+    for (kind, phase), stats in self.stats.items():
+      labels = f'kind="{kind}",phase="{phase}"'
+      cumulative = 0
+      for bound, count in zip(list(self.buckets) + ['+Inf'], stats.bucket_counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+      lines.append(f'{name}_sum{{{labels}}} {stats.sum}')
+      lines.append(f'{name}_count{{{labels}}} {stats.count}')
+    return '\n'.join(lines) + '\n'
+
+  def reset_stats(self):
+    self.stats.clear()
+
+  def _stats(self, phase: str) -> PhaseStats:
+    key = (self._kind, phase)
+    stats = self.stats.get(key)
+    if stats is None:
+      stats = self.stats[key] = PhaseStats(self.capacity, self.buckets)
+    return stats
@@ -1,17 +1,27 @@
 import random
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 
 import numpy as np
 from common.constants import HH, HW
 from common.entity import Entity, Vec2
+from common.entity_frame import EntityView
 from gym import Space, spaces
+from numpy.typing import NDArray
 
 from .objective import Objective
 
+_SCALE = np.array([HW, HH], dtype=np.float64)
+# Up to this many targets, a Python loop is faster than the fixed overhead of the numpy calls. Above it, numpy is only faster
+# when the positions are already in arrays, as with EntityFrame.
+_LOOP_MAX_TARGETS = 64
+
 
 class KillEnemyObjective(Objective):
   '''
   Specifies observation and rewards associated with killing slimes.
+
+  params reset_batch_size: Number of randomized reset entity lists generated at once, then handed out one per reset. The rest of
+    a batch is dropped when enemy_type, enemy_count, min_distance or max_distance change.
   '''
   def __init__(self,
       enemy_type:str = 'slime',
@@ -19,7 +29,8 @@ class KillEnemyObjective(Objective):
       min_distance: float = 50,
       max_distance: float = 100,
       bounty = 5,
-      episode_max_len: int=60*2):
+      episode_max_len: int=60*2,
+      reset_batch_size: int = 64):
     super().__init__()
     self.enemy_type = enemy_type
     self.enemy_count = enemy_count
@@ -29,6 +40,10 @@ class KillEnemyObjective(Objective):
     self.bounty = bounty
     self.episode_max_len = episode_max_len
     self.episode_len = 0
+    self.reset_batch_size = reset_batch_size
+    self._reset_batch: List[List[Dict[str, Any]]] = []
+    # The parameters the reset batch was generated with.
+    self._reset_batch_params: Optional[Tuple[str, int, float, float]] = None
     self.obs_space = spaces.Box(low=-1, high = 1, shape=(3*self.enemy_count,), dtype=np.float32)
 
   def extend_obs_space(self, obs_space_dict: Dict[str, Space]):
@@ -37,21 +52,33 @@ class KillEnemyObjective(Objective):
     obs_space_dict['targets'] = self.obs_space
 
   def get_reset_entities(self) -> Optional[List[Dict[str, Any]]]:
+    params = (self.enemy_type, self.enemy_count, self.min_distance, self.max_distance)
+    if not self._reset_batch or params != self._reset_batch_params:
+      self._reset_batch = self._generate_reset_entities(self.reset_batch_size)
+      self._reset_batch_params = params
+    return self._reset_batch.pop()
+
+  def _generate_reset_entities(self, n: int) -> List[List[Dict[str, Any]]]:
+    '''
+    Generates the entities of n resets, with the enemies at a random distance on either side of the archer.
+    '''
     p = Vec2(160, 110)
-    entities: List[Dict[str, Any]] = [dict(type='archer', pos=p.dict())]
-    for i in range(self.enemy_count):
-      sign = random.randint(0, 1)*2 - 1
-      d = random.uniform(self.min_distance, self.max_distance) * sign
-      enemy = dict(
-        type=self.enemy_type,
-        pos=(p + Vec2(d, -5)).dict(),
-        facing=-sign)
-      entities.append(enemy)
-    return entities
+    # Seeded from random, so random.seed still makes the resets reproducible.
+    rng = np.random.default_rng(random.getrandbits(64))
+    signs = rng.integers(0, 2, size=(n, self.enemy_count)) * 2 - 1
+    xs = (p.x + rng.uniform(self.min_distance, self.max_distance, size=(n, self.enemy_count)) * signs).tolist()
+    y = p.y - 5
+    batch = []
+    for reset_signs, reset_xs in zip(signs.tolist(), xs):
+      entities: List[Dict[str, Any]] = [dict(type='archer', pos=p.dict())]
+      for sign, x in zip(reset_signs, reset_xs):
+        entities.append(dict(type=self.enemy_type, pos=dict(x=x, y=y), facing=-sign))
+      batch.append(entities)
+    return batch
 
   def post_reset(self, state_scenario: Dict[str, Any], player: Optional[Entity], entities: List[Entity], obs_dict: Dict[str, Any]):
     assert player
-    targets = list(e for e in entities if e['type'] == self.enemy_type)
+    targets = list(self.env.entity_index.of_type(self.enemy_type))
     assert len(targets) > 0, 'No targets found'
     self.target_ids = [t['id'] for t in targets]
     self.n_targets_prev = len(self.target_ids)
@@ -62,9 +89,11 @@ class KillEnemyObjective(Objective):
 
 
   def post_step(self, player: Optional[Entity], entities: List[Entity], actions: str, obs_dict: Dict[str, Any]):
-    targets = list(e for e in entities if e['id'] in self.target_ids)
+    by_id = self.env.entity_index.by_id
+    targets = [by_id[id] for id in self.target_ids if id in by_id]
     self._update_reward(player, targets)
-    self.episode_len += 1
+    # Counted in game frames, so the episode lasts as long with frame skip.
+    self.episode_len += self.env.step_frames
     self._update_obs(player, targets, obs_dict)
 
   def _update_reward(self, player: Optional[Entity], targets: List[Entity]):
@@ -87,18 +116,101 @@ class KillEnemyObjective(Objective):
     return x+b-a if x < a else x-b+a if x > b else x
 
   def _update_obs(self, player: Optional[Entity], targets: List[Entity], obs_dict: Dict[str, Any]):
-    obs_target = np.zeros((3*self.enemy_count,), dtype=np.float32)
+    # Writes into the preallocated buffer if there is one.
+    out = obs_dict.get('targets')
+    if not isinstance(out, np.ndarray):
+      out = None
+    if player and len(targets) > _LOOP_MAX_TARGETS and isinstance(targets[0], EntityView):
+      target_pos = targets[0].frame.pos[[t.index for t in targets]]
+      obs_target = target_observations(
+        np.array([[player.p.x, player.p.y]]), target_pos[None], np.ones((1, len(targets)), dtype=np.bool_), self.enemy_count,
+        out=None if out is None else out.reshape((1, -1)))[0]
+    else:
+      obs_target = self._loop_target_observations(player, targets, out)
+    obs_dict['targets'] = obs_target if out is None else out
+
+  def _loop_target_observations(self, player: Optional[Entity], targets: List[Entity], out: Optional[NDArray] = None) -> NDArray[np.float32]:
+    '''
+    Same as target_observations for a single player, faster than numpy for a handful of targets.
+    '''
+    if out is None:
+      obs_target = np.zeros((3*self.enemy_count,), dtype=np.float32)
+    else:
+      obs_target = out
+      obs_target.fill(0)
     if not player:
-      obs_dict['targets'] = obs_target
-      return
+      return obs_target
+    px, py = player.p.x, player.p.y
+    deltas = [(t.p.x - px, t.p.y - py) for t in targets]
+    deltas.sort(key=lambda d: d[0]*d[0] + d[1]*d[1])
+    for i, (dx, dy) in enumerate(deltas[:self.enemy_count]):
+      obs_target[i*3] = 1
+      obs_target[i*3 + 1] = self.limit(dx / HW, -1, 1)
+      obs_target[i*3 + 2] = self.limit(dy / HH, -1, 1)
+    return obs_target
 
-    target_by_dist = []
-    for i, target in enumerate(targets):
-      target_by_dist.append(((target.p - player.p).length(), target))
 
-    target_by_dist.sort(key=lambda x: x[0])
-    for i, (_, target) in enumerate(target_by_dist):
-      obs_target[i*3] = 1
-      obs_target[i*3 + 1] = self.limit(target.p.x - player.p.x / HW, -1, 1)
-      obs_target[i*3 + 2] = self.limit(target.p.y - player.p.y / HH, -1, 1)
-    obs_dict['targets'] = obs_target
+def target_observations(
+    player_pos: NDArray,
+    target_pos: NDArray,
+    target_mask: NDArray,
+    k: int,
+    out: Optional[NDArray] = None) -> NDArray[np.float32]:
+  '''
+  Observations of the k closest targets for a batch of players. Each target is (1, dx, dy), with the deltas normalized by half
+  the screen size and wrapped into [-1, 1] like the screen wraps. Slots without a target are zero.
+
+  params player_pos: Player positions, shape (B, 2).
+  params target_pos: Target positions, shape (B, M, 2). Rows can be padded.
+  params target_mask: Which targets exist, shape (B, M).
+  params k: Number of targets in the observation.
+  params out: Contiguous array of shape (B, 3*k) to write into. Allocated if None.
+  returns: Shape (B, 3*k), closest target first.
+  '''
+  n_batch, n_targets = target_mask.shape
+  if out is None:
+    out = np.zeros((n_batch, 3 * k), dtype=np.float32)
+  else:
+    out.fill(0)
+  if n_targets == 0:
+    return out
+  delta = target_pos - player_pos[:, None, :]
+  dist = (delta * delta).sum(axis=2)
+  dist[~target_mask] = np.inf
+  rows = np.arange(n_batch)[:, None]
+  if n_targets > k:
+    # Partial selection of the k closest, then only those are sorted.
+    closest = np.argpartition(dist, k - 1, axis=1)[:, :k]
+    closest = closest[rows, np.argsort(dist[rows, closest], axis=1, kind='stable')]
+  else:
+    closest = np.argsort(dist, axis=1, kind='stable')
+  rel = delta[rows, closest] / _SCALE
+  rel += 2 * (rel < -1)
+  rel -= 2 * (rel > 1)
+  present = target_mask[rows, closest]
+  view = out.reshape((n_batch, k, 3))[:, :closest.shape[1]]
+  view[..., 0] = present
+  view[..., 1:] = rel * present[..., None]
+  return out
+
+
+def batch_target_observations(
+    players: Sequence[Optional[Entity]],
+    targets: Sequence[Sequence[Entity]],
+    k: int,
+    out: Optional[NDArray] = None) -> NDArray[np.float32]:
+  '''
+  target_observations for the players and targets of several environments. Players that are None get all zeros.
+  '''
+  n_batch = len(players)
+  n_targets = max((len(t) for t, player in zip(targets, players) if player), default=0)
+  player_pos = np.zeros((n_batch, 2), dtype=np.float64)
+  target_pos = np.zeros((n_batch, n_targets, 2), dtype=np.float64)
+  target_mask = np.zeros((n_batch, n_targets), dtype=np.bool_)
+  for i, (player, env_targets) in enumerate(zip(players, targets)):
+    if not player or not env_targets:
+      continue
+    player_pos[i] = player.p.x, player.p.y
+    target_pos[i, :len(env_targets)] = [(t.p.x, t.p.y) for t in env_targets]
+    target_mask[i, :len(env_targets)] = True
+  return target_observations(player_pos, target_pos, target_mask, k, out)
@@ -0,0 +1,57 @@
+from typing import Dict
+
+import numpy as np
+from gym import Space, spaces
+from numpy.typing import NDArray
+
+
+def _shape(space: Space):
+  if isinstance(space, spaces.Discrete):
+    return ()
+  assert space.shape is not None, f'Unsupported observation space: {space}'
+  return tuple(space.shape)
+
+
+def create_obs_buffers(space: spaces.Dict) -> Dict[str, NDArray]:
+  '''
+  Allocates one array per key of a Dict observation space. Discrete spaces get a 0-d int64 array.
+  '''
+  return {
+    key: np.zeros((), dtype=np.int64) if isinstance(subspace, spaces.Discrete) else np.zeros(_shape(subspace), dtype=subspace.dtype)
+    for key, subspace in space.spaces.items()}
+
+
+def flatten_space(space: spaces.Dict) -> spaces.Box:
+  '''
+  A float32 Box holding all the keys of a Dict space one after the other, in the order of the Dict.
+  '''
+  lows = []
+  highs = []
+  for subspace in space.spaces.values():
+    if isinstance(subspace, spaces.Discrete):
+      lows.append([subspace.start])
+      highs.append([subspace.start + subspace.n - 1])
+    elif isinstance(subspace, spaces.Box):
+      lows.append(subspace.low.flatten())
+      highs.append(subspace.high.flatten())
+    else:
+      raise TypeError(f'Unsupported observation space type {type(subspace).__name__}: {subspace}')
+  return spaces.Box(
+    low=np.concatenate(lows).astype(np.float32),
+    high=np.concatenate(highs).astype(np.float32),
+    dtype=np.float32)
+
+
+def flat_obs_views(space: spaces.Dict, flat: NDArray) -> Dict[str, NDArray]:
+  '''
+  Views into a flat observation laid out by flatten_space, one per key of the Dict space. Writing to a view writes to flat.
+  '''
+  views = {}
+  offset = 0
+  for key, subspace in space.spaces.items():
+    shape = _shape(subspace)
+    size = int(np.prod(shape))
+    views[key] = flat[offset:offset + size].reshape(shape)
+    offset += size
+  assert offset == flat.shape[-1], f'Flat observation has size {flat.shape[-1]}, expected {offset}'
+  return views
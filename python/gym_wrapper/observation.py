@@ -1,6 +1,7 @@
 from abc import ABC, abstractmethod
 from typing import Any, Dict, List, Mapping, Optional
 
+import numpy as np
 from common.entity import Entity
 from gym import Space
 
@@ -23,3 +24,14 @@ class Observation(ABC):
   def post_step(self, player: Optional[Entity], entities: List[Entity], actions: str, obs_dict: Mapping[str, Any]):
     '''Hook for a gym step call. Adds observations to obs_dict.'''
     raise NotImplementedError
+
+
+def set_obs(obs_dict: Dict[str, Any], key: str, value: Any):
+  '''
+  Sets an observation. If obs_dict holds a preallocated buffer for the key, the value is written into it instead of replacing it.
+  '''
+  buffer = obs_dict.get(key)
+  if isinstance(buffer, np.ndarray):
+    buffer[...] = value
+  else:
+    obs_dict[key] = value
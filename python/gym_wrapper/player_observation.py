@@ -5,7 +5,7 @@ from common.constants import DASH, JUMP, SHOOT
 from common.entity import Entity
 from gym import Space, spaces
 
-from .observation import Observation
+from .observation import Observation, set_obs
 
 
 class PlayerObservation(Observation):
@@ -44,7 +44,17 @@ class PlayerObservation(Observation):
     def try_add_obs(key, value):
       if self.exclude and key in self.exclude:
         return
-      obs_dict[key] = value
+      set_obs(obs_dict, key, value)
+
+    def try_add_vec(key, x, y):
+      if self.exclude and key in self.exclude:
+        return
+      buffer = obs_dict.get(key)
+      if isinstance(buffer, np.ndarray):
+        buffer[0] = x
+        buffer[1] = y
+      else:
+        obs_dict[key] = np.array((x, y), dtype=np.float32)
 
     try_add_obs('prev_jump', int(JUMP in actions))
     try_add_obs('prev_dash', int(DASH in actions))
@@ -55,7 +65,7 @@ class PlayerObservation(Observation):
       try_add_obs('facing', 0)
       try_add_obs('onGround', 0)
       try_add_obs('onWall', 0)
-      try_add_obs('vel', np.zeros(2))
+      try_add_vec('vel', 0, 0)
       return
 
     try_add_obs('dodgeCooldown', int(player['dodgeCooldown']))
@@ -63,4 +73,5 @@ class PlayerObservation(Observation):
     try_add_obs('facing', (player['facing'] + 1) // 2) # -1,1 -> 0,1
     try_add_obs('onGround', int(player['onGround']))
     try_add_obs('onWall', int(player['onWall']))
-    try_add_obs('vel', np.clip(player.v.numpy() / 5, -2, 2))
+    v = player.v
+    try_add_vec('vel', min(max(v.x / 5, -2), 2), min(max(v.y / 5, -2), 2))
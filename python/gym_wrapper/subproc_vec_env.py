@@ -0,0 +1,257 @@
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from multiprocessing.connection import Connection as Pipe
+from multiprocessing.connection import wait
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from gym import Space, spaces
+from numpy.typing import NDArray
+
+from .base_env import TowerfallEnv
+from .vec_env import VecObs, copy_obs, use_batch_buffers, write_batch_obs
+
+# (key, shape, dtype) of every array in the shared block. key is None for observations that are not a Dict.
+_Layout = List[Tuple[Optional[str], Tuple[int, ...], str]]
+
+_ALIGNMENT = 8
+
+
+def _obs_layout(space: Space, n: int) -> _Layout:
+  if isinstance(space, spaces.Dict):
+    return [(key, (n,) + _obs_shape(subspace), _obs_dtype(subspace)) for key, subspace in space.spaces.items()]
+  return [(None, (n,) + _obs_shape(space), _obs_dtype(space))]
+
+
+def _obs_shape(space: Space) -> Tuple[int, ...]:
+  if isinstance(space, spaces.Discrete):
+    return ()
+  assert space.shape is not None, f'Unsupported observation space: {space}'
+  return tuple(space.shape)
+
+
+def _obs_dtype(space: Space) -> str:
+  if isinstance(space, spaces.Discrete):
+    return np.dtype(np.int64).str
+  return np.dtype(space.dtype).str
+
+
+def _layout_size(layout: _Layout) -> int:
+  size = 0
+  for _, shape, dtype in layout:
+    nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+    size += (nbytes + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+  return size
+
+
+def _map_layout(buffer: memoryview, layout: _Layout) -> Dict[Optional[str], NDArray]:
+  '''
+  Creates numpy views over the shared block following the layout.
+  '''
+  arrays = {}
+  offset = 0
+  for key, shape, dtype in layout:
+    array = np.ndarray(shape, dtype=dtype, buffer=buffer, offset=offset)
+    arrays[key] = array
+    offset += (array.nbytes + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+  return arrays
+
+
+class _CloudpickleWrapper:
+  '''
+  Environment factories are often lambdas, which the default pickle used by multiprocessing can't serialize. cloudpickle is
+  imported here, so gym_wrapper can be imported without it.
+  '''
+  def __init__(self, fn: Callable[[], TowerfallEnv]):
+    self.fn = fn
+
+  def __getstate__(self):
+    import cloudpickle
+    return cloudpickle.dumps(self.fn)
+
+  def __setstate__(self, state):
+    import cloudpickle
+    self.fn = cloudpickle.loads(state)
+
+
+def _worker(index: int, pipe: Pipe, parent_pipe: Pipe, env_fn_wrapper: _CloudpickleWrapper):
+  parent_pipe.close()
+  env = env_fn_wrapper.fn()
+  shm: Optional[shared_memory.SharedMemory] = None
+  try:
+    pipe.send((env.observation_space, env.action_space))
+    shm_name, layout = pipe.recv()
+    shm = shared_memory.SharedMemory(name=shm_name)
+    arrays = _map_layout(shm.buf, layout)
+    actions, rewards, dones = arrays.pop('_actions'), arrays.pop('_rewards'), arrays.pop('_dones')
+    obs_batch: Any = arrays if None not in arrays else arrays[None]
+    in_place = use_batch_buffers(env, obs_batch, index)
+    while True:
+      cmd, data = pipe.recv()
+      if cmd == 'step':
+        obs, reward, done, info = env.step(actions[index])
+        info = dict(info) if info else {}
+        if done:
+          info['terminal_observation'] = copy_obs(obs)
+          obs = env.reset()
+        if not in_place:
+          write_batch_obs(obs_batch, index, obs)
+        rewards[index] = reward
+        dones[index] = done
+        # Only the info crosses the pipe, and it is empty unless the episode ended.
+        pipe.send(info)
+      elif cmd == 'reset':
+        obs = env.reset()
+        if not in_place:
+          write_batch_obs(obs_batch, index, obs)
+        pipe.send(None)
+      elif cmd == 'get_attr':
+        pipe.send(getattr(env, data))
+      elif cmd == 'set_attr':
+        setattr(env, data[0], data[1])
+        pipe.send(None)
+      elif cmd == 'env_method':
+        name, args, kwargs = data
+        pipe.send(getattr(env, name)(*args, **kwargs))
+      elif cmd == 'is_wrapped':
+        pipe.send(isinstance(env, data))
+      elif cmd == 'close':
+        break
+      else:
+        raise ValueError(f'Unknown command {cmd}')
+  except KeyboardInterrupt:
+    pass
+  finally:
+    if hasattr(env, 'connection'):
+      env.connection.close()
+    if hasattr(env, 'towerfall') and env.towerfall:
+      env.towerfall.close()
+    if shm:
+      shm.close()
+    pipe.close()
+
+
+class TowerfallSubprocVecEnv:
+  '''
+  Runs each environment in its own process, so observation building is not bound by the GIL of a single interpreter.
+  Follows the VecEnv API of stable-baselines3, like TowerfallVecEnv.
+
+  Observations, actions, rewards and dones live in a shared memory block laid out from the observation space.
+  Only short commands and the info dicts cross the pipes on each step.
+
+  params env_fns: Functions creating each environment. They are serialized with cloudpickle, so lambdas are allowed.
+  params start_method: Multiprocessing start method. If None, 'forkserver' is used where available and 'spawn' otherwise.
+  '''
+  def __init__(self, env_fns: Sequence[Callable[[], TowerfallEnv]], start_method: Optional[str] = None):
+    self.num_envs = len(env_fns)
+    if start_method is None:
+      start_method = 'forkserver' if 'forkserver' in mp.get_all_start_methods() else 'spawn'
+    ctx = mp.get_context(start_method)
+
+    self._pipes: List[Pipe] = []
+    self._processes = []
+    for i, env_fn in enumerate(env_fns):
+      pipe, worker_pipe = ctx.Pipe()
+      process = ctx.Process(target=_worker, args=(i, worker_pipe, pipe, _CloudpickleWrapper(env_fn)), daemon=True)
+      process.start()
+      worker_pipe.close()
+      self._pipes.append(pipe)
+      self._processes.append(process)
+
+    self.observation_space, self.action_space = self._pipes[0].recv()
+    for pipe in self._pipes[1:]:
+      pipe.recv()
+    assert isinstance(self.action_space, spaces.MultiDiscrete), f'Unsupported action space: {self.action_space}'
+
+    n = self.num_envs
+    layout = _obs_layout(self.observation_space, n)
+    layout.append(('_actions', (n, len(self.action_space.nvec)), np.dtype(np.int64).str))
+    layout.append(('_rewards', (n,), np.dtype(np.float32).str))
+    layout.append(('_dones', (n,), np.dtype(bool).str))
+    self._shm = shared_memory.SharedMemory(create=True, size=_layout_size(layout))
+    arrays = _map_layout(self._shm.buf, layout)
+    self._actions = arrays.pop('_actions')
+    self._rewards = arrays.pop('_rewards')
+    self._dones = arrays.pop('_dones')
+    self._obs: Any = arrays if None not in arrays else arrays[None]
+    for pipe in self._pipes:
+      pipe.send((self._shm.name, layout))
+    self._waiting = False
+    self._closed = False
+
+  def reset(self) -> VecObs:
+    for pipe in self._pipes:
+      pipe.send(('reset', None))
+    for pipe in self._pipes:
+      pipe.recv()
+    return copy_obs(self._obs)
+
+  def step_async(self, actions: NDArray):
+    '''
+    Writes the actions to shared memory and tells all workers to step.
+    '''
+    self._actions[:] = actions
+    for pipe in self._pipes:
+      pipe.send(('step', None))
+    self._waiting = True
+
+  def step_wait(self) -> Tuple[VecObs, NDArray, NDArray, List[Dict[str, Any]]]:
+    assert self._waiting, 'step_async must be called before step_wait'
+    infos: List[Dict[str, Any]] = [{}] * self.num_envs
+    index_by_pipe = {pipe: i for i, pipe in enumerate(self._pipes)}
+    pending = list(self._pipes)
+    while pending:
+      for pipe in wait(pending):
+        assert isinstance(pipe, Pipe)
+        infos[index_by_pipe[pipe]] = pipe.recv()
+        pending.remove(pipe)
+    self._waiting = False
+    return copy_obs(self._obs), np.copy(self._rewards), np.copy(self._dones), infos
+
+  def step(self, actions: NDArray) -> Tuple[VecObs, NDArray, NDArray, List[Dict[str, Any]]]:
+    self.step_async(actions)
+    return self.step_wait()
+
+  def close(self):
+    if self._closed:
+      return
+    if self._waiting:
+      for pipe in self._pipes:
+        pipe.recv()
+    for pipe in self._pipes:
+      pipe.send(('close', None))
+    for process in self._processes:
+      process.join()
+    self._shm.close()
+    self._shm.unlink()
+    self._closed = True
+
+  def get_attr(self, attr_name: str, indices: Optional[Sequence[int]] = None) -> List[Any]:
+    return self._request('get_attr', attr_name, indices)
+
+  def set_attr(self, attr_name: str, value: Any, indices: Optional[Sequence[int]] = None):
+    self._request('set_attr', (attr_name, value), indices)
+
+  def env_method(self, method_name: str, *method_args, indices: Optional[Sequence[int]] = None, **method_kwargs) -> List[Any]:
+    return self._request('env_method', (method_name, method_args, method_kwargs), indices)
+
+  def env_is_wrapped(self, wrapper_class: type, indices: Optional[Sequence[int]] = None) -> List[bool]:
+    return self._request('is_wrapped', wrapper_class, indices)
+
+  def seed(self, seed: Optional[int] = None) -> List[Optional[int]]:
+    '''
+    No-op. Randomness comes from the game and from the objectives.
+    '''
+    return [None] * self.num_envs
+
+  def render(self, mode='human'):
+    '''
+    This is a no-op since the game is rendered independenly by MonoGame/XNA.
+    '''
+    pass
+
+  def _request(self, cmd: str, data: Any, indices: Optional[Sequence[int]]) -> List[Any]:
+    pipes = [self._pipes[i] for i in (range(self.num_envs) if indices is None else indices)]
+    for pipe in pipes:
+      pipe.send((cmd, data))
+    return [pipe.recv() for pipe in pipes]
@@ -0,0 +1,245 @@
+import selectors
+import socket
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures import as_completed
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from gym import Space, spaces
+from numpy.typing import NDArray
+
+from .actions import Actions
+from .base_env import TowerfallEnv
+
+VecObs = Union[NDArray, Dict[str, NDArray]]
+
+
+def create_batch_obs(space: Space, n: int) -> VecObs:
+  '''
+  Allocates arrays to hold n observations of the given space. Dict spaces are batched per key.
+  '''
+  if isinstance(space, spaces.Dict):
+    return {key: create_batch_obs(subspace, n) for key, subspace in space.spaces.items()}
+  if isinstance(space, spaces.Discrete):
+    return np.zeros((n,), dtype=np.int64)
+  assert space.shape is not None, f'Unsupported observation space: {space}'
+  return np.zeros((n,) + tuple(space.shape), dtype=space.dtype)
+
+
+def write_batch_obs(batch: VecObs, i: int, obs: Any):
+  '''
+  Copies a single observation into row i of a batch created with create_batch_obs.
+  '''
+  if isinstance(batch, dict):
+    for key, value in batch.items():
+      value[i] = obs[key]
+  else:
+    batch[i] = obs
+
+
+def batch_row(batch: VecObs, i: int) -> VecObs:
+  '''
+  Views of row i of a batch created with create_batch_obs. Rows of 1-d arrays are 0-d views, so they can be written in place.
+  '''
+  if isinstance(batch, dict):
+    return {key: value[i:i + 1].reshape(value.shape[1:]) for key, value in batch.items()}
+  return batch[i]
+
+
+def use_batch_buffers(env: TowerfallEnv, batch: VecObs, i: int) -> bool:
+  '''
+  Makes an environment that preallocates its observations write them directly into row i of the batch.
+
+  returns: Whether the environment writes into the batch, so its observations don't need to be copied.
+  '''
+  if not getattr(env, 'preallocate', False):
+    return False
+  env.set_obs_buffers(batch_row(batch, i))
+  return True
+
+
+def shared_actions(envs: Sequence[TowerfallEnv]) -> Optional[Actions]:
+  '''
+  The Actions of the environments if they all enable the same actions, so a batch can be serialized at once.
+  '''
+  def key(actions: Actions):
+    return (actions.can_jump, actions.can_dash, actions.can_shoot)
+  first = envs[0].actions
+  return first if all(key(env.actions) == key(first) for env in envs) else None
+
+
+def copy_obs(obs: Any) -> Any:
+  if isinstance(obs, dict):
+    return {key: np.copy(value) for key, value in obs.items()}
+  return np.copy(obs)
+
+
+class TowerfallVecEnv:
+  '''
+  Steps several TowerfallEnv in parallel. Follows the VecEnv API of stable-baselines3: observations, rewards and dones are batched
+  in NumPy arrays and environments are reset automatically when an episode ends.
+
+  Actions are sent to all games first, then updates are processed in the order they arrive, so the game processes run concurrently.
+
+  params env_fns: Functions creating each environment. Each one should create its own Towerfall, which attains a process from the pool.
+  params timeout: Seconds to wait for any update before raising socket.timeout. 0 means no timeout.
+  '''
+  def __init__(self, env_fns: Sequence[Callable[[], TowerfallEnv]], timeout: float = 10):
+    self.envs: List[TowerfallEnv] = [fn() for fn in env_fns]
+    self.num_envs = len(self.envs)
+    self.observation_space: Space = self.envs[0].observation_space
+    self.action_space: Space = self.envs[0].action_space
+    self.timeout = timeout
+    self._obs = create_batch_obs(self.observation_space, self.num_envs)
+    self._in_place = [use_batch_buffers(env, self._obs, i) for i, env in enumerate(self.envs)]
+    self._actions = shared_actions(self.envs)
+    self._rewards = np.zeros((self.num_envs,), dtype=np.float32)
+    self._dones = np.zeros((self.num_envs,), dtype=bool)
+    self._infos: List[Dict[str, Any]] = [{} for _ in range(self.num_envs)]
+    self._selector = selectors.DefaultSelector()
+    self._waiting = False
+
+  def reset(self) -> VecObs:
+    self._reset_envs(range(self.num_envs))
+    return copy_obs(self._obs)
+
+  def step_async(self, actions: NDArray):
+    '''
+    Sends the actions to all games. Call step_wait to get the results.
+    '''
+    if self._actions:
+      for env, env_actions, actions_str in zip(self.envs, actions, self._actions.to_serialized_actions_batch(actions)):
+        env.send_actions(env_actions, actions_str)
+    else:
+      for env, env_actions in zip(self.envs, actions):
+        env.send_actions(env_actions)
+    self._waiting = True
+
+  def step_wait(self) -> Tuple[VecObs, NDArray, NDArray, List[Dict[str, Any]]]:
+    '''
+    Waits for the updates of all games. Environments whose episode ended are reset together once all updates are in, with the last observation in info['terminal_observation'].
+    '''
+    assert self._waiting, 'step_async must be called before step_wait'
+    # Environments in pipeline mode read their updates on their own thread.
+    read_aheads = {}
+    waiting = []
+    resets: List[int] = []
+    try:
+      for i, env in enumerate(self.envs):
+        if env.read_ahead:
+          read_aheads[env.read_ahead] = i
+        else:
+          waiting.append(i)
+      self._wait_frames(waiting, lambda i: self._receive_step(i, resets))
+      try:
+        for future in as_completed(read_aheads, self.timeout if self.timeout else None):
+          self._receive_step(read_aheads[future], resets)
+      except FutureTimeoutError:
+        raise socket.timeout('Timeout waiting for environment updates')
+    finally:
+      self._waiting = False
+    if resets:
+      self._reset_envs(resets)
+    return copy_obs(self._obs), np.copy(self._rewards), np.copy(self._dones), list(self._infos)
+
+  def step(self, actions: NDArray) -> Tuple[VecObs, NDArray, NDArray, List[Dict[str, Any]]]:
+    self.step_async(actions)
+    return self.step_wait()
+
+  def close(self):
+    self._selector.close()
+    for env in self.envs:
+      env.close()
+      env.connection.close()
+      if env.towerfall:
+        env.towerfall.close()
+
+  def get_attr(self, attr_name: str, indices: Optional[Sequence[int]] = None) -> List[Any]:
+    return [getattr(self.envs[i], attr_name) for i in self._indices(indices)]
+
+  def set_attr(self, attr_name: str, value: Any, indices: Optional[Sequence[int]] = None):
+    for i in self._indices(indices):
+      setattr(self.envs[i], attr_name, value)
+
+  def env_method(self, method_name: str, *method_args, indices: Optional[Sequence[int]] = None, **method_kwargs) -> List[Any]:
+    return [getattr(self.envs[i], method_name)(*method_args, **method_kwargs) for i in self._indices(indices)]
+
+  def env_is_wrapped(self, wrapper_class: type, indices: Optional[Sequence[int]] = None) -> List[bool]:
+    return [isinstance(self.envs[i], wrapper_class) for i in self._indices(indices)]
+
+  def seed(self, seed: Optional[int] = None) -> List[Optional[int]]:
+    '''
+    No-op. Randomness comes from the game and from the objectives.
+    '''
+    return [None] * self.num_envs
+
+  def render(self, mode='human'):
+    '''
+    This is a no-op since the game is rendered independenly by MonoGame/XNA.
+    '''
+    pass
+
+  def _wait_frames(self, indices: Sequence[int], receive: Callable[[int], None]):
+    '''
+    Calls receive for each environment once a frame is available on its connection, in the order they arrive.
+    '''
+    pending = 0
+    try:
+      for i in indices:
+        connection = self.envs[i].connection
+        if connection.has_frame():
+          receive(i)
+        else:
+          self._selector.register(connection.fileno(), selectors.EVENT_READ, i)
+          pending += 1
+
+      while pending:
+        events = self._selector.select(self.timeout if self.timeout else None)
+        if not events:
+          raise socket.timeout('Timeout waiting for environment updates')
+        for key, _ in events:
+          i = key.data
+          connection = self.envs[i].connection
+          connection.receive_available()
+          if connection.has_frame():
+            self._selector.unregister(key.fileobj)
+            receive(i)
+            pending -= 1
+    finally:
+      for key in list(self._selector.get_map().values()):
+        self._selector.unregister(key.fileobj)
+
+  def _reset_envs(self, indices: Sequence[int]):
+    '''
+    Resets several environments with their round trips overlapped. All the resets are sent before waiting for any result, and
+    the first updates of the episodes are received in the order they arrive.
+    '''
+    for i in indices:
+      self.envs[i].request_reset()
+    for i in indices:
+      self.envs[i].confirm_reset()
+    self._wait_frames(indices, self._receive_reset)
+
+  def _receive_reset(self, i: int):
+    obs = self.envs[i].receive_reset()
+    if not self._in_place[i]:
+      write_batch_obs(self._obs, i, obs)
+
+  def _receive_step(self, i: int, resets: List[int]):
+    '''
+    Processes the update of a step. Environments whose episode ended are added to resets, to be reset together.
+    '''
+    env = self.envs[i]
+    obs, reward, done, info = env.receive_step()
+    info = dict(info) if info else {}
+    if done:
+      info['terminal_observation'] = copy_obs(obs)
+      resets.append(i)
+    elif not self._in_place[i]:
+      write_batch_obs(self._obs, i, obs)
+    self._rewards[i] = reward
+    self._dones[i] = done
+    self._infos[i] = info
+
+  def _indices(self, indices: Optional[Sequence[int]]) -> Sequence[int]:
+    return range(self.num_envs) if indices is None else indices
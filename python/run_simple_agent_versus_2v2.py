@@ -1,6 +1,6 @@
 from agents import SimpleAgent
 from common.logging_options import default_logging
-from towerfall import Towerfall
+from towerfall import MultiAgentRunner, Towerfall
 
 default_logging()
 
@@ -32,11 +32,9 @@ def main():
     connections.append(towerfall.join(timeout=10, verbose=1))
     agents.append(SimpleAgent(connections[i]))
 
-  while True:
-    # Read the state of the game then replies with an action.
-    for i, (connection, agent) in enumerate(zip(connections, agents)):
-      game_state = connection.read_json()
-      agent.act(game_state)
+  # Reads the state of the game from all agents at once and each one replies with an action.
+  runner = MultiAgentRunner(connections, agents, straggler_threshold=0.1)
+  runner.run()
 
 
 if __name__ == '__main__':
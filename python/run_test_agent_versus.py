@@ -1,6 +1,6 @@
 from agents import SimpleAgent, TestAgent
 from common.logging_options import default_logging
-from towerfall import Towerfall
+from towerfall import MultiAgentRunner, Towerfall
 
 default_logging()
 
@@ -34,11 +34,9 @@ def main():
   agents.append(TestAgent(connections[1]))
 
 
-  while True:
-    # Read the state of the game then replies with an action.
-    for connection, agent in zip(connections, agents):
-      game_state = connection.read_json()
-      agent.act(game_state)
+  # Reads the state of the game from all agents at once and each one replies with an action.
+  runner = MultiAgentRunner(connections, agents, straggler_threshold=0.1)
+  runner.run()
 
 
 if __name__ == '__main__':
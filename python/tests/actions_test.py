@@ -0,0 +1,25 @@
+import numpy as np
+
+from gym_wrapper import Actions
+
+
+def test_batch_matches_single():
+  for can_jump, can_dash, can_shoot in [(True, True, True), (False, True, False)]:
+    actions = Actions(can_jump=can_jump, can_dash=can_dash, can_shoot=can_shoot)
+    nvec = actions.action_space.nvec
+    batch = actions.decode(np.arange(int(np.prod(nvec))))
+    assert len({tuple(row) for row in batch}) == len(batch)
+    assert (batch < nvec).all()
+    serialized = actions.to_serialized_actions_batch(batch)
+    assert serialized == [actions.to_serialized_actions(row) for row in batch]
+    assert np.array_equal(actions.encode(batch), np.arange(len(batch)))
+    assert np.array_equal(actions.from_serialized_actions_batch(serialized), batch)
+
+
+def test_from_serialized_actions():
+  actions = Actions(can_dash=False)
+  assert list(actions.from_serialized_actions('')) == [1, 1, 0, 0]
+  assert list(actions.from_serialized_actions('lujs')) == [0, 2, 1, 1]
+  # Buttons in another order and disabled buttons.
+  assert list(actions.from_serialized_actions('szjrd')) == [2, 0, 1, 1]
+  assert np.array_equal(actions.from_serialized_actions_batch(['sjul', 'z']), [[0, 2, 1, 1], [1, 1, 0, 0]])
@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+from conftest import _frame
+
+from towerfall import AsyncConnection
+
+
+async def _echo_server(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+  # Echoes every frame back, split in two writes to exercise partial reads.
+  try:
+    while True:
+      header = await reader.readexactly(2)
+      payload = await reader.readexactly(int.from_bytes(header, 'big'))
+      data = _frame(payload)
+      writer.write(data[:3])
+      await writer.drain()
+      await asyncio.sleep(0.001)
+      writer.write(data[3:])
+      await writer.drain()
+  except asyncio.IncompleteReadError:
+    writer.close()
+
+
+def test_round_trip():
+  async def run():
+    server = await asyncio.start_server(_echo_server, '127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+    connections = [await AsyncConnection.open(port, timeout=2) for _ in range(4)]
+    async def exchange(i: int, connection: AsyncConnection):
+      for frame_id in range(20):
+        await connection.send_json(dict(type='actions', actions='r', id=frame_id, agent=i))
+        resp = await connection.read_json()
+        assert resp == dict(type='actions', actions='r', id=frame_id, agent=i)
+    await asyncio.gather(*(exchange(i, c) for i, c in enumerate(connections)))
+    for connection in connections:
+      await connection.close()
+    server.close()
+    await server.wait_closed()
+  asyncio.run(run())
+
+
+def test_read_closed():
+  async def run():
+    async def close_immediately(reader, writer):
+      writer.close()
+    server = await asyncio.start_server(close_immediately, '127.0.0.1', 0)
+    connection = await AsyncConnection.open(server.sockets[0].getsockname()[1], timeout=2)
+    with pytest.raises(ConnectionError):
+      await connection.read_json()
+    await connection.close()
+    server.close()
+    await server.wait_closed()
+  asyncio.run(run())
+
+
+def test_read_timeout():
+  async def run():
+    async def never_reply(reader, writer):
+      await asyncio.sleep(1)
+    server = await asyncio.start_server(never_reply, '127.0.0.1', 0)
+    connection = await AsyncConnection.open(server.sockets[0].getsockname()[1], timeout=0.05)
+    with pytest.raises(asyncio.TimeoutError):
+      await connection.read_json()
+    await connection.close()
+    server.close()
+  asyncio.run(run())
+
+
+def test_read_timeout_between_header_and_payload():
+  async def run():
+    async def slow_payload(reader, writer):
+      data = _frame(b'{"type":"update","id":1}')
+      writer.write(data[:2])
+      await writer.drain()
+      await asyncio.sleep(0.3)
+      writer.write(data[2:])
+      await writer.drain()
+      await asyncio.sleep(1)
+    server = await asyncio.start_server(slow_payload, '127.0.0.1', 0)
+    connection = await AsyncConnection.open(server.sockets[0].getsockname()[1], timeout=0.1)
+    with pytest.raises(asyncio.TimeoutError):
+      await connection.read_json()
+    # The header consumed by the cancelled read still frames the payload.
+    connection.timeout = 2
+    assert await connection.read_json() == dict(type='update', id=1)
+    await connection.close()
+    server.close()
+  asyncio.run(run())
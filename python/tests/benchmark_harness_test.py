@@ -0,0 +1,29 @@
+from benchmarks import (BenchmarkResult, Recorder, find_regressions,
+                        load_results, save_results)
+from benchmarks.harness import percentile
+
+
+def test_percentile():
+  samples = list(range(1, 101))
+  assert percentile(samples, 50) == 50
+  assert percentile(samples, 99) == 99
+  assert percentile([7], 99) == 7
+
+
+def test_results_round_trip_and_regressions(tmp_path):
+  recorder = Recorder()
+  for duration in [1_000_000, 2_000_000, 3_000_000]:
+    recorder.add(duration)
+  result = recorder.result('step', dict(entities=10))
+  assert result.frames == 3
+  assert result.p50 == 2.0
+
+  path = str(tmp_path / 'results.json')
+  save_results([result], path)
+  baseline = load_results(path)
+  assert baseline == [result]
+
+  slower = result._replace(p50=result.p50 * 1.5)
+  other = BenchmarkResult('other', {}, 1, 1.0, 1.0, 9.0, 9.0, 9.0)
+  assert find_regressions(baseline, [result, other]) == []
+  assert len(find_regressions(baseline, [slower])) == 1
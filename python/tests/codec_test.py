@@ -0,0 +1,52 @@
+import json
+
+import pytest
+
+from towerfall.codec import get_codec
+
+_UPDATE = dict(
+  type='update',
+  id=12,
+  dt=0.016,
+  entities=[
+    dict(type='archer', id=1, playerIndex=0, isEnemy=False, pos=dict(x=10, y=20), vel=dict(x=1, y=-1), size=dict(x=8, y=14)),
+    dict(type='slime', id=2, isEnemy=True, pos=dict(x=100.5, y=20), vel=dict(x=0, y=0), size=dict(x=10, y=8)),
+  ])
+
+
+def _available_codecs():
+  codecs = []
+  for name in ['json', 'orjson', 'ujson', 'msgspec']:
+    try:
+      codecs.append(get_codec(name))
+    except ImportError:
+      pass
+  return codecs
+
+
+@pytest.mark.parametrize('codec', _available_codecs(), ids=lambda c: c.name)
+def test_round_trip(codec):
+  payload = codec.dumps(_UPDATE)
+  assert isinstance(payload, bytes)
+  assert json.loads(payload) == _UPDATE
+  assert codec.loads(payload) == _UPDATE
+
+
+@pytest.mark.parametrize('codec', _available_codecs(), ids=lambda c: c.name)
+def test_dumps_ascii(codec):
+  # The game decodes messages as ASCII.
+  msg = dict(type='result', success=False, message='Ærchér \u00e9 \u20ac \U0001f3f9 "quoted"')
+  payload = codec.dumps(msg)
+  assert payload.isascii()
+  assert json.loads(payload.decode('ascii')) == msg
+  assert codec.loads(payload) == msg
+
+
+def test_get_codec_default():
+  assert get_codec().name in ['orjson', 'msgspec', 'ujson', 'json']
+
+
+def test_get_codec_unknown():
+  with pytest.raises(ValueError):
+    get_codec('yaml')
+
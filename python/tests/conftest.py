@@ -0,0 +1,65 @@
+import socket
+from typing import Optional, Type
+
+import pytest
+
+from gym_wrapper import KillEnemyObjective, PlayerObservation, TowerfallBlankEnv
+from towerfall import Towerfall
+from towerfall.fake_server import spawn_fake_server
+
+_CONFIG = dict(mode='sandbox', level='2', fps=0, agents=[dict(type='remote')])
+
+
+def _frame(payload: bytes) -> bytes:
+  return len(payload).to_bytes(2, byteorder='big') + payload
+
+
+def _recv_exactly(peer: socket.socket, size: int) -> bytes:
+  data = b''
+  while len(data) < size:
+    chunk = peer.recv(size - len(data))
+    if not chunk:
+      raise ConnectionError()
+    data += chunk
+  return data
+
+
+@pytest.fixture
+def fake_servers(tmp_path):
+  processes = []
+
+  def spawn(n: int = 1, **kwargs):
+    for _ in range(n):
+      processes.append(spawn_fake_server(str(tmp_path), 'fake', timeout=10, **kwargs))
+    return str(tmp_path)
+
+  yield spawn
+  for process in processes:
+    process.kill()
+    process.wait()
+
+
+@pytest.fixture
+def create_env(fake_servers):
+  '''
+  Creates blank environments with a player observation and a two slime objective, and closes them before the fake servers
+  are stopped. Keyword arguments are passed to the environment.
+  '''
+  envs = []
+
+  def create(towerfall_path: Optional[str], env_class: Type[TowerfallBlankEnv] = TowerfallBlankEnv, **kwargs):
+    towerfall = Towerfall(_CONFIG, towerfall_path=towerfall_path, pool_name='fake') if towerfall_path else None
+    env = env_class(
+      towerfall=towerfall,
+      observations=[PlayerObservation()],
+      objective=KillEnemyObjective(enemy_count=2, episode_max_len=20),
+      **kwargs)
+    envs.append(env)
+    return env
+
+  yield create
+  for env in envs:
+    env.close()
+    env.connection.close()
+    if env.towerfall:
+      env.towerfall.close()
@@ -0,0 +1,98 @@
+import json
+import socket
+import threading
+import time
+
+import pytest
+from conftest import _frame
+
+from towerfall import Connection
+
+
+@pytest.fixture
+def server():
+  listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+  listener.bind(('127.0.0.1', 0))
+  listener.listen(1)
+  yield listener
+  listener.close()
+
+
+def _accept_and_send(listener: socket.socket, chunks: list, delay: float = 0):
+  def run():
+    peer, _ = listener.accept()
+    for chunk in chunks:
+      peer.sendall(chunk)
+      if delay:
+        time.sleep(delay)
+    time.sleep(0.2)
+    peer.close()
+  thread = threading.Thread(target=run, daemon=True)
+  thread.start()
+  return thread
+
+
+def test_read_split_frame(server):
+  payload = json.dumps(dict(type='update', entities=[dict(id=i) for i in range(3000)], id=7)).encode('ascii')
+  data = _frame(payload)
+  chunks = [data[:1], data[1:5], data[5:20000], data[20000:]]
+  _accept_and_send(server, chunks, delay=0.01)
+  connection = Connection(server.getsockname()[1], timeout=2)
+  message = connection.read_json()
+  assert message['id'] == 7
+  assert len(message['entities']) == 3000
+  connection.close()
+
+
+def test_read_many_frames_in_one_chunk(server):
+  messages = [dict(type='update', id=i) for i in range(50)]
+  data = b''.join(_frame(json.dumps(m).encode('ascii')) for m in messages)
+  _accept_and_send(server, [data])
+  connection = Connection(server.getsockname()[1], timeout=2)
+  for expected in messages:
+    assert connection.read_json() == expected
+  connection.close()
+
+
+def test_read_closed(server):
+  _accept_and_send(server, [])
+  connection = Connection(server.getsockname()[1], timeout=2)
+  with pytest.raises(ConnectionError):
+    connection.read()
+  connection.close()
+
+
+def test_read_large_frames_across_buffer_refills(server):
+  payloads = [(str(i) * 40000).encode('ascii') for i in range(10)]
+  data = b''.join(_frame(p) for p in payloads)
+  _accept_and_send(server, [data[i:i + 30000] for i in range(0, len(data), 30000)])
+  connection = Connection(server.getsockname()[1], timeout=2)
+  for expected in payloads:
+    assert connection.read() == expected.decode('ascii')
+  connection.close()
+
+
+def test_write_frame_and_record(server, tmp_path):
+  record_path = str(tmp_path / 'record.txt')
+  received = []
+  def run():
+    peer, _ = server.accept()
+    data = b''
+    while True:
+      chunk = peer.recv(1 << 16)
+      if not chunk:
+        break
+      data += chunk
+    received.append(data)
+    peer.close()
+  thread = threading.Thread(target=run, daemon=True)
+  thread.start()
+  connection = Connection(server.getsockname()[1], timeout=2, record_path=record_path)
+  messages = [dict(type='actions', actions='lj', id=i) for i in range(3)]
+  for m in messages:
+    connection.send_json(m)
+  connection.close()
+  thread.join(2)
+  assert received[0] == b''.join(_frame(connection.codec.dumps(m)) for m in messages)
+  with open(record_path) as file:
+    assert [json.loads(line) for line in file] == messages
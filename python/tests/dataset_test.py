@@ -0,0 +1,82 @@
+import json
+
+import numpy as np
+import pytest
+
+from dataset import DatasetExporter, load_manifest, load_table
+from towerfall.recording import RECEIVED, SENT, open_recorder
+
+
+def _dumps(obj) -> bytes:
+  return json.dumps(obj, separators=(',', ':')).encode('ascii')
+
+
+def _entity(type: str, id: int, x: float, **kwargs):
+  return dict(type=type, id=id, pos=dict(x=x, y=10), vel=dict(x=1, y=0), size=dict(x=8, y=14), isEnemy=type != 'archer', **kwargs)
+
+
+def _game_dumps(obj, type_last: bool) -> bytes:
+  '''
+  Messages of the game. Json.NET writes the inherited type after the other fields.
+  '''
+  if type_last:
+    obj = dict(obj)
+    obj['type'] = obj.pop('type')
+  return _dumps(obj)
+
+
+def _record(path: str, episodes: int, steps: int, type_last: bool = False):
+  recorder = open_recorder(path)
+  recorder.record(_game_dumps(dict(type='init', index=1, version='0.1'), type_last), RECEIVED)
+  recorder.record(_dumps(dict(type='result', success=True)), SENT)
+  recorder.record(_game_dumps(dict(type='scenario', grid=[], cellSize=10), type_last), RECEIVED)
+  recorder.record(_dumps(dict(type='result', success=True)), SENT)
+  update_id = 0
+  for episode in range(episodes):
+    recorder.mark_episode()
+    for step in range(steps):
+      entities = [
+        _entity('archer', 100 + episode, step, playerIndex=1, facing=1, onGround=True, onWall=False, state='normal',
+                arrows=['normal'] * 2, dodgeCooldown=False),
+        _entity('slime', 200 + episode, 50 - step),
+      ]
+      recorder.record(_game_dumps(dict(type='update', entities=entities, dt=1, id=update_id), type_last), RECEIVED)
+      recorder.record(_dumps(dict(type='actions', actions='rj' if step % 2 else '', id=update_id)), SENT)
+      update_id += 1
+  recorder.close()
+
+
+@pytest.mark.parametrize('type_last', [False, True])
+@pytest.mark.parametrize('format', ['npz', 'parquet'])
+@pytest.mark.parametrize('extension', ['tfr', 'json'])
+def test_export(tmp_path, extension, format, type_last):
+  if format == 'parquet':
+    pytest.importorskip('pyarrow')
+  path = str(tmp_path / f'replay.{extension}')
+  _record(path, episodes=3, steps=7, type_last=type_last)
+  output_dir = str(tmp_path / 'dataset')
+  with DatasetExporter(output_dir, format=format, shard_frames=5) as exporter:
+    exporter.add_recording(path)
+
+  manifest = load_manifest(output_dir)
+  assert manifest['n_frames'] == 21
+  assert manifest['n_episodes'] == 3
+  assert len(manifest['shards']) == 5
+  assert manifest['types'] == ['archer', 'slime']
+
+  frames = load_table(output_dir, 'frames')
+  assert np.array_equal(frames['frame'], np.arange(21))
+  assert np.array_equal(frames['episode'], np.repeat(np.arange(3), 7))
+  assert np.array_equal(frames['step'], np.tile(np.arange(7), 3))
+  assert np.array_equal(frames['archer_x'], np.tile(np.arange(7), 3))
+  assert frames['archer_present'].all() and frames['acted'].all()
+  assert np.array_equal(frames['action_r'], frames['step'] % 2 == 1)
+  assert not frames['action_s'].any()
+  assert (frames['archer_arrows'] == 2).all()
+
+  entities = load_table(output_dir, 'entities')
+  assert len(entities['id']) == 42
+  slimes = entities['type'] == manifest['types'].index('slime')
+  assert np.array_equal(entities['x'][slimes], 50 - frames['step'])
+  assert np.array_equal(entities['frame'][slimes], frames['frame'])
+  assert (entities['player_index'][~slimes] == 1).all()
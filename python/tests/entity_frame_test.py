@@ -0,0 +1,33 @@
+import numpy as np
+
+from common.entity import to_entities
+from common.entity_frame import EntityFrame, type_name
+
+_ENTITIES = [
+  dict(type='archer', id=1, playerIndex=0, isEnemy=False, facing=1, pos=dict(x=10, y=20), vel=dict(x=1, y=-1), size=dict(x=8, y=14)),
+  dict(type='slime', id=2, isEnemy=True, pos=dict(x=100.5, y=20), vel=dict(x=0, y=0), size=dict(x=10, y=8)),
+  dict(type='archer', id=3, playerIndex=1, isEnemy=False, facing=-1, pos=dict(x=40, y=60), vel=dict(x=0, y=2), size=dict(x=8, y=14)),
+]
+
+
+def test_views_match_entities():
+  frame = EntityFrame(_ENTITIES)
+  assert len(frame) == len(_ENTITIES)
+  for view, entity in zip(frame, to_entities(_ENTITIES)):
+    assert view.p == entity.p and view.v == entity.v and view.s == entity.s
+    assert view.type == entity.type and view.isEnemy == entity.isEnemy
+    assert view['id'] == entity['id']
+    assert view.bot_left() == entity.bot_left() and view.top_right() == entity.top_right()
+  assert frame[1] is frame[1]
+  assert [type_name(code) for code in frame.type_code] == [e['type'] for e in _ENTITIES]
+
+
+def test_queries():
+  frame = EntityFrame(_ENTITIES)
+  archer = frame.find_archer(1)
+  assert archer is not None and archer['id'] == 3
+  assert frame.find_archer(2) is None
+  assert [e['id'] for e in frame.select(frame.of_type('archer'))] == [1, 3]
+  assert not frame.of_type('ghost').any()
+  assert np.allclose(frame.distances(10, 20), [0, 90.5, np.hypot(30, 40)])
+  assert len(EntityFrame([])) == 0
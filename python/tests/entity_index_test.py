@@ -0,0 +1,47 @@
+from common.entity import to_entities
+from common.entity_frame import EntityFrame
+from common.entity_index import EntityIndex
+
+
+def _entity(type: str, id: int, **kwargs):
+  return dict(type=type, id=id, isEnemy=type == 'slime', pos=dict(x=0, y=0), vel=dict(x=0, y=0), size=dict(x=1, y=1), **kwargs)
+
+
+def test_lookups_and_deltas():
+  index = EntityIndex()
+  index.update([_entity('archer', 1, playerIndex=0), _entity('slime', 2), _entity('slime', 3)])
+  assert index.archer(0)['id'] == 1 and index.archer(1) is None
+  assert [e['id'] for e in index.of_type('slime')] == [2, 3] and index.of_type('arrow') == []
+  assert [e['id'] for e in index.enemies] == [2, 3]
+  assert [e['id'] for e in index.spawned] == [1, 2, 3] and index.despawned == []
+
+  index.update([_entity('archer', 1, playerIndex=0), _entity('slime', 3), _entity('arrow', 4)])
+  assert 2 not in index and index.get(3)['id'] == 3
+  assert [e['id'] for e in index.spawned] == [4]
+  assert [e['id'] for e in index.despawned] == [2]
+  assert index.first_seen == {1: 0, 3: 0, 4: 1}
+
+  index.clear()
+  index.update(to_entities([_entity('arrow', 4)]))
+  assert [e['id'] for e in index.spawned] == [4] and index.first_seen == {4: 2}
+  assert len(index) == 1
+
+
+def test_entity_frame_matches_dicts():
+  updates = [
+    [_entity('archer', 1, playerIndex=0), _entity('slime', 2), _entity('arrow', 3), _entity('slime', 4)],
+    [_entity('slime', 4), _entity('archer', 1, playerIndex=0), _entity('archer', 5, playerIndex=1)],
+  ]
+  dicts = EntityIndex()
+  frames = EntityIndex()
+  for raw in updates:
+    dicts.update(raw)
+    frames.update(EntityFrame(raw))
+    assert {id: e['type'] for id, e in frames.by_id.items()} == {id: e['type'] for id, e in dicts.by_id.items()}
+    assert {t: [e['id'] for e in es] for t, es in frames.by_type.items()} == \
+      {t: [e['id'] for e in es] for t, es in dicts.by_type.items()}
+    assert {i: e['id'] for i, e in frames.by_player_index.items()} == {i: e['id'] for i, e in dicts.by_player_index.items()}
+    assert [e['id'] for e in frames.enemies] == [e['id'] for e in dicts.enemies]
+    assert [e['id'] for e in frames.spawned] == [e['id'] for e in dicts.spawned]
+    assert [e['id'] for e in frames.despawned] == [e['id'] for e in dicts.despawned]
+    assert frames.first_seen == dicts.first_seen
@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+
+from common.entity import Vec2, closest, distances, to_entities
+
+
+def _entity(id: int, x: float, y: float):
+  return dict(type='slime', id=id, isEnemy=True, pos=dict(x=x, y=y), vel=dict(x=0, y=0), size=dict(x=10, y=8))
+
+
+def test_vec2():
+  v = Vec2(3, 4)
+  assert v * 2 == Vec2(6, 8) and v / 2 == Vec2(1.5, 2)
+  assert v * np.float64(2) == Vec2(6, 8)
+  with pytest.raises(NotImplementedError):
+    v * v
+  assert hash(v) == hash(Vec2(3, 4)) and len({v, Vec2(3, 4), Vec2(4, 3)}) == 2
+  assert v.length() == 5 and v.distance(Vec2(0, 0)) == 5
+  with pytest.raises(AttributeError):
+    v.z = 1
+
+
+def test_batch_helpers():
+  entities = to_entities([_entity(1, 30, 0), _entity(2, 10, 0), _entity(3, 0, 20)])
+  assert np.allclose(distances(Vec2(0, 0), entities), [30, 10, 20])
+  assert [e['id'] for e in closest(Vec2(0, 0), entities, 2)] == [2, 3]
+  assert closest(Vec2(0, 0), [], 2) == []
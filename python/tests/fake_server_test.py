@@ -0,0 +1,173 @@
+import asyncio
+import json
+
+import numpy as np
+import pytest
+from conftest import _CONFIG
+
+from gym_wrapper import Instrumentation, TowerfallBlankEnv
+from gym_wrapper.obs_buffers import flat_obs_views
+from gym_wrapper.vec_env import copy_obs
+from towerfall import AsyncTowerfall, ReplayConnection
+from towerfall.codec import StdlibCodec
+
+def test_env_against_fake_server(fake_servers, create_env):
+  env = create_env(fake_servers(n_entities=10))
+  obs = env.reset()
+  assert set(obs) == set(env.observation_space.spaces)
+  assert len(env.entities) == 1 + 2 + 10
+  episodes = 0
+  for _ in range(100):
+    obs, _, done, _ = env.step(env.action_space.sample())
+    if done:
+      episodes += 1
+      obs = env.reset()
+  assert episodes >= 5
+
+
+@pytest.mark.parametrize('type_last', [False, True])
+def test_frame_skip(fake_servers, create_env, type_last):
+  # The game writes the type of the updates last, which skipped frames are peeked regardless of.
+  env = create_env(fake_servers(n_entities=10, type_last=type_last), frame_skip=4)
+  env.reset()
+  episode_frames = 0
+  for _ in range(30):
+    update_id = env.state_update['id']
+    _, _, done, _ = env.step(env.action_space.sample())
+    assert env.state_update['id'] == update_id + 4
+    assert env.step_frames == 4
+    episode_frames += 4
+    assert env.frame == episode_frames
+    if done:
+      # The objective counts game frames, so episodes last 20 frames.
+      assert env.objective.episode_len <= 20 + 4
+      env.reset()
+      episode_frames = 0
+
+
+class _CountingCodec(StdlibCodec):
+  def __init__(self):
+    self.decoded = 0
+
+  def loads(self, payload: bytes):
+    self.decoded += 1
+    return super().loads(payload)
+
+
+def test_frame_skip_codec(fake_servers, create_env, tmp_path):
+  record_path = tmp_path / 'replay.json'
+  env = create_env(fake_servers(), record_path=str(record_path))
+  env.reset()
+  for _ in range(10):
+    env.step(env.action_space.sample())
+  env.connection.close()
+  # With spaces after the separators the ids can't be peeked, so skipped updates are decoded by the codec of the connection.
+  lines = record_path.read_bytes().splitlines()
+  record_path.write_bytes(b''.join(json.dumps(json.loads(line)).encode('ascii') + b'\n' for line in lines))
+
+  codec = _CountingCodec()
+  env = create_env(None, connection=ReplayConnection(str(record_path), codec=codec), frame_skip=2)
+  env.reset()
+  decoded = codec.decoded
+  env.step(env.action_space.sample())
+  assert codec.decoded == decoded + 2
+
+
+def test_async_towerfall_against_fake_server(fake_servers):
+  towerfall_path = fake_servers()
+
+  async def run():
+    towerfall = await AsyncTowerfall.create(_CONFIG, towerfall_path=towerfall_path, pool_name='fake')
+    connection = await towerfall.join()
+    state_init = await connection.read_json()
+    assert state_init['type'] == 'init' and state_init['index'] == 0
+    await connection.send_json(dict(type='result', success=True))
+    assert (await connection.read_json())['type'] == 'scenario'
+    await connection.send_json(dict(type='result', success=True))
+    for _ in range(5):
+      update = await connection.read_json()
+      await connection.send_json(dict(type='actions', actions='r', id=update['id']))
+    await connection.close()
+    await towerfall.close()
+
+  asyncio.run(run())
+
+
+def test_env_instrumentation(fake_servers, create_env):
+  frames = []
+  instrumentation = Instrumentation(capacity=8, on_frame=lambda kind, phases: frames.append((kind, dict(phases))))
+  env = create_env(fake_servers(), instrumentation=instrumentation)
+  env.reset()
+  for _ in range(10):
+    if env.step(env.action_space.sample())[2]:
+      env.reset()
+
+  kinds = [kind for kind, _ in frames]
+  assert kinds[0] == 'reset' and 'step' in kinds
+  step_phases = next(phases for kind, phases in frames if kind == 'step')
+  assert list(step_phases) == ['send', 'wait', 'decode', 'entities', 'observations', 'objective', 'total']
+  assert sum(v for k, v in step_phases.items() if k != 'total') <= step_phases['total']
+
+  stats = instrumentation.stats[('step', 'wait')]
+  assert stats.count == kinds.count('step')
+  assert len(stats.samples()) == min(8, stats.count)
+  assert sum(count for _, count in instrumentation.histogram('step', 'wait')) == len(stats.samples())
+  text = instrumentation.prometheus_text()
+  assert f'towerfall_env_phase_seconds_count{{kind="step",phase="wait"}} {stats.count}' in text
+  assert 'step/total' in instrumentation.summary()
+
+
+def _record(env: TowerfallBlankEnv, actions):
+  '''
+  Copies of the observations of a run, with the one of the reset after each episode.
+  '''
+  observations = [copy_obs(env.reset())]
+  for action in actions:
+    obs, _, done, _ = env.step(action)
+    observations.append(copy_obs(obs))
+    if done:
+      observations.append(copy_obs(env.reset()))
+  return observations
+
+
+@pytest.mark.parametrize('options', [{}, dict(entity_frame=True), dict(pipeline=True)], ids=['dicts', 'entity_frame', 'pipeline'])
+@pytest.mark.parametrize('extension', ['tfr', 'json'])
+def test_replay_connection(fake_servers, create_env, tmp_path, extension, options):
+  record_path = str(tmp_path / f'replay.{extension}')
+  env = create_env(fake_servers(n_entities=5), record_path=record_path)
+  actions = [env.action_space.sample() for _ in range(60)]
+  recorded = _record(env, actions)
+  env.connection.close()
+
+  connection = ReplayConnection(record_path)
+  replayed = _record(create_env(None, connection=connection, **options), actions)
+  assert len(replayed) == len(recorded)
+  for obs_recorded, obs_replayed in zip(recorded, replayed):
+    for key in obs_recorded:
+      assert np.array_equal(obs_recorded[key], obs_replayed[key])
+  assert not connection.is_open()
+
+
+@pytest.mark.parametrize('flatten', [False, True])
+def test_preallocated_observations(fake_servers, create_env, tmp_path, flatten):
+  record_path = str(tmp_path / 'replay.tfr')
+  env = create_env(fake_servers(n_entities=5), record_path=record_path)
+  actions = [env.action_space.sample() for _ in range(60)]
+  recorded = [copy_obs(env.reset())]
+  for action in actions:
+    obs, _, done, _ = env.step(action)
+    recorded.append(copy_obs(obs if not done else env.reset()))
+  env.connection.close()
+
+  env = create_env(None, connection=ReplayConnection(record_path), preallocate=True, flatten=flatten)
+  first = env.reset()
+  assert env.observation_space.contains(first)
+  for i, action in enumerate(actions):
+    obs, _, done, _ = env.step(action)
+    if done:
+      obs = env.reset()
+    # The same arrays are written every step.
+    assert obs is first
+    values = flat_obs_views(env.dict_observation_space, obs) if flatten else obs
+    for key, value in recorded[i + 1].items():
+      assert np.allclose(values[key], value)
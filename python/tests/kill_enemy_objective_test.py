@@ -0,0 +1,79 @@
+import random
+
+import numpy as np
+
+from common.constants import HH, HW
+from common.entity import Entity, to_entities
+from common.entity_frame import EntityFrame
+from gym_wrapper.kill_enemy_objective import KillEnemyObjective, batch_target_observations
+
+
+def _entity(x: float, y: float) -> Entity:
+  return Entity(dict(type='slime', id=0, isEnemy=True, pos=dict(x=x, y=y), vel=dict(x=0, y=0), size=dict(x=10, y=8)))
+
+
+def _reference(player: Entity, targets, k: int):
+  '''
+  The loop implementation, with deltas normalized before wrapping.
+  '''
+  objective = KillEnemyObjective(enemy_count=k)
+  obs = np.zeros((3 * k,), dtype=np.float32)
+  for i, target in enumerate(sorted(targets, key=lambda t: (t.p - player.p).length())[:k]):
+    obs[i*3] = 1
+    obs[i*3 + 1] = objective.limit((target.p.x - player.p.x) / HW, -1, 1)
+    obs[i*3 + 2] = objective.limit((target.p.y - player.p.y) / HH, -1, 1)
+  return obs
+
+
+def test_matches_reference():
+  random.seed(0)
+  players, targets = [], []
+  for n_targets in [0, 1, 3, 8]:
+    players.append(_entity(random.uniform(0, 320), random.uniform(0, 240)))
+    targets.append([_entity(random.uniform(0, 320), random.uniform(0, 240)) for _ in range(n_targets)])
+  players.append(None)
+  targets.append([_entity(0, 0)])
+
+  obs = batch_target_observations(players, targets, k=4)
+  assert obs.shape == (5, 12) and obs.dtype == np.float32
+  for i in range(4):
+    assert np.allclose(obs[i], _reference(players[i], targets[i], 4))
+  assert not obs[4].any()
+
+
+def test_wraps_deltas():
+  obs = batch_target_observations([_entity(10, 100)], [[_entity(310, 100)]], k=1)
+  assert np.allclose(obs[0], [1, 300 / HW - 2, 0])
+
+
+def test_loop_matches_vectorized():
+  random.seed(1)
+  objective = KillEnemyObjective(enemy_count=5)
+  player = _entity(160, 120)
+  for n_targets in [0, 2, 5, 9]:
+    targets = [_entity(random.uniform(0, 320), random.uniform(0, 240)) for _ in range(n_targets)]
+    loop = objective._loop_target_observations(player, targets)
+    assert np.allclose(loop, batch_target_observations([player], [targets], 5)[0])
+    assert np.allclose(loop, _reference(player, targets, 5))
+
+
+def test_entity_frame_targets():
+  random.seed(2)
+  raw = [dict(type='slime', id=i, isEnemy=True, pos=dict(x=random.uniform(0, 320), y=random.uniform(0, 240)), vel=dict(x=0, y=0),
+              size=dict(x=10, y=8)) for i in range(100)]
+  objective = KillEnemyObjective(enemy_count=4)
+  player = _entity(160, 120)
+  obs_dict = {}
+  objective._update_obs(player, list(EntityFrame(raw)), obs_dict)
+  assert np.allclose(obs_dict['targets'], _reference(player, to_entities(raw), 4))
+
+
+def test_reset_batch_follows_parameters():
+  objective = KillEnemyObjective(enemy_count=1, reset_batch_size=8)
+  assert len(objective.get_reset_entities()) == 2
+  objective.enemy_count = 3
+  objective.enemy_type = 'bat'
+  entities = objective.get_reset_entities()
+  assert [e['type'] for e in entities] == ['archer', 'bat', 'bat', 'bat']
+  objective.min_distance = objective.max_distance = 20
+  assert all(abs(e['pos']['x'] - 160) == 20 for e in objective.get_reset_entities()[1:])
@@ -0,0 +1,90 @@
+import json
+import socket
+import threading
+
+from conftest import _frame, _recv_exactly
+
+from towerfall import Connection, MultiAgentRunner
+
+
+class _Log:
+  '''
+  Order in which the fake games send updates and receive actions, shared by all of them.
+  '''
+  def __init__(self):
+    self.events = []
+    self.condition = threading.Condition()
+
+  def append(self, event):
+    with self.condition:
+      self.events.append(event)
+      self.condition.notify_all()
+
+  def wait_for(self, events, timeout: float):
+    with self.condition:
+      assert self.condition.wait_for(lambda: all(e in self.events for e in events), timeout)
+
+
+def _serve(listener: socket.socket, index: int, n_frames: int, log: _Log, wait_for_others: int):
+  # Plays the game side for one agent: sends an update, then waits for the actions.
+  # With wait_for_others, the update of each frame is held back until the other agents replied to theirs.
+  peer, _ = listener.accept()
+  for frame_id in range(n_frames):
+    if wait_for_others:
+      log.wait_for([('received', i, frame_id) for i in range(wait_for_others) if i != index], timeout=2)
+    log.append(('sent', index, frame_id))
+    peer.sendall(_frame(json.dumps(dict(type='update', id=frame_id, entities=[])).encode('ascii')))
+    size = int.from_bytes(_recv_exactly(peer, 2), 'big')
+    reply = json.loads(_recv_exactly(peer, size))
+    log.append(('received', index, reply['id']))
+  peer.close()
+
+
+class _EchoAgent:
+  def __init__(self, connection: Connection):
+    self.connection = connection
+    self.ids = []
+
+  def act(self, game_state):
+    self.ids.append(game_state['id'])
+    self.connection.send_json(dict(type='actions', actions='', id=game_state['id']))
+
+
+def test_run_frames():
+  n_frames = 10
+  n_agents = 5
+  # Agent 1 only gets its update once the others replied, which a runner waiting on the agents one by one never gets to.
+  slow = 1
+  log = _Log()
+  listeners = []
+  threads = []
+  for i in range(n_agents):
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(1)
+    listeners.append(listener)
+    wait_for_others = n_agents if i == slow else 0
+    thread = threading.Thread(target=_serve, args=(listener, i, n_frames, log, wait_for_others), daemon=True)
+    thread.start()
+    threads.append(thread)
+
+  connections = [Connection(listener.getsockname()[1], timeout=2) for listener in listeners]
+  agents = [_EchoAgent(connection) for connection in connections]
+  runner = MultiAgentRunner(connections, agents, timeout=2)
+  runner.run(n_frames)
+  for thread in threads:
+    thread.join(2)
+
+  for i, agent in enumerate(agents):
+    assert agent.ids == list(range(n_frames))
+    assert [e[2] for e in log.events if e[:2] == ('received', i)] == list(range(n_frames))
+  # The other agents acted while the slow one was still waiting for its update, on every frame.
+  for frame_id in range(n_frames):
+    slow_sent = log.events.index(('sent', slow, frame_id))
+    assert all(log.events.index(('received', i, frame_id)) < slow_sent for i in range(n_agents) if i != slow)
+  assert runner.straggler_counts[slow] == n_frames
+  assert runner.last_stats and len(runner.last_stats.arrivals) == n_agents
+  runner.close()
+  for connection, listener in zip(connections, listeners):
+    connection.close()
+    listener.close()
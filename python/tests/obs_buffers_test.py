@@ -0,0 +1,23 @@
+import numpy as np
+import pytest
+from gym import spaces
+
+from gym_wrapper.obs_buffers import flat_obs_views, flatten_space
+
+
+def test_flatten_space():
+  space = spaces.Dict(dict(
+    position=spaces.Box(low=-1, high=1, shape=(2, 2), dtype=np.float32),
+    facing=spaces.Discrete(2, start=-1)))
+  flat_space = flatten_space(space)
+  assert flat_space.shape == (5,) and flat_space.dtype == np.float32
+  # Dict sorts its keys, so facing comes first.
+  assert list(flat_space.low) == [-1] + [-1] * 4 and list(flat_space.high) == [0] + [1] * 4
+  flat = np.arange(5, dtype=np.float32)
+  views = flat_obs_views(space, flat)
+  assert np.shares_memory(views['position'], flat) and views['position'].shape == (2, 2)
+
+
+def test_flatten_space_unsupported():
+  with pytest.raises(TypeError, match='MultiBinary'):
+    flatten_space(spaces.Dict(dict(buttons=spaces.MultiBinary(3))))
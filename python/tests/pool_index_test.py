@@ -0,0 +1,76 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from towerfall.pool_index import PoolIndex
+
+
+@pytest.fixture
+def stand_in_process():
+  process = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)'])
+  yield process
+  process.kill()
+  process.wait()
+
+
+def _register(pool_path: str, pid: int, port: int, **metadata):
+  with open(os.path.join(pool_path, str(pid)), 'w') as file:
+    json.dump(dict(port=port, **metadata), file)
+
+
+def _select_first(metadatas):
+  return metadatas[0] if metadatas else None
+
+
+def test_index_tracks_registered_processes(tmp_path, stand_in_process):
+  index = PoolIndex(str(tmp_path))
+  assert index.entries() == {}
+
+  _register(str(tmp_path), stand_in_process.pid, 12345, fastrun=True)
+  entries = index.entries()
+  assert list(entries) == [stand_in_process.pid]
+  assert entries[stand_in_process.pid]['port'] == 12345
+  assert entries[stand_in_process.pid]['fastrun'] is True
+  assert entries[stand_in_process.pid]['nographics'] is False
+
+  metadata = index.take(_select_first)
+  assert metadata is not None and metadata['pid'] == stand_in_process.pid
+  assert index.take(_select_first) is None
+
+  os.remove(os.path.join(str(tmp_path), str(stand_in_process.pid)))
+  assert index.entries() == {}
+
+
+def test_index_drops_dead_processes(tmp_path, stand_in_process):
+  dead = subprocess.Popen([sys.executable, '-c', 'pass'])
+  dead.wait()
+  _register(str(tmp_path), dead.pid, 1)
+  _register(str(tmp_path), stand_in_process.pid, 2)
+
+  index = PoolIndex(str(tmp_path))
+  assert list(index.entries()) == [stand_in_process.pid]
+  assert not os.path.exists(os.path.join(str(tmp_path), str(dead.pid)))
+
+
+def test_index_does_not_parse_unchanged_files(tmp_path, stand_in_process, monkeypatch):
+  _register(str(tmp_path), stand_in_process.pid, 1)
+  index = PoolIndex(str(tmp_path))
+  index.entries()
+
+  import towerfall.pool_index as pool_index
+  loads = []
+  load_metadata = pool_index.load_metadata
+  monkeypatch.setattr(pool_index, 'load_metadata', lambda file: loads.append(file) or load_metadata(file))
+  # Forces a rescan, as if another file changed.
+  index._dir_mtime = None
+  assert list(index.entries()) == [stand_in_process.pid]
+  assert loads == []
+
+
+def test_missing_capabilities_default_to_a_process_without_flags(tmp_path, stand_in_process):
+  _register(str(tmp_path), stand_in_process.pid, 12345)
+  metadata = PoolIndex(str(tmp_path)).entries()[stand_in_process.pid]
+  assert metadata['fastrun'] is True and metadata['nographics'] is False
@@ -0,0 +1,144 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+from conftest import _frame, _recv_exactly
+
+from towerfall import Towerfall, TowerfallPool
+from towerfall.towerfall import select_metadata
+
+
+class _ManagementServer:
+  '''
+  Accepts config requests like the game does, and can drop the management connection to simulate a crash.
+  '''
+  def __init__(self):
+    self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    self.listener.bind(('127.0.0.1', 0))
+    self.listener.listen(4)
+    self.port = self.listener.getsockname()[1]
+    self.peers = []
+    threading.Thread(target=self._serve, daemon=True).start()
+
+  def _serve(self):
+    while True:
+      try:
+        peer, _ = self.listener.accept()
+      except OSError:
+        return
+      self.peers.append(peer)
+      threading.Thread(target=self._handle, args=(peer,), daemon=True).start()
+
+  def _handle(self, peer: socket.socket):
+    try:
+      while True:
+        size = int.from_bytes(_recv_exactly(peer, 2), 'big')
+        json.loads(_recv_exactly(peer, size))
+        peer.sendall(_frame(json.dumps(dict(type='result', success=True)).encode('ascii')))
+    except (ConnectionError, OSError):
+      pass
+
+  def close(self):
+    self.listener.close()
+    for peer in self.peers:
+      peer.shutdown(socket.SHUT_RDWR)
+      peer.close()
+
+
+@pytest.fixture
+def stand_in_process():
+  process = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)'])
+  yield process
+  process.kill()
+  process.wait()
+
+
+def _register(towerfall_path, pool_name: str, pid: int, port: int, nographics: bool = False):
+  pool_path = os.path.join(towerfall_path, 'aimod', 'pools', pool_name)
+  os.makedirs(pool_path, exist_ok=True)
+  with open(os.path.join(pool_path, str(pid)), 'w') as file:
+    json.dump(dict(port=port, fastrun=True, nographics=nographics), file)
+  return pool_path
+
+
+def test_lease_and_health_check(tmp_path, stand_in_process):
+  server = _ManagementServer()
+  pool_path = _register(str(tmp_path), 'training', stand_in_process.pid, server.port)
+  # A file of a process that no longer exists is cleaned up.
+  with open(os.path.join(pool_path, '99999999'), 'w') as file:
+    json.dump(dict(port=1), file)
+
+  pool = TowerfallPool(towerfall_path=str(tmp_path), pool_name='training')
+  towerfall = pool.lease(dict(mode='sandbox'))
+  assert towerfall.port == server.port
+  assert towerfall.pid == stand_in_process.pid
+  assert towerfall.pool_name == 'training'
+  assert list(pool.leases) == [stand_in_process.pid]
+  assert not os.path.exists(os.path.join(pool_path, '99999999'))
+  assert pool.health_check() == []
+
+  server.close()
+  time.sleep(0.1)
+  assert pool.health_check() == [stand_in_process.pid]
+  assert pool.leases == {}
+  stand_in_process.wait(5)
+
+
+def test_release(tmp_path, stand_in_process):
+  server = _ManagementServer()
+  _register(str(tmp_path), 'default', stand_in_process.pid, server.port)
+  pool = TowerfallPool(towerfall_path=str(tmp_path))
+  towerfall = pool.lease(dict(mode='sandbox'))
+  pool.release(towerfall)
+  assert pool.leases == {}
+  server.close()
+
+
+def test_reservation_ends_when_configured(tmp_path, stand_in_process):
+  # Clients created with the pool directly, not through lease, also let the pool hand the process out again.
+  server = _ManagementServer()
+  _register(str(tmp_path), 'default', stand_in_process.pid, server.port)
+  pool = TowerfallPool(towerfall_path=str(tmp_path))
+  towerfall = Towerfall(dict(mode='sandbox'), pool=pool)
+  assert towerfall.pid == stand_in_process.pid
+  assert pool._reserved == {}
+  towerfall.close()
+  _register(str(tmp_path), 'default', stand_in_process.pid, server.port)
+  assert pool.acquire_metadata()['pid'] == stand_in_process.pid
+  server.close()
+
+
+def test_select_metadata():
+  rendering = dict(pid=1, fastrun=False, nographics=False)
+  fast = dict(pid=2, fastrun=True, nographics=False)
+  headless = dict(pid=3, fastrun=True, nographics=True)
+  metadatas = [rendering, fast, headless]
+  assert select_metadata(metadatas, require=dict(nographics=True, fastrun=True)) is headless
+  assert select_metadata([rendering, fast], require=dict(nographics=True)) is None
+  assert select_metadata(metadatas, prefer=dict(fastrun=False)) is rendering
+  # The first preference outweighs the following ones.
+  assert select_metadata(metadatas, prefer=dict(nographics=False, fastrun=True)) is fast
+
+
+def test_lease_with_required_capabilities(tmp_path, stand_in_process):
+  rendering_server = _ManagementServer()
+  headless_server = _ManagementServer()
+  rendering_process = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)'])
+  try:
+    _register(str(tmp_path), 'default', rendering_process.pid, rendering_server.port)
+    _register(str(tmp_path), 'default', stand_in_process.pid, headless_server.port, nographics=True)
+    pool = TowerfallPool(towerfall_path=str(tmp_path))
+    towerfall = pool.lease(dict(mode='sandbox'), require=dict(nographics=True, fastrun=True))
+    assert towerfall.pid == stand_in_process.pid
+    assert towerfall.port == headless_server.port
+    pool.close()
+  finally:
+    rendering_process.kill()
+    rendering_process.wait()
+    rendering_server.close()
+    headless_server.close()
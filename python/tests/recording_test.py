@@ -0,0 +1,183 @@
+import json
+import os
+
+import pytest
+
+from towerfall import ReplayConnection
+from towerfall.codec import StdlibCodec, get_codec, peek_type, peek_update_id
+from towerfall.recording import (RECEIVED, SENT, BinaryRecorder, ReplayReader,
+                                 TextRecorder, ZlibCompressor, get_compressor,
+                                 open_recorder)
+
+
+def _available_compressors():
+  compressors = []
+  for name in ['zstd', 'lz4', 'zlib']:
+    try:
+      compressors.append(get_compressor(name))
+    except ImportError:
+      pass
+  return compressors
+
+
+def _update(update_id: int) -> bytes:
+  return json.dumps(dict(
+    type='update',
+    entities=[dict(type='archer', id=1, pos=dict(x=update_id, y=0))],
+    dt=1.0,
+    id=update_id), separators=(',', ':')).encode('ascii')
+
+
+def _record_episodes(recorder, episodes: int, updates: int):
+  recorder.record(b'{"type":"init","index":0,"version":"0.1"}', RECEIVED)
+  recorder.record(b'{"type":"result","success":true}', SENT)
+  update_id = 0
+  for _ in range(episodes):
+    recorder.mark_episode()
+    for _ in range(updates):
+      recorder.record(_update(update_id), RECEIVED)
+      recorder.record(json.dumps(dict(type='actions', actions='r', id=update_id)).encode('ascii'), SENT)
+      update_id += 1
+
+
+def test_peek_update_id():
+  codec = get_codec()
+  assert peek_update_id(_update(42)) == 42
+  assert peek_update_id(codec.dumps(dict(type='update', id=7, entities=[dict(id=3)]))) == 7
+  assert peek_update_id(b'{"type":"scenario","grid":[]}') is None
+  assert peek_update_id(b'{"type":"actions","actions":"","id":4}') is None
+
+
+class _CountingCodec(StdlibCodec):
+  def __init__(self):
+    self.decoded = 0
+
+  def loads(self, payload: bytes):
+    self.decoded += 1
+    return super().loads(payload)
+
+
+def test_peek_update_id_type_last():
+  # Json.NET in the game writes the inherited type after the fields of the update.
+  codec = _CountingCodec()
+  entities = [dict(pos=dict(x=1, y=2), id=3, isEnemy=True, type='slime'), dict(id=4, type='update', arrows=[])]
+  payload = json.dumps(dict(entities=entities, dt=0.016, id=42, type='update'), separators=(',', ':')).encode('ascii')
+  assert peek_update_id(payload, codec) == 42
+  assert peek_update_id(b'{"grid":[[0,1]],"cellSize":10,"type":"scenario"}', codec) is None
+  assert peek_update_id(b'{"entities":[],"id":5,"dt":1.0,"type":"update"}', codec) == 5
+  assert codec.decoded == 0
+  # Not compact, or id between two arrays: decoded with the codec.
+  assert peek_update_id(json.dumps(dict(entities=entities, id=43, type='update')).encode('ascii'), codec) == 43
+  assert peek_update_id(b'{"entities":[],"id":44,"draws":[],"type":"update"}', codec) == 44
+  assert codec.decoded == 2
+
+
+def test_peek_type():
+  codec = _CountingCodec()
+  assert peek_type(b'{"type":"init","index":0,"version":"0.1"}', codec) == 'init'
+  assert peek_type(b'{"entities":[],"id":5,"dt":1.0,"type":"update"}', codec) == 'update'
+  assert peek_type(_update(3), codec) == 'update'
+  assert codec.decoded == 0
+  assert peek_type(b'{"type": "scenario", "grid": []}', codec) == 'scenario'
+  assert peek_type(b'[]', codec) is None
+  assert codec.decoded == 2
+
+
+@pytest.mark.parametrize('compressor', _available_compressors(), ids=lambda c: c.name)
+def test_replay_reader(tmp_path, compressor):
+  path = str(tmp_path / 'replay.tfr')
+  recorder = BinaryRecorder(path, compressor=compressor, block_size=256)
+  _record_episodes(recorder, episodes=3, updates=10)
+  recorder.close()
+
+  with ReplayReader(path) as reader:
+    assert len(reader) == 2 + 3 * 10 * 2
+    assert reader.n_episodes == 3
+    assert reader.frame(1) == (SENT, -1, b'{"type":"result","success":true}')
+    frame = reader.find_update(25)
+    assert reader.read_json(frame)['id'] == 25
+    assert reader.episode_of(frame) == 2
+    episode = reader.episode_frames(1)
+    assert reader.frame(episode.start).update_id == 10
+    assert reader.frame(episode.stop - 1).direction == SENT
+    assert reader.update_ids() == list(range(30))
+    # Reading backwards crosses block boundaries.
+    assert [reader[i].update_id for i in range(len(reader) - 2, 1, -2)] == list(range(29, -1, -1))
+
+
+def test_replay_reader_without_index(tmp_path):
+  path = str(tmp_path / 'replay.tfr')
+  recorder = BinaryRecorder(path, block_size=256)
+  _record_episodes(recorder, episodes=2, updates=10)
+  recorder.flush()
+  size = os.path.getsize(path)
+  # Simulates a crash before close, which writes the index.
+  recorder._file.close()
+
+  assert os.path.getsize(path) == size
+  with ReplayReader(path) as reader:
+    assert len(reader) == 2 + 2 * 10 * 2
+    assert reader.n_episodes == 1
+    assert reader.read_json(reader.find_update(15))['entities'][0]['pos']['x'] == 15
+
+
+def test_replay_reader_truncated(tmp_path):
+  path = str(tmp_path / 'replay.tfr')
+  recorder = BinaryRecorder(path, block_size=256)
+  # The header is on disk before anything is recorded.
+  with ReplayReader(path) as reader:
+    assert len(reader) == 0 and reader.n_episodes == 0
+  _record_episodes(recorder, episodes=2, updates=10)
+  recorder.close()
+
+  data = (tmp_path / 'replay.tfr').read_bytes()
+  # Cut in the middle of the index: the complete blocks are still read.
+  (tmp_path / 'cut.tfr').write_bytes(data[:-20])
+  with ReplayReader(str(tmp_path / 'cut.tfr')) as reader:
+    assert 0 < len(reader) <= 2 + 2 * 10 * 2
+  for size in [0, 3]:
+    (tmp_path / 'cut.tfr').write_bytes(data[:size])
+    with pytest.raises(ValueError, match='empty or truncated'):
+      ReplayReader(str(tmp_path / 'cut.tfr'))
+
+
+def test_open_recorder(tmp_path):
+  recorder = open_recorder(str(tmp_path / 'replay.tfr'))
+  assert isinstance(recorder, BinaryRecorder)
+  recorder.close()
+  recorder = open_recorder(str(tmp_path / 'replay.json'))
+  assert isinstance(recorder, TextRecorder)
+  recorder.record(b'{}', SENT)
+  recorder.close()
+  assert (tmp_path / 'replay.json').read_bytes() == b'{}\n'
+
+
+class _CountingCompressor(ZlibCompressor):
+  def __init__(self):
+    super().__init__()
+    self.decompressed = 0
+
+  def decompress(self, data: bytes, raw_size: int) -> bytes:
+    self.decompressed += 1
+    return super().decompress(data, raw_size)
+
+
+def test_replay_connection_lazy(tmp_path):
+  path = str(tmp_path / 'replay.tfr')
+  recorder = BinaryRecorder(path, compressor=ZlibCompressor(), block_size=256)
+  _record_episodes(recorder, episodes=4, updates=10)
+  recorder.close()
+
+  connection = ReplayConnection(path)
+  compressor = _CountingCompressor()
+  connection._reader.compressor = compressor
+  assert len(connection) == 1 + 4 * 10
+  assert connection.read_json()['type'] == 'init'
+  assert connection.read_json()['id'] == 0
+  # Skips the rest of the first episode without reading it.
+  connection.mark_episode()
+  assert connection.read_json()['id'] == 10
+  # Only the blocks of the three frames served are decompressed, out of about 20.
+  assert compressor.decompressed <= 3
+  connection.close()
+  assert not connection.is_open()
@@ -0,0 +1,58 @@
+import os
+import subprocess
+import sys
+from functools import partial
+from multiprocessing import shared_memory
+
+import numpy as np
+import pytest
+from conftest import _CONFIG
+
+from gym_wrapper import (KillEnemyObjective, PlayerObservation,
+                         TowerfallBlankEnv, TowerfallSubprocVecEnv)
+from towerfall import Towerfall
+
+def _create_env(towerfall_path: str, preallocate: bool) -> TowerfallBlankEnv:
+  return TowerfallBlankEnv(
+    towerfall=Towerfall(_CONFIG, towerfall_path=towerfall_path, pool_name='fake'),
+    observations=[PlayerObservation()],
+    objective=KillEnemyObjective(enemy_count=2, episode_max_len=20),
+    preallocate=preallocate)
+
+
+@pytest.mark.parametrize('preallocate', [False, True])
+def test_subproc_vec_env_against_fake_servers(fake_servers, preallocate):
+  towerfall_path = fake_servers(2)
+  vec_env = TowerfallSubprocVecEnv([partial(_create_env, towerfall_path, preallocate)] * 2)
+  try:
+    obs = vec_env.reset()
+    assert set(obs) == set(vec_env.observation_space.spaces)
+    assert all(value.shape[0] == 2 for value in obs.values())
+    assert vec_env.get_attr('frame') == [0, 0]
+    assert vec_env.get_attr('preallocate', indices=[1]) == [preallocate]
+
+    resets = 0
+    for _ in range(30):
+      obs, rewards, dones, infos = vec_env.step(np.stack([vec_env.action_space.sample() for _ in range(2)]))
+      assert rewards.shape == (2,) and dones.shape == (2,)
+      frames = vec_env.get_attr('frame')
+      for i, (done, info) in enumerate(zip(dones, infos)):
+        assert done == ('terminal_observation' in info)
+        if done:
+          # Workers reset as soon as the episode ends, and the terminal observation is a copy of the last one.
+          assert frames[i] == 0
+          assert set(info['terminal_observation']) == set(obs)
+          resets += 1
+    assert resets > 0
+  finally:
+    vec_env.close()
+
+  assert all(not process.is_alive() for process in vec_env._processes)
+  with pytest.raises(FileNotFoundError):
+    shared_memory.SharedMemory(name=vec_env._shm.name)
+
+
+def test_import_without_cloudpickle():
+  # cloudpickle is only needed once environments are sent to the workers.
+  code = 'import sys; sys.modules["cloudpickle"] = None; import gym_wrapper; gym_wrapper.TowerfallBlankEnv'
+  subprocess.run([sys.executable, '-c', code], check=True, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+
+from gym_wrapper import TowerfallBlankEnv, TowerfallVecEnv
+from gym_wrapper.vec_env import copy_obs
+from towerfall import ReplayConnection
+
+
+@pytest.mark.parametrize('pipeline', [False, True])
+def test_vec_env_against_fake_servers(fake_servers, create_env, pipeline):
+  towerfall_path = fake_servers(2)
+  vec_env = TowerfallVecEnv([lambda: create_env(towerfall_path, pipeline=pipeline)] * 2)
+  vec_env.reset()
+  pids = {env.towerfall.pid for env in vec_env.envs}
+  assert len(pids) == 2
+  resets = 0
+  for _ in range(30):
+    _, rewards, dones, infos = vec_env.step(np.stack([vec_env.action_space.sample() for _ in range(2)]))
+    assert rewards.shape == (2,) and dones.shape == (2,)
+    for env, done, info in zip(vec_env.envs, dones, infos):
+      assert done == ('terminal_observation' in info)
+      if done:
+        # Reset along with the other environments that ended in the same step.
+        assert env.frame == 0 and len(env.entity_index.of_type('slime')) == 2
+        resets += 1
+  assert resets > 0
+  vec_env.close()
+
+
+class _FixedResetEnv(TowerfallBlankEnv):
+  sent_resets = 0
+
+  def _send_reset(self):
+    self.sent_resets += 1
+    self.towerfall.send_reset([dict(type='archer', pos=dict(x=160, y=110)), dict(type='slime', pos=dict(x=100, y=105))])
+
+
+def test_send_reset_override(fake_servers, create_env):
+  towerfall_path = fake_servers(2)
+  vec_env = TowerfallVecEnv([lambda: create_env(towerfall_path, env_class=_FixedResetEnv)] * 2)
+  vec_env.reset()
+  for _ in range(30):
+    vec_env.step(np.stack([vec_env.action_space.sample() for _ in range(2)]))
+    for env in vec_env.envs:
+      if env.frame == 0:
+        assert len(env.entity_index.of_type('slime')) == 1
+  assert all(env.sent_resets > 1 for env in vec_env.envs)
+  vec_env.close()
+
+
+@pytest.mark.parametrize('preallocate', [False, True])
+def test_vec_env_matches_single_env(fake_servers, create_env, tmp_path, preallocate):
+  record_path = str(tmp_path / 'replay.tfr')
+  env = create_env(fake_servers(n_entities=5), record_path=record_path)
+  actions = [env.action_space.sample() for _ in range(60)]
+  recorded = [copy_obs(env.reset())]
+  terminal = {}
+  for i, action in enumerate(actions):
+    obs, _, done, _ = env.step(action)
+    if done:
+      terminal[i] = copy_obs(obs)
+      obs = env.reset()
+    recorded.append(copy_obs(obs))
+  env.connection.close()
+  assert terminal
+
+  # Both environments replay the same recording, so every row of the batch matches the single environment.
+  vec_env = TowerfallVecEnv([lambda: create_env(None, connection=ReplayConnection(record_path), preallocate=preallocate)] * 2)
+  obs = vec_env.reset()
+  for i, action in enumerate(actions):
+    for key, value in recorded[i].items():
+      assert np.array_equal(obs[key], np.stack([value] * 2))
+    obs, _, dones, infos = vec_env.step(np.stack([action] * 2))
+    assert list(dones) == [i in terminal] * 2
+    for info in infos:
+      if i in terminal:
+        for key, value in terminal[i].items():
+          assert np.array_equal(info['terminal_observation'][key], value)
+  for key, value in recorded[-1].items():
+    assert np.array_equal(obs[key], np.stack([value] * 2))
+  vec_env.close()
@@ -1,7 +1,28 @@
+from .async_connection import AsyncConnection
+from .async_towerfall import AsyncTowerfall
+from .codec import Codec, get_codec
 from .connection import Connection
-from .towerfall import Towerfall
+from .multi_agent_runner import FrameStats, MultiAgentRunner
+from .pool import TowerfallPool
+from .pool_index import PoolIndex, get_pool_index
+from .recording import BinaryRecorder, ReplayReader
+from .replay_connection import ReplayConnection
+from .towerfall import Towerfall, TowerfallError
 
 __all__ = [
+  'AsyncConnection',
+  'AsyncTowerfall',
+  'BinaryRecorder',
+  'Codec',
   'Connection',
+  'FrameStats',
+  'MultiAgentRunner',
+  'PoolIndex',
+  'ReplayConnection',
+  'ReplayReader',
   'Towerfall',
+  'TowerfallError',
+  'TowerfallPool',
+  'get_codec',
+  'get_pool_index',
 ]
@@ -0,0 +1,162 @@
+import asyncio
+import logging
+from typing import Any, Callable, Mapping, Optional
+
+from .codec import Codec, get_codec
+from .connection import (_BYTE_ORDER, _ENCODING, _HEADER_SIZE, _LOCALHOST,
+                         _MAX_MESSAGE_SIZE)
+from .recording import RECEIVED, SENT, Recorder, open_recorder
+
+
+class AsyncConnection:
+  '''
+  Asyncio counterpart of Connection. It is used to send and receive messages without blocking the event loop.
+  Use AsyncConnection.open to create one.
+
+  params reader: Stream reader of the socket.
+  params writer: Stream writer of the socket.
+  params port: Port of the server.
+  params timeout: Timeout in seconds for each read. 0 means no timeout.
+  params verbose: Verbosity level. 0: no logging, 1: much logging.
+  params log_cap: Maximum number of characters to log.
+  params record_path: Path to a file to record the messages sent and received. Paths ending with .tfr use the compressed
+    binary format that ReplayReader reads, any other path gets one json message per line.
+  params codec: Json codec used by read_json and send_json. If None, the fastest installed codec is used.
+  '''
+  def __init__(self,
+      reader: asyncio.StreamReader,
+      writer: asyncio.StreamWriter,
+      port: int,
+      timeout: float = 0,
+      verbose=0,
+      log_cap=100,
+      record_path: Optional[str] = None,
+      codec: Optional[Codec] = None):
+    self.verbose = verbose
+    self.log_cap = log_cap
+    self.record_path = record_path
+    self.codec = codec if codec else get_codec()
+    self.port = port
+    self.timeout = timeout
+    self.on_close: Callable
+    self._reader = reader
+    self._writer = writer
+    self._recorder: Optional[Recorder] = None
+    # Size read from the header of a frame whose payload is still to be read, when a read is cancelled in between.
+    self._pending_size: Optional[int] = None
+
+  @classmethod
+  async def open(cls, port: int, ip: str = _LOCALHOST, timeout: float = 0, verbose=0, log_cap=100, record_path=None, codec: Optional[Codec] = None) -> 'AsyncConnection':
+    '''
+    Opens a connection to a Towerfall server.
+    '''
+    reader, writer = await asyncio.open_connection(ip, port)
+    return cls(reader, writer, port, timeout=timeout, verbose=verbose, log_cap=log_cap, record_path=record_path, codec=codec)
+
+  async def close(self):
+    '''
+    Closes the socket.
+    '''
+    if not self._writer.is_closing():
+      if self.verbose > 0:
+        logging.info('Closing socket')
+      self._writer.close()
+      try:
+        await self._writer.wait_closed()
+      except ConnectionError:
+        pass
+    if self._recorder:
+      self._recorder.close()
+      self._recorder = None
+    if hasattr(self, 'on_close'):
+      self.on_close()
+
+  async def write(self, msg: str):
+    '''
+    Writes a new message following the game's protocol.
+    '''
+    await self.write_bytes(msg.encode(_ENCODING))
+
+  async def write_bytes(self, payload: bytes):
+    '''
+    Writes an already encoded message following the game's protocol.
+    '''
+    size = len(payload)
+    if self.verbose > 0:
+      logging.info('Writing: %sB %s', size, self._cap(payload.decode(_ENCODING)))
+    if size > _MAX_MESSAGE_SIZE:
+      raise ValueError(f'Message exceeds limit of {_MAX_MESSAGE_SIZE}B: {size}B')
+    self._writer.write(size.to_bytes(_HEADER_SIZE, byteorder=_BYTE_ORDER) + payload)
+    await self._writer.drain()
+    if self.record_path:
+      self._get_recorder().record(payload, SENT)
+
+  async def read(self) -> str:
+    '''
+    Reads a message following the game's protocol.
+    '''
+    return (await self.read_bytes()).decode(_ENCODING)
+
+  async def read_bytes(self) -> bytes:
+    '''
+    Reads a message following the game's protocol without decoding it.
+    '''
+    if self.timeout:
+      try:
+        payload = await asyncio.wait_for(self._read_frame(), self.timeout)
+      except asyncio.TimeoutError as ex:
+        logging.error(f'Socket timeout on port {self.port}')
+        raise ex
+    else:
+      payload = await self._read_frame()
+    if self.verbose > 0:
+      logging.info('Read: %dB %s', len(payload), self._cap(payload.decode(_ENCODING)))
+    if self.record_path:
+      self._get_recorder().record(payload, RECEIVED)
+    return payload
+
+  async def read_json(self) -> Mapping[str, Any]:
+    '''
+    Reads a message and parses it to json.
+    '''
+    return self.codec.loads(await self.read_bytes())
+
+  async def send_json(self, obj: Mapping[str, Any]):
+    '''
+    Convert the object to json and writes it.
+    '''
+    await self.write_bytes(self.codec.dumps(obj))
+
+  async def _read_frame(self) -> bytes:
+    '''
+    readexactly only consumes the stream once all the bytes are there, so a read cancelled by a timeout resumes at the header
+    or, if the header was already read, at the payload of the same frame.
+    '''
+    try:
+      if self._pending_size is None:
+        header = await self._reader.readexactly(_HEADER_SIZE)
+        size = int.from_bytes(header, _BYTE_ORDER)
+        if size == 0:
+          raise ConnectionError('Connection is closed')
+        self._pending_size = size
+      payload = await self._reader.readexactly(self._pending_size)
+      self._pending_size = None
+      return payload
+    except asyncio.IncompleteReadError as ex:
+      raise ConnectionError('Connection is closed') from ex
+
+  def mark_episode(self):
+    '''
+    Marks in the recording that the next update starts an episode.
+    '''
+    if self.record_path:
+      self._get_recorder().mark_episode()
+
+  def _get_recorder(self) -> Recorder:
+    if not self._recorder:
+      assert self.record_path
+      self._recorder = open_recorder(self.record_path, self.codec)
+    return self._recorder
+
+  def _cap(self, value: str) -> str:
+    return value[:self.log_cap] + '...' if len(value) > self.log_cap else value
@@ -0,0 +1,115 @@
+import asyncio
+import logging
+from typing import TYPE_CHECKING, Any, Dict, List, Mapping, Optional
+
+from .async_connection import AsyncConnection
+from .towerfall import (_DEFAULT_POOL_NAME, _DEFAULT_STEAM_PATH_WINDOWS,
+                        TowerfallError, _TowerfallBase)
+
+if TYPE_CHECKING:
+  from .pool import TowerfallPool
+
+
+class AsyncTowerfall(_TowerfallBase):
+  '''
+  Asyncio counterpart of Towerfall. Creates or reuses a Towerfall game process. Use AsyncTowerfall.create to create one.
+
+  params towerfall_path: The parent path where Towerfall.exe is located.
+  params timeout: The timeout for the management API (Config, Reset).
+  params verbose: The verbosity level. 0: no logging, 1: much logging.
+  params pool_name: The pool to take the process from.
+  params pool: If set, the process is leased from this pool, which also determines towerfall_path and pool_name.
+  params require: Capabilities the process must have, like dict(nographics=True, fastrun=True).
+  params prefer: Capabilities to prefer when several processes qualify, in order of priority.
+  '''
+  def __init__(self,
+      config: Mapping[str, Any] = {},
+      towerfall_path: str = _DEFAULT_STEAM_PATH_WINDOWS,
+      timeout: float = 2,
+      verbose: int = 0,
+      pool_name: str = _DEFAULT_POOL_NAME,
+      pool: Optional['TowerfallPool'] = None,
+      require: Mapping[str, Any] = {},
+      prefer: Mapping[str, Any] = {}):
+    super().__init__(config, towerfall_path, timeout, verbose, pool_name, pool, require, prefer)
+    self.open_connection: AsyncConnection
+
+  @classmethod
+  async def create(cls,
+      config: Mapping[str, Any] = {},
+      towerfall_path: str = _DEFAULT_STEAM_PATH_WINDOWS,
+      timeout: float = 2,
+      verbose: int = 0,
+      pool_name: str = _DEFAULT_POOL_NAME,
+      pool: Optional['TowerfallPool'] = None,
+      require: Mapping[str, Any] = {},
+      prefer: Mapping[str, Any] = {}) -> 'AsyncTowerfall':
+    '''
+    Attains a game process and sends the configuration to it.
+    '''
+    towerfall = cls(config, towerfall_path, timeout, verbose, pool_name, pool, require, prefer)
+    tries = 0
+    while True:
+      # Process discovery touches the file system and may wait for a new process to start.
+      towerfall.port = await asyncio.to_thread(towerfall._attain_game_port)
+
+      try:
+        towerfall.open_connection = await AsyncConnection.open(towerfall.port, timeout=timeout, verbose=verbose)
+        await towerfall.send_config(config)
+        towerfall._end_reservation()
+        break
+      except TowerfallError:
+        if tries > 3:
+          raise TowerfallError('Could not config a Towerfall process.')
+        tries += 1
+    return towerfall
+
+  async def join(self, timeout: float = 2, verbose: int = 0) -> AsyncConnection:
+    '''
+    Joins a towerfall game.
+
+    params timeout: Timeout in seconds to wait for a response. The same timeout will be used on calls to get the observations.
+
+    returns: A connection to a Towerfall game. This should be used by the agent to interact with the game.
+    '''
+    connection = await AsyncConnection.open(self.port, timeout=timeout, verbose=verbose)
+    await connection.send_json(dict(type='join'))
+    response = await connection.read_json()
+    self._check_response(response, 'join the game')
+    self._try_log(logging.info, f'Successfully joined the game. Port: {self.port}')
+    return connection
+
+  async def send_reset(self, entities: Optional[List[Dict[str, Any]]] = None):
+    '''
+    Sends a game reset. This will recreate the entities in the game in the same scenario. To change the scenario, use send_config.
+
+    params entities: The entities to reset. If None, the entities specified in the last reset will be used.
+    '''
+    response = await self.send_request_json(dict(type='reset', entities=entities))
+    self._check_response(response, 'reset the game')
+    self._try_log(logging.info, f'Successfully reset the game. Port: {self.port}')
+
+  async def send_config(self, config = None):
+    '''
+    Sends a game configuration. This will restart the session of the game in the specified scenario and specified number of agents.
+
+    params config: The configuration to send. If None, the configuration specified in the last config will be used.
+    '''
+    if config:
+      self.config = config
+    else:
+      config = self.config
+
+    response = await self.send_request_json(dict(type='config', config=config))
+    self._check_response(response, 'configure the game')
+    self.config = config
+
+  async def send_request_json(self, obj: Mapping[str, Any]):
+    await self.open_connection.send_json(obj)
+    return await self.open_connection.read_json()
+
+  async def close(self):
+    '''
+    Close the management connection. This will free the Towerfall process to be used by other clients.
+    '''
+    await self.open_connection.close()
@@ -0,0 +1,243 @@
+import json
+import re
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Optional
+
+_NON_ASCII = re.compile('[^\\x00-\\x7f]')
+
+
+def _escape_char(match: re.Match) -> str:
+  code = ord(match.group())
+  if code < 0x10000:
+    return f'\\u{code:04x}'
+  code -= 0x10000
+  return f'\\u{0xd800 + (code >> 10):04x}\\u{0xdc00 + (code & 0x3ff):04x}'
+
+
+def _escape_non_ascii(payload: bytes) -> bytes:
+  '''
+  Replaces the non ASCII characters of a UTF-8 json payload with \\u escapes. They can only be in strings.
+  '''
+  if payload.isascii():
+    return payload
+  return _NON_ASCII.sub(_escape_char, payload.decode('utf-8')).encode('ascii')
+
+
+class Codec(ABC):
+  '''
+  Encodes and decodes the json messages of the agent protocol. Payloads are bytes as they go through the socket.
+  dumps gives ASCII payloads, since the game decodes messages as ASCII.
+  '''
+  name: str
+
+  @abstractmethod
+  def loads(self, payload: bytes) -> Any:
+    raise NotImplementedError
+
+  @abstractmethod
+  def dumps(self, obj: Any) -> bytes:
+    raise NotImplementedError
+
+
+class StdlibCodec(Codec):
+  name = 'json'
+
+  def loads(self, payload: bytes) -> Any:
+    return json.loads(payload)
+
+  def dumps(self, obj: Any) -> bytes:
+    return json.dumps(obj, separators=(',', ':')).encode('ascii')
+
+
+class OrjsonCodec(Codec):
+  name = 'orjson'
+
+  def __init__(self):
+    import orjson
+    self._orjson = orjson
+
+  def loads(self, payload: bytes) -> Any:
+    return self._orjson.loads(payload)
+
+  def dumps(self, obj: Any) -> bytes:
+    # Numpy scalars and arrays show up in draws and reset entities built by the gym wrapper.
+    return _escape_non_ascii(self._orjson.dumps(obj, option=self._orjson.OPT_SERIALIZE_NUMPY))
+
+
+class UjsonCodec(Codec):
+  name = 'ujson'
+
+  def __init__(self):
+    import ujson
+    self._ujson = ujson
+
+  def loads(self, payload: bytes) -> Any:
+    return self._ujson.loads(payload)
+
+  def dumps(self, obj: Any) -> bytes:
+    return self._ujson.dumps(obj, ensure_ascii=True).encode('ascii')
+
+
+class MsgspecCodec(Codec):
+  name = 'msgspec'
+
+  def __init__(self):
+    import msgspec
+    self._decoder = msgspec.json.Decoder()
+    self._encoder = msgspec.json.Encoder()
+
+  def loads(self, payload: bytes) -> Any:
+    return self._decoder.decode(payload)
+
+  def dumps(self, obj: Any) -> bytes:
+    return _escape_non_ascii(self._encoder.encode(obj))
+
+
+# Ordered by preference when no codec is requested explicitly.
+_CODECS = [OrjsonCodec, MsgspecCodec, UjsonCodec, StdlibCodec]
+
+
+def get_codec(name: Optional[str] = None) -> Codec:
+  '''
+  Gets a codec by name. If name is None, the fastest installed codec is used, falling back to the stdlib json.
+
+  params name: One of 'orjson', 'msgspec', 'ujson', 'json'.
+  '''
+  for codec_cls in _CODECS:
+    if name and codec_cls.name != name:
+      continue
+    try:
+      return codec_cls()
+    except ImportError:
+      if name:
+        raise
+  raise ValueError(f'Unknown codec: {name}')
+
+
+_QUOTE = ord('"')
+_BACKSLASH = ord('\\')
+_OPEN = b'{['
+_CLOSE = b'}]'
+_SCALAR_END = b',}'
+_default_codec: Optional[Codec] = None
+
+
+def _leading_fields(payload: bytes, fields: Dict[bytes, bytes]) -> bool:
+  '''
+  Adds the top level fields with scalar values at the start of a compact json object, up to the first array or object.
+
+  returns: False if the payload doesn't have the expected shape.
+  '''
+  pos = 1
+  n = len(payload)
+  while pos < n and payload[pos] == _QUOTE:
+    key_end = payload.find(b'":', pos + 1)
+    if key_end < 0:
+      return False
+    key = payload[pos + 1:key_end]
+    value_start = key_end + 2
+    if value_start >= n or payload[value_start] in _OPEN:
+      return True
+    if payload[value_start] == _QUOTE:
+      value_end = payload.find(b'"', value_start + 1) + 1
+      if value_end <= 0 or payload[value_end - 2] == _BACKSLASH:
+        return False
+    else:
+      value_end = value_start
+      while value_end < n and payload[value_end] not in _SCALAR_END:
+        value_end += 1
+    fields[key] = payload[value_start:value_end]
+    if value_end >= n or payload[value_end] not in _SCALAR_END:
+      return False
+    if payload[value_end] == _CLOSE[0]:
+      return True
+    pos = value_end + 1
+  return True
+
+
+def _trailing_fields(payload: bytes, fields: Dict[bytes, bytes]) -> bool:
+  '''
+  Adds the top level fields with scalar values at the end of a compact json object, back to the last array or object.
+
+  returns: False if the payload doesn't have the expected shape.
+  '''
+  end = len(payload) - 1
+  while end > 0:
+    last = payload[end - 1]
+    if last in _CLOSE:
+      return True
+    if last == _QUOTE:
+      value_start = payload.rfind(b'"', 0, end - 1)
+      if value_start <= 0 or payload[value_start - 1] == _BACKSLASH:
+        return False
+    else:
+      value_start = payload.rfind(b':', 0, end) + 1
+      if value_start <= 0:
+        return False
+    value = payload[value_start:end]
+    if payload[value_start - 2:value_start] != b'":':
+      return False
+    key_start = payload.rfind(b'"', 0, value_start - 2)
+    if key_start <= 0:
+      return False
+    fields.setdefault(payload[key_start + 1:value_start - 2], value)
+    separator = payload[key_start - 1]
+    if separator == _OPEN[0]:
+      return True
+    if separator != ord(','):
+      return False
+    end = key_start - 1
+  return False
+
+
+def peek_update_id(payload: bytes, codec: Optional[Codec] = None) -> Optional[int]:
+  '''
+  Reads the id of an update message without decoding it, or returns None if the payload is not an update.
+
+  The top level fields with scalar values are read from both ends of the object, so it doesn't matter whether type and id
+  come before the entities, as the fake server writes them, or after, as Json.NET in the game does. Payloads that are not
+  compact or have these fields between two arrays are decoded with codec, or the default codec if None.
+  '''
+  fields = _peek_fields(payload)
+  if fields is not None:
+    type = fields.get(b'type')
+    if type is not None:
+      if type != b'"update"':
+        return None
+      id = fields.get(b'id')
+      if id is not None and id.isdigit():
+        return int(id)
+  msg = _or_default(codec).loads(payload)
+  return msg['id'] if isinstance(msg, dict) and msg.get('type') == 'update' else None
+
+
+def peek_type(payload: bytes, codec: Optional[Codec] = None) -> Optional[str]:
+  '''
+  Reads the type of a message without decoding it, or returns None if it has none. Fields are found like in peek_update_id.
+  '''
+  fields = _peek_fields(payload)
+  if fields is not None:
+    type = fields.get(b'type')
+    if type is not None and type[:1] == b'"' and b'\\' not in type:
+      return type[1:-1].decode('ascii')
+  msg = _or_default(codec).loads(payload)
+  return msg.get('type') if isinstance(msg, dict) else None
+
+
+def _peek_fields(payload: bytes) -> Optional[Dict[bytes, bytes]]:
+  '''
+  The top level scalar fields of a compact json object, read from both ends. None if the payload can't be read that way.
+  '''
+  fields: Dict[bytes, bytes] = {}
+  if payload[:1] == b'{' and payload[-1:] == b'}' and _leading_fields(payload, fields) and _trailing_fields(payload, fields):
+    return fields
+  return None
+
+
+def _or_default(codec: Optional[Codec]) -> Codec:
+  global _default_codec
+  if codec is not None:
+    return codec
+  if _default_codec is None:
+    _default_codec = get_codec()
+  return _default_codec
@@ -1,11 +1,18 @@
-import json
 import logging
+import select
 import socket
-from typing import Any, Callable, Mapping
+from typing import Any, Callable, Mapping, Optional
+
+from .codec import Codec, get_codec
+from .recording import RECEIVED, SENT, Recorder, open_recorder
 
 _BYTE_ORDER = 'big'
 _ENCODING = 'ascii'
 _LOCALHOST = '127.0.0.1'
+_HEADER_SIZE = 2
+_MAX_MESSAGE_SIZE = (1 << 8 * _HEADER_SIZE) - 1
+# Large enough to always fit a full frame after compaction, so a message is never split across refills.
+_READ_BUFFER_SIZE = 2 * (_HEADER_SIZE + _MAX_MESSAGE_SIZE)
 
 class Connection:
   '''
@@ -16,18 +23,31 @@ class Connection:
   params timeout: Timeout for the socket.
   params verbose: Verbosity level. 0: no logging, 1: much logging.
   params log_cap: Maximum number of characters to log.
-  params record_path: Path to a file to record the messages sent and received.
+  params record_path: Path to a file to record the messages sent and received. Paths ending with .tfr use the compressed
+    binary format that ReplayReader reads, any other path gets one json message per line.
+  params codec: Json codec used by read_json and send_json. If None, the fastest installed codec is used.
   '''
-  def __init__(self, port: int, ip: str = _LOCALHOST, timeout: float = 0, verbose=0, log_cap=100, record_path=None):
+  def __init__(self, port: int, ip: str = _LOCALHOST, timeout: float = 0, verbose=0, log_cap=100, record_path=None, codec: Optional[Codec] = None):
     self.verbose = verbose
+    self.codec = codec if codec else get_codec()
     self.log_cap = log_cap
+    self._record_path: Optional[str] = None
+    self._recorder: Optional[Recorder] = None
     self.record_path = record_path
     self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    # Each message goes out in a single send, so there is nothing for Nagle to coalesce.
+    self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
     self._socket.connect((ip, port))
     if timeout:
       self._socket.settimeout(timeout)
     self.port = port
     self.on_close: Callable
+    self._read_buffer = bytearray(_READ_BUFFER_SIZE)
+    self._read_view = memoryview(self._read_buffer)
+    self._read_start = 0
+    self._read_end = 0
+    self._write_buffer = bytearray(_HEADER_SIZE + _MAX_MESSAGE_SIZE)
+    self._write_view = memoryview(self._write_buffer)
 
   def __del__(self):
     self.close()
@@ -41,40 +61,72 @@ class Connection:
         logging.info('Closing socket')
       self._socket.close()
       del self._socket
+    self.record_path = None
     if hasattr(self, 'on_close'):
       self.on_close()
 
+  @property
+  def record_path(self) -> Optional[str]:
+    return self._record_path
+
+  @record_path.setter
+  def record_path(self, value: Optional[str]):
+    '''
+    Changing the path closes the current recording file. The new one is opened lazily on the next message.
+    '''
+    if self._recorder:
+      self._recorder.close()
+      self._recorder = None
+    self._record_path = value
+
+  def mark_episode(self):
+    '''
+    Marks in the recording that the next update starts an episode.
+    '''
+    if self._record_path:
+      self._get_recorder().mark_episode()
+
   def write(self, msg: str):
     '''
     Writes a new message following the game's protocol.
     '''
-    size = len(msg)
+    self.write_bytes(msg.encode(_ENCODING))
+
+  def write_bytes(self, payload: bytes):
+    '''
+    Writes an already encoded message following the game's protocol.
+    '''
+    size = len(payload)
     if self.verbose > 0:
-      logging.info('Writing: %sB %s', size, self._cap(msg))
+      logging.info('Writing: %sB %s', size, self._cap(payload.decode(_ENCODING)))
+    if size > _MAX_MESSAGE_SIZE:
+      raise ValueError(f'Message exceeds limit of {_MAX_MESSAGE_SIZE}B: {size}B')
 
-    self._socket.sendall(size.to_bytes(2, byteorder=_BYTE_ORDER))
-    self._socket.sendall(msg.encode(_ENCODING))
-    if self.record_path:
-      with open(self.record_path, 'a') as file:
-        file.write(msg + '\n')
+    # Header and payload are assembled in one buffer so the frame goes out in a single send.
+    end = _HEADER_SIZE + size
+    self._write_view[:_HEADER_SIZE] = size.to_bytes(_HEADER_SIZE, byteorder=_BYTE_ORDER)
+    self._write_view[_HEADER_SIZE:end] = payload
+    self._socket.sendall(self._write_view[:end])
+    if self._record_path:
+      self._get_recorder().record(payload, SENT)
 
   def read(self) -> str:
     '''
     Reads a message following the game's protocol.
     '''
+    return self.read_bytes().decode(_ENCODING)
+
+  def read_bytes(self) -> bytes:
+    '''
+    Reads a message following the game's protocol without decoding it.
+    '''
     try:
-      header: bytes = self._socket.recv(2)
-      size = int.from_bytes(header, _BYTE_ORDER)
-      if size == 0:
-        raise ConnectionError('Connection is closed')
-      payload = self._socket.recv(size)
-      resp = payload.decode(_ENCODING)
+      payload = self._read_frame()
       if self.verbose > 0:
-        logging.info('Read: %dB %s', size, self._cap(resp))
-      if self.record_path:
-        with open(self.record_path, 'a') as file:
-          file.write(resp + '\n')
-      return resp
+        logging.info('Read: %dB %s', len(payload), self._cap(payload.decode(_ENCODING)))
+      if self._record_path:
+        self._get_recorder().record(payload, RECEIVED)
+      return payload
     except socket.timeout as ex:
       logging.error(f'Socket timeout {self._socket.getsockname()}')
       raise ex
@@ -83,13 +135,91 @@ class Connection:
     '''
     Reads a message and parses it to json.
     '''
-    return json.loads(self.read())
+    return self.codec.loads(self.read_bytes())
 
   def send_json(self, obj: Mapping[str, Any]):
     '''
     Convert the object to json and writes it.
     '''
-    self.write(json.dumps(obj))
+    self.write_bytes(self.codec.dumps(obj))
+
+  def _get_recorder(self) -> Recorder:
+    if not self._recorder:
+      assert self._record_path
+      self._recorder = open_recorder(self._record_path, self.codec)
+    return self._recorder
+
+  def fileno(self) -> int:
+    '''
+    File descriptor of the socket, so the connection can be waited on with selectors.
+    '''
+    return self._socket.fileno()
+
+  def is_open(self) -> bool:
+    '''
+    Checks without blocking whether the peer closed the connection.
+    '''
+    if not hasattr(self, '_socket'):
+      return False
+    try:
+      readable, _, _ = select.select([self._socket], [], [], 0)
+      if not readable:
+        return True
+      return bool(self._socket.recv(1, socket.MSG_PEEK))
+    except (OSError, ValueError):
+      return False
+
+  def has_frame(self) -> bool:
+    '''
+    Whether a complete message is already buffered and can be read without touching the socket.
+    '''
+    available = self._read_end - self._read_start
+    if available < _HEADER_SIZE:
+      return False
+    size = int.from_bytes(self._read_view[self._read_start:self._read_start + _HEADER_SIZE], _BYTE_ORDER)
+    return available >= _HEADER_SIZE + size
+
+  def receive_available(self):
+    '''
+    Receives into the read buffer with a single recv. Only blocks if no data is available, so call it once the socket is readable.
+    '''
+    self._fill_read_buffer()
+
+  def _read_frame(self) -> bytes:
+    '''
+    Slices the next complete frame out of the read buffer, receiving more data from the socket as needed.
+    '''
+    while True:
+      start = self._read_start
+      available = self._read_end - start
+      if available >= _HEADER_SIZE:
+        size = int.from_bytes(self._read_view[start:start + _HEADER_SIZE], _BYTE_ORDER)
+        if size == 0:
+          raise ConnectionError('Connection is closed')
+        end = start + _HEADER_SIZE + size
+        if available >= _HEADER_SIZE + size:
+          payload = bytes(self._read_view[start + _HEADER_SIZE:end])
+          if end == self._read_end:
+            self._read_start = self._read_end = 0
+          else:
+            self._read_start = end
+          return payload
+      self._fill_read_buffer()
+
+  def _fill_read_buffer(self):
+    '''
+    Receives as many bytes as are available into the free tail of the read buffer.
+    '''
+    if self._read_start > 0 and self._read_end > len(self._read_buffer) // 2:
+      # Moves the pending partial frame to the front to make room for the rest of it.
+      pending = self._read_end - self._read_start
+      self._read_view[:pending] = self._read_view[self._read_start:self._read_end]
+      self._read_start = 0
+      self._read_end = pending
+    n = self._socket.recv_into(self._read_view[self._read_end:])
+    if n == 0:
+      raise ConnectionError('Connection is closed')
+    self._read_end += n
 
   def _cap(self, value: str) -> str:
     return value[:self.log_cap] + '...' if len(value) > self.log_cap else value
@@ -0,0 +1,536 @@
+import argparse
+import json
+import logging
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Mapping, Optional
+
+from .codec import Codec, get_codec
+from .connection import _BYTE_ORDER, _HEADER_SIZE, _LOCALHOST
+from .towerfall import _DEFAULT_POOL_NAME, TowerfallError, get_pool_path
+
+_VERSION = '0.1.1'
+_WIDTH = 320
+_HEIGHT = 240
+_CELL_SIZE = 10
+_GROUND_Y = 110
+_MAX_AGENTS = 4
+_ARCHER_SIZE = dict(x=8, y=14)
+_ENEMY_SIZE = dict(x=10, y=10)
+_ARROW_SIZE = dict(x=8, y=2)
+_RUN_SPEED = 2
+_JUMP_SPEED = 3
+_GRAVITY = 0.3
+_ENEMY_SPEED = 0.3
+_SHOOT_RANGE = 100
+
+
+class _Session:
+  '''
+  The state of a match, from a config request to the next one.
+  '''
+  def __init__(self, config: Mapping[str, Any], n_connections: int):
+    self.config = config
+    self.n_connections = n_connections
+    self.connections: List[socket.socket] = []
+    self.stop = threading.Event()
+
+
+class FakeTowerfallServer:
+  '''
+  Pure Python stand-in for a Towerfall process. Implements the same protocol as the game: it registers its metadata in the
+  pool directory, accepts join, config and reset requests, and streams init, scenario and update messages to the agents.
+  The simulation is minimal: archers run, jump and shoot, enemies walk towards the closest archer and kill it on contact.
+  This is meant for tests and for measuring the Python stack without TowerFall.exe.
+
+  params towerfall_path: The path whose pool directory the server registers in. If None, it does not register, and clients
+    need to be given the port.
+  params pool_name: The pool to register in.
+  params n_entities: Number of extra entities in every update besides the archers and the reset entities. They are arrows
+    flying around, which agents and objectives ignore.
+  params fps: Frames per second. If None, the fps in the config is used, like the game does. 0 means as fast as agents reply.
+  params fastrun: Reported in the metadata file.
+  params nographics: Reported in the metadata file.
+  params pid: The pid the metadata file is named after. Defaults to the pid of this process, so only one registered server
+    per process is supported. Use main to run several in their own processes.
+  params codec: The codec used to serialize messages. Defaults to the fastest one installed.
+  params seed: Seed of the random positions of the extra entities.
+  params type_last: Writes the type of the messages after the other fields, like Json.NET does in the game. By default it
+    is written first.
+  '''
+  def __init__(self,
+      towerfall_path: Optional[str] = None,
+      pool_name: str = _DEFAULT_POOL_NAME,
+      n_entities: int = 0,
+      fps: Optional[int] = None,
+      fastrun: bool = True,
+      nographics: bool = False,
+      pid: Optional[int] = None,
+      codec: Optional[Codec] = None,
+      seed: Optional[int] = None,
+      type_last: bool = False):
+    self.pool_path = get_pool_path(towerfall_path, pool_name) if towerfall_path else None
+    self.n_entities = n_entities
+    self.fps = fps
+    self.fastrun = fastrun
+    self.nographics = nographics
+    self.pid = pid if pid is not None else os.getpid()
+    self.codec = codec if codec else get_codec()
+    self.random = random.Random(seed)
+    self.type_last = type_last
+    self.frames = 0
+    self._listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    self._listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    self._listener.bind((_LOCALHOST, 0))
+    self._listener.listen(8)
+    self.port: int = self._listener.getsockname()[1]
+    self._lock = threading.Lock()
+    self._owner: Optional[socket.socket] = None
+    self._session: Optional[_Session] = None
+    self._reset_entities: Optional[List[Dict[str, Any]]] = None
+    self._pending_reset = False
+    self._closed = False
+    self._next_id = 0
+
+  def start(self) -> 'FakeTowerfallServer':
+    '''
+    Starts accepting connections in a background thread and registers in the pool.
+    '''
+    threading.Thread(target=self._accept_loop, daemon=True).start()
+    self._register()
+    return self
+
+  def serve_forever(self):
+    '''
+    Registers in the pool and accepts connections until close is called.
+    '''
+    self._register()
+    self._accept_loop()
+
+  def close(self):
+    self._closed = True
+    self._unregister()
+    self._end_session()
+    self._listener.close()
+
+  def __enter__(self):
+    return self.start()
+
+  def __exit__(self, *args):
+    self.close()
+
+  def _accept_loop(self):
+    while not self._closed:
+      try:
+        conn, _ = self._listener.accept()
+      except OSError:
+        return
+      conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+      threading.Thread(target=self._handle_connection, args=(conn,), daemon=True).start()
+
+  def _handle_connection(self, conn: socket.socket):
+    try:
+      message = self._read(conn)
+      if message['type'] == 'join':
+        self._handle_join(conn)
+      elif message['type'] == 'config':
+        self._handle_new_config_connection(conn, message)
+      elif message['type'] == 'reset':
+        self._handle_reset(conn, message)
+      else:
+        logging.error(f'Message type not supported: {message["type"]}')
+    except (ConnectionError, OSError):
+      pass
+
+  def _handle_join(self, conn: socket.socket):
+    with self._lock:
+      session = self._session
+      if not session or session.stop.is_set() or len(session.connections) >= session.n_connections:
+        self._write(conn, dict(type='result', success=False, message='No open slot to join.'))
+        conn.close()
+        return
+      session.connections.append(conn)
+      self._write(conn, dict(type='result', success=True, message='Game will start once all agents join.'))
+      if len(session.connections) == session.n_connections:
+        threading.Thread(target=self._run_session, args=(session,), daemon=True).start()
+
+  def _handle_new_config_connection(self, conn: socket.socket, message: Mapping[str, Any]):
+    with self._lock:
+      if self._owner is not None:
+        self._write(conn, dict(type='result', success=False, message='Game is currently owned by a different client.'))
+        conn.close()
+        return
+      self._owner = conn
+    self._unregister()
+    try:
+      self._handle_config(conn, message)
+      while True:
+        message = self._read(conn)
+        if message['type'] == 'config':
+          self._handle_config(conn, message)
+        elif message['type'] == 'reset':
+          self._handle_reset(conn, message)
+        else:
+          logging.error(f'Message type not supported: {message["type"]}')
+    except (ConnectionError, OSError):
+      pass
+    finally:
+      conn.close()
+      with self._lock:
+        self._owner = None
+      if not self._closed:
+        self._register()
+
+  def _handle_config(self, conn: socket.socket, message: Mapping[str, Any]):
+    config = message.get('config') or {}
+    error = self._validate_config(config)
+    if error:
+      self._write(conn, dict(type='result', success=False, message=error))
+      return
+    self._end_session()
+    n_connections = sum(1 for agent in config.get('agents', []) if agent.get('type') == 'remote')
+    with self._lock:
+      self._session = _Session(config, n_connections)
+      self._reset_entities = None
+      self._pending_reset = False
+    self._write(conn, dict(type='result', success=True))
+
+  def _validate_config(self, config: Mapping[str, Any]) -> Optional[str]:
+    if not config.get('mode'):
+      return 'Game mode need to be specified in config request.'
+    if len(config.get('agents', [])) > _MAX_AGENTS:
+      return f'Too many agents. Only {_MAX_AGENTS} bots are supported.'
+    return None
+
+  def _handle_reset(self, conn: socket.socket, message: Mapping[str, Any]):
+    with self._lock:
+      if message.get('entities') is not None:
+        self._reset_entities = message['entities']
+      self._pending_reset = True
+    self._write(conn, dict(type='result', success=True))
+
+  def _end_session(self):
+    with self._lock:
+      session = self._session
+      self._session = None
+    if not session:
+      return
+    session.stop.set()
+    for conn in session.connections:
+      try:
+        conn.shutdown(socket.SHUT_RDWR)
+      except OSError:
+        pass
+      conn.close()
+
+  def _run_session(self, session: _Session):
+    agents = session.config.get('agents', [])
+    indices = [i for i, agent in enumerate(agents) if agent.get('type') == 'remote']
+    try:
+      for conn, index in zip(session.connections, indices):
+        self._write(conn, dict(type='init', version=_VERSION, index=index))
+        self._read(conn)
+      scenario = dict(type='scenario', grid=self._grid(session.config), cellSize=_CELL_SIZE)
+      for conn in session.connections:
+        self._write(conn, scenario)
+        self._read(conn)
+
+      entities = self._initial_entities(agents)
+      fps = self.fps if self.fps is not None else session.config.get('fps', 0)
+      frame_time = 1 / fps if fps else 0
+      frame_id = 0
+      while not session.stop.is_set():
+        start = time.perf_counter()
+        with self._lock:
+          if self._pending_reset:
+            entities = self._initial_entities(agents, self._reset_entities)
+            self._pending_reset = False
+        self._move_fillers(entities)
+        payload = self._dumps(dict(type='update', entities=entities, dt=1.0, id=frame_id))
+        for conn in session.connections:
+          self._write_bytes(conn, payload)
+        actions_by_index = {}
+        for conn, index in zip(session.connections, indices):
+          reply = self._read(conn)
+          if reply.get('type') == 'actions':
+            actions_by_index[index] = reply.get('actions', '')
+        entities = self._simulate(entities, actions_by_index)
+        frame_id += 1
+        self.frames += 1
+        if frame_time:
+          elapsed = time.perf_counter() - start
+          if elapsed < frame_time:
+            time.sleep(frame_time - elapsed)
+    except (ConnectionError, OSError):
+      # An agent disconnected or the session was replaced. The game drops all agents in that case.
+      if not session.stop.is_set():
+        with self._lock:
+          if self._session is session:
+            self._session = None
+        session.stop.set()
+        for conn in session.connections:
+          conn.close()
+
+  def _grid(self, config: Mapping[str, Any]) -> List[List[int]]:
+    n_cols, n_rows = _WIDTH // _CELL_SIZE, _HEIGHT // _CELL_SIZE
+    solids = config.get('solids')
+    if not solids:
+      ground_row = (_HEIGHT - _GROUND_Y) // _CELL_SIZE
+      solids = [[int(row == ground_row) for _ in range(n_cols)] for row in range(n_rows)]
+    # solids has one row per y, from the top. The grid is indexed by x, then y from the bottom.
+    return [[solids[n_rows - 1 - y][x] for y in range(n_rows)] for x in range(n_cols)]
+
+  def _new_id(self) -> int:
+    self._next_id += 1
+    return self._next_id
+
+  def _initial_entities(self,
+      agents: List[Mapping[str, Any]],
+      reset_entities: Optional[List[Mapping[str, Any]]] = None) -> List[Dict[str, Any]]:
+    entities = []
+    archer_positions = []
+    for e in reset_entities or []:
+      if e['type'] == 'archer':
+        archer_positions.append(e['pos'])
+      else:
+        entities.append(self._create_enemy(e))
+    for i, agent in enumerate(agents):
+      if i < len(archer_positions):
+        x, y = archer_positions[i]['x'], archer_positions[i]['y']
+      else:
+        x, y = _WIDTH * (i + 1) / (len(agents) + 1), _GROUND_Y
+      entities.insert(i, self._create_archer(i, agent, x, y))
+    for _ in range(self.n_entities):
+      entities.append(self._create_filler())
+    return entities
+
+  def _create_archer(self, index: int, agent: Mapping[str, Any], x: float, y: float) -> Dict[str, Any]:
+    return dict(
+      type='archer',
+      id=self._new_id(),
+      pos=dict(x=x, y=y),
+      vel=dict(x=0.0, y=0.0),
+      size=dict(_ARCHER_SIZE),
+      state='normal',
+      isEnemy=False,
+      canHurt=True,
+      canBounceOn=True,
+      isDead=False,
+      facing=1,
+      playerIndex=index,
+      shield=False,
+      wing=False,
+      arrows=['normal'] * 3,
+      dead=False,
+      onGround=True,
+      onWall=False,
+      aimDirection=dict(x=1.0, y=0.0),
+      team=agent.get('team', 'neutral'),
+      dodgeCooldown=False)
+
+  def _create_enemy(self, reset_entity: Mapping[str, Any]) -> Dict[str, Any]:
+    enemy = dict(
+      type=reset_entity['type'],
+      id=self._new_id(),
+      pos=dict(reset_entity['pos']),
+      vel=dict(x=0.0, y=0.0),
+      size=dict(_ENEMY_SIZE),
+      state='idle',
+      isEnemy=True,
+      canHurt=True,
+      canBounceOn=True,
+      isDead=False,
+      facing=reset_entity.get('facing', 1))
+    if 'subType' in reset_entity:
+      enemy['subType'] = reset_entity['subType']
+    return enemy
+
+  def _create_filler(self) -> Dict[str, Any]:
+    return dict(
+      type='arrow',
+      id=self._new_id(),
+      pos=dict(x=self.random.uniform(0, _WIDTH), y=self.random.uniform(0, _HEIGHT)),
+      vel=dict(x=self.random.uniform(-3, 3), y=self.random.uniform(-3, 3)),
+      size=dict(_ARROW_SIZE),
+      state='flying',
+      isEnemy=False,
+      canHurt=True,
+      canBounceOn=False,
+      isDead=False,
+      facing=1,
+      arrowType='normal',
+      timeLeft=1.0)
+
+  def _move_fillers(self, entities: List[Dict[str, Any]]):
+    for e in entities:
+      if e['type'] == 'arrow':
+        pos, vel = e['pos'], e['vel']
+        pos['x'] = (pos['x'] + vel['x']) % _WIDTH
+        pos['y'] = (pos['y'] + vel['y']) % _HEIGHT
+
+  def _simulate(self, entities: List[Dict[str, Any]], actions_by_index: Mapping[int, str]) -> List[Dict[str, Any]]:
+    archers = [e for e in entities if e['type'] == 'archer']
+    enemies = [e for e in entities if e['isEnemy']]
+    killed = set()
+    for archer in archers:
+      actions = actions_by_index.get(archer['playerIndex'], '')
+      pos, vel = archer['pos'], archer['vel']
+      vel['x'] = _RUN_SPEED * (('r' in actions) - ('l' in actions))
+      if vel['x']:
+        archer['facing'] = 1 if vel['x'] > 0 else -1
+      if 'j' in actions and archer['onGround']:
+        vel['y'] = _JUMP_SPEED
+        archer['onGround'] = False
+      if not archer['onGround']:
+        vel['y'] -= _GRAVITY
+      pos['x'] = (pos['x'] + vel['x']) % _WIDTH
+      pos['y'] += vel['y']
+      if pos['y'] <= _GROUND_Y and not archer['onGround']:
+        pos['y'] = _GROUND_Y
+        vel['y'] = 0.0
+        archer['onGround'] = True
+      if 's' in actions:
+        target = self._target(archer, enemies)
+        if target:
+          killed.add(target['id'])
+
+    for enemy in enemies:
+      if enemy['id'] in killed or not archers:
+        continue
+      closest = min(archers, key=lambda a: abs(a['pos']['x'] - enemy['pos']['x']))
+      dx = closest['pos']['x'] - enemy['pos']['x']
+      enemy['vel']['x'] = _ENEMY_SPEED if dx > 0 else -_ENEMY_SPEED
+      enemy['facing'] = 1 if dx > 0 else -1
+      enemy['pos']['x'] += enemy['vel']['x']
+      if abs(dx) < _ENEMY_SIZE['x'] / 2 and abs(closest['pos']['y'] - enemy['pos']['y']) < _ARCHER_SIZE['y']:
+        killed.add(closest['id'])
+    return [e for e in entities if e['id'] not in killed]
+
+  def _target(self, archer: Mapping[str, Any], enemies: List[Mapping[str, Any]]) -> Optional[Mapping[str, Any]]:
+    best = None
+    best_dx = _SHOOT_RANGE
+    for enemy in enemies:
+      dx = (enemy['pos']['x'] - archer['pos']['x']) * archer['facing']
+      if 0 <= dx < best_dx and abs(enemy['pos']['y'] - archer['pos']['y']) < _ARCHER_SIZE['y']:
+        best, best_dx = enemy, dx
+    return best
+
+  def _register(self):
+    if not self.pool_path:
+      return
+    os.makedirs(self.pool_path, exist_ok=True)
+    path = os.path.join(self.pool_path, str(self.pid))
+    with open(path + '.tmp', 'w') as file:
+      json.dump(dict(port=self.port, fastrun=self.fastrun, nographics=self.nographics), file)
+    os.replace(path + '.tmp', path)
+
+  def _unregister(self):
+    if not self.pool_path:
+      return
+    try:
+      os.remove(os.path.join(self.pool_path, str(self.pid)))
+    except FileNotFoundError:
+      pass
+
+  def _read(self, conn: socket.socket) -> Dict[str, Any]:
+    size = int.from_bytes(self._recv_exactly(conn, _HEADER_SIZE), byteorder=_BYTE_ORDER)
+    if size == 0:
+      raise ConnectionError('Connection is closed')
+    return self.codec.loads(self._recv_exactly(conn, size))
+
+  def _recv_exactly(self, conn: socket.socket, size: int) -> bytes:
+    data = bytearray(size)
+    view = memoryview(data)
+    received = 0
+    while received < size:
+      n = conn.recv_into(view[received:])
+      if n == 0:
+        raise ConnectionError('Connection is closed')
+      received += n
+    return bytes(data)
+
+  def _dumps(self, obj: Mapping[str, Any]) -> bytes:
+    if self.type_last:
+      obj = dict(obj)
+      obj['type'] = obj.pop('type')
+    return self.codec.dumps(obj)
+
+  def _write(self, conn: socket.socket, obj: Mapping[str, Any]):
+    self._write_bytes(conn, self._dumps(obj))
+
+  def _write_bytes(self, conn: socket.socket, payload: bytes):
+    conn.sendall(len(payload).to_bytes(_HEADER_SIZE, byteorder=_BYTE_ORDER) + payload)
+
+
+def spawn_fake_server(towerfall_path: str,
+    pool_name: str = _DEFAULT_POOL_NAME,
+    n_entities: int = 0,
+    fps: Optional[int] = None,
+    nographics: bool = False,
+    timeout: float = 0,
+    type_last: bool = False) -> subprocess.Popen:
+  '''
+  Starts a fake server in a new process, like spawn_process does for the game.
+
+  params timeout: If greater than 0, waits up to timeout seconds for the server to register in the pool.
+  '''
+  pargs = [sys.executable, '-m', 'towerfall.fake_server', '--towerfall-path', towerfall_path, '--pool', pool_name,
+           '--entities', str(n_entities)]
+  if fps is not None:
+    pargs += ['--fps', str(fps)]
+  if nographics:
+    pargs.append('--nographics')
+  if type_last:
+    pargs.append('--type-last')
+  package_parent = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+  process = subprocess.Popen(pargs, cwd=package_parent)
+  if timeout > 0:
+    metadata_path = os.path.join(get_pool_path(towerfall_path, pool_name), str(process.pid))
+    deadline = time.time() + timeout
+    while not os.path.exists(metadata_path):
+      if process.poll() is not None or time.time() > deadline:
+        process.kill()
+        raise TowerfallError(f'Fake server did not register in pool {pool_name}.')
+      time.sleep(0.01)
+  return process
+
+
+def main(args: Optional[List[str]] = None):
+  '''
+  Runs a fake server in this process, registered under its own pid. Start it with
+  python -m towerfall.fake_server --towerfall-path <path> [--pool <name>] [--entities <n>] [--fps <n>] [--nographics] [--type-last].
+  '''
+  parser = argparse.ArgumentParser(description='Pure Python stand-in for a Towerfall process.')
+  parser.add_argument('--towerfall-path', required=True)
+  parser.add_argument('--pool', default=_DEFAULT_POOL_NAME)
+  parser.add_argument('--entities', type=int, default=0)
+  parser.add_argument('--fps', type=int, default=None)
+  parser.add_argument('--no-fastrun', action='store_true')
+  parser.add_argument('--nographics', action='store_true')
+  parser.add_argument('--seed', type=int, default=None)
+  parser.add_argument('--type-last', action='store_true')
+  parsed = parser.parse_args(args)
+  server = FakeTowerfallServer(
+    towerfall_path=parsed.towerfall_path,
+    pool_name=parsed.pool,
+    n_entities=parsed.entities,
+    fps=parsed.fps,
+    fastrun=not parsed.no_fastrun,
+    nographics=parsed.nographics,
+    seed=parsed.seed,
+    type_last=parsed.type_last)
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    pass
+  finally:
+    server.close()
+
+
+if __name__ == '__main__':
+  main()
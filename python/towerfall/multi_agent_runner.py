@@ -0,0 +1,116 @@
+import logging
+import selectors
+import socket
+import time
+from typing import Any, List, NamedTuple, Optional, Sequence
+
+from .connection import Connection
+
+
+class FrameStats(NamedTuple):
+  '''
+  Timing of one lockstep frame.
+
+  duration: Seconds from the start of the frame until the last agent received its message.
+  arrivals: Seconds from the start of the frame until each agent received its message, in agent order.
+  straggler: Index of the agent whose message arrived last.
+  '''
+  duration: float
+  arrivals: List[float]
+  straggler: int
+
+
+class MultiAgentRunner:
+  '''
+  Drives several agents in lockstep. Waits on all connections at once and hands each message to its agent as soon as it arrives,
+  so the wall time of a frame is the slowest round trip instead of the sum of all of them.
+
+  params connections: Connections to a Towerfall game, one per agent.
+  params agents: Agents exposing act(game_state), in the same order as connections.
+  params timeout: Seconds to wait for any message before raising socket.timeout. 0 means no timeout.
+  params straggler_threshold: Frames slower than this many seconds are logged with the agent that arrived last. 0 disables it.
+  params verbose: Verbosity level. 0: no logging, 1: much logging.
+  '''
+  def __init__(self,
+      connections: Sequence[Connection],
+      agents: Sequence[Any],
+      timeout: float = 10,
+      straggler_threshold: float = 0,
+      verbose: int = 0):
+    if len(connections) != len(agents):
+      raise ValueError(f'Expected one agent per connection. Connections: {len(connections)}, Agents: {len(agents)}')
+    self.connections = list(connections)
+    self.agents = list(agents)
+    self.timeout = timeout
+    self.straggler_threshold = straggler_threshold
+    self.verbose = verbose
+    self.straggler_counts = [0] * len(self.connections)
+    self.last_stats: Optional[FrameStats] = None
+    self._selector = selectors.DefaultSelector()
+
+  def close(self):
+    '''
+    Releases the selector. Connections are left open.
+    '''
+    self._selector.close()
+
+  def run(self, n_frames: Optional[int] = None):
+    '''
+    Runs frames until n_frames is reached, or forever if n_frames is None.
+    '''
+    frame = 0
+    while n_frames is None or frame < n_frames:
+      self.run_frame()
+      frame += 1
+
+  def run_frame(self) -> FrameStats:
+    '''
+    Delivers exactly one message to every agent.
+    '''
+    start = time.perf_counter()
+    arrivals: List[Optional[float]] = [None] * len(self.connections)
+    pending = len(self.connections)
+
+    # Messages already buffered from a previous receive don't need to wait on the socket.
+    # Agents that acted are unregistered for the rest of the frame, so their next message stays in the socket.
+    for i, connection in enumerate(self.connections):
+      if connection.has_frame():
+        self._dispatch(i, arrivals, start)
+        pending -= 1
+      else:
+        self._selector.register(connection.fileno(), selectors.EVENT_READ, i)
+
+    try:
+      while pending:
+        events = self._selector.select(self.timeout if self.timeout else None)
+        if not events:
+          waiting = [i for i, t in enumerate(arrivals) if t is None]
+          raise socket.timeout(f'Timeout waiting for agents {waiting}')
+        for key, _ in events:
+          i = key.data
+          connection = self.connections[i]
+          connection.receive_available()
+          if connection.has_frame():
+            self._selector.unregister(key.fileobj)
+            self._dispatch(i, arrivals, start)
+            pending -= 1
+    finally:
+      # Leaves the selector empty if the frame was interrupted by a timeout or a closed connection.
+      for key in list(self._selector.get_map().values()):
+        self._selector.unregister(key.fileobj)
+
+    arrival_times: List[float] = [t for t in arrivals if t is not None]
+    straggler = max(range(len(arrival_times)), key=lambda i: arrival_times[i])
+    stats = FrameStats(max(arrival_times), arrival_times, straggler)
+    self.straggler_counts[straggler] += 1
+    if self.straggler_threshold and stats.duration > self.straggler_threshold:
+      logging.warning('Slow frame: %.1fms. Straggler: agent %d. Arrivals (ms): %s',
+        stats.duration * 1000, straggler, ', '.join(f'{t * 1000:.1f}' for t in arrival_times))
+    elif self.verbose > 0:
+      logging.info('Frame: %.1fms. Straggler: agent %d', stats.duration * 1000, straggler)
+    self.last_stats = stats
+    return stats
+
+  def _dispatch(self, i: int, arrivals: List[Optional[float]], start: float):
+    arrivals[i] = time.perf_counter() - start
+    self.agents[i].act(self.connections[i].read_json())
@@ -0,0 +1,233 @@
+import logging
+import os
+import signal
+import threading
+import time
+from typing import Any, Callable, Dict, List, Mapping, Optional
+
+import psutil
+
+from .pool_index import get_pool_index
+from .towerfall import (_DEFAULT_CAPABILITIES, _DEFAULT_POOL_NAME,
+                        _DEFAULT_STEAM_PATH_WINDOWS, Towerfall, TowerfallError,
+                        get_pool_path, resolve_towerfall_path, select_metadata,
+                        spawn_process)
+
+
+class TowerfallPool:
+  '''
+  Manages the Towerfall processes of a named pool. Keeps a number of idle processes warm, hands out leases and replaces
+  processes that crash.
+
+  params towerfall_path: The parent path where Towerfall.exe is located.
+  params pool_name: Name of the pool. Processes only register in the pool they were started for.
+  params warm: Number of idle processes to keep ready, besides the leased ones.
+  params spawn_timeout: Seconds to wait for a new process to register in the pool.
+  params poll_interval: Seconds between checks of the pool directory mtime while waiting for a process.
+  params verbose: The verbosity level. 0: no logging, 1: much logging.
+  params capabilities: Capabilities of the processes started to keep the pool warm, like dict(nographics=True).
+  '''
+  def __init__(self,
+      towerfall_path: str = _DEFAULT_STEAM_PATH_WINDOWS,
+      pool_name: str = _DEFAULT_POOL_NAME,
+      warm: int = 0,
+      spawn_timeout: float = 20,
+      poll_interval: float = 0.1,
+      verbose: int = 0,
+      capabilities: Mapping[str, Any] = {}):
+    self.towerfall_path = resolve_towerfall_path(towerfall_path)
+    self.pool_name = pool_name
+    self.pool_path = get_pool_path(self.towerfall_path, pool_name)
+    self.warm = warm
+    self.spawn_timeout = spawn_timeout
+    self.poll_interval = poll_interval
+    self.verbose = verbose
+    self.capabilities = capabilities
+    self.leases: Dict[int, Towerfall] = {}
+    self.index = get_pool_index(self.pool_path)
+    if verbose > 0:
+      self.index.log_fn = logging.warning
+    self._lock = threading.Lock()
+    # Processes started by this pool that did not register yet, by pid, with their start time.
+    self._spawning: Dict[int, float] = {}
+    # Capabilities the processes in _spawning were started with.
+    self._spawning_capabilities: Dict[int, Mapping[str, Any]] = {}
+    # Processes handed to a client that is still configuring them, by pid, with the time they were handed out.
+    self._reserved: Dict[int, float] = {}
+    self._spawned_pids: List[int] = []
+
+  def lease(self,
+      config: Mapping[str, Any],
+      timeout: float = 2,
+      require: Mapping[str, Any] = {},
+      prefer: Mapping[str, Any] = {}) -> Towerfall:
+    '''
+    Takes an idle process from the pool, starting one if needed, and configures it. Replacements are started in the background
+    to keep the pool warm.
+
+    params config: The configuration sent to the game.
+    params timeout: The timeout for the management API (Config, Reset).
+    params require: Capabilities the process must have, like dict(nographics=True, fastrun=True).
+    params prefer: Capabilities to prefer when several processes qualify, in order of priority.
+    '''
+    towerfall = Towerfall(config, timeout=timeout, verbose=self.verbose, pool=self, require=require, prefer=prefer)
+    pid = towerfall.pid
+    with self._lock:
+      self.leases[pid] = towerfall
+    towerfall.open_connection.on_close = lambda: self._on_lease_closed(pid)
+    self.ensure_warm()
+    return towerfall
+
+  def release(self, towerfall: Towerfall):
+    '''
+    Ends a lease. The process registers itself back in the pool once the management connection closes.
+    '''
+    towerfall.close()
+
+  def acquire_metadata(self, require: Mapping[str, Any] = {}, prefer: Mapping[str, Any] = {}) -> Dict[str, Any]:
+    '''
+    Reserves an idle process and returns its metadata. Used by Towerfall when created with a pool.
+    If no idle process has the required capabilities, one is started with them.
+    '''
+    def select(metadatas: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+      return select_metadata([m for m in metadatas if m['pid'] not in self._reserved], require, prefer)
+
+    deadline = time.time() + self.spawn_timeout
+    while True:
+      with self._lock:
+        self._expire_reservations()
+        self._update_spawning()
+        metadata = self.index.take(select)
+        if metadata:
+          self._reserved[metadata['pid']] = time.time()
+          break
+        if not any(self._satisfies(capabilities, require) for capabilities in self._spawning_capabilities.values()):
+          self._spawn({**self.capabilities, **prefer, **require})
+      if time.time() > deadline:
+        raise TowerfallError(f'Could not find or create a Towerfall process in pool {self.pool_name}. '
+                             f'Required capabilities: {dict(require)}')
+      time.sleep(self.poll_interval)
+    self.ensure_warm()
+    return metadata
+
+  def end_reservation(self, pid: int):
+    '''
+    Ends the reservation made by acquire_metadata, once the client has configured the process.
+    '''
+    with self._lock:
+      self._reserved.pop(pid, None)
+
+  def ensure_warm(self):
+    '''
+    Starts processes until the idle ones plus the ones starting reach the warm count. Does not wait for them.
+    '''
+    with self._lock:
+      self._expire_reservations()
+      idle = sum(1 for m in self._idle_metadata() if m['pid'] not in self._reserved)
+      for _ in range(self.warm - idle - len(self._spawning)):
+        self._spawn(self.capabilities)
+
+  def wait_warm(self, timeout: Optional[float] = None):
+    '''
+    Blocks until the warm count of idle processes is registered. All missing processes start at the same time.
+
+    params timeout: Seconds to wait. Defaults to spawn_timeout.
+    '''
+    deadline = time.time() + (timeout if timeout is not None else self.spawn_timeout)
+    while True:
+      self.ensure_warm()
+      with self._lock:
+        idle = sum(1 for m in self._idle_metadata() if m['pid'] not in self._reserved)
+      if idle >= self.warm:
+        return
+      if time.time() > deadline:
+        raise TowerfallError(f'Only {idle}/{self.warm} processes are ready in pool {self.pool_name}.')
+      time.sleep(self.poll_interval)
+
+  def health_check(self) -> List[int]:
+    '''
+    Checks the leased processes through their management connection. Crashed or unresponsive processes are killed, their leases
+    dropped, and replacements started.
+
+    returns: The pids of the processes that were recycled.
+    '''
+    with self._lock:
+      leases = list(self.leases.items())
+    recycled = []
+    for pid, towerfall in leases:
+      if towerfall.is_healthy():
+        continue
+      self._try_log(logging.warning, f'Towerfall process {pid} on port {towerfall.port} is not healthy. Recycling it.')
+      recycled.append(pid)
+      with self._lock:
+        self.leases.pop(pid, None)
+      towerfall.open_connection.on_close = lambda: None
+      towerfall.close()
+      self._kill(pid)
+    # Idle processes that crashed are only noticed by their pid.
+    for pid in self.index.prune():
+      self._try_log(logging.warning, f'Idle Towerfall process {pid} died.')
+      recycled.append(pid)
+    if recycled:
+      self.ensure_warm()
+    return recycled
+
+  def close(self, kill_spawned: bool = False):
+    '''
+    Releases all leases.
+
+    params kill_spawned: Also terminates the processes started by this pool.
+    '''
+    with self._lock:
+      leases = list(self.leases.values())
+    for towerfall in leases:
+      towerfall.close()
+    if kill_spawned:
+      for pid in self._spawned_pids:
+        self._kill(pid)
+
+  def _idle_metadata(self) -> List[Dict[str, Any]]:
+    self._update_spawning()
+    return list(self.index.entries().values())
+
+  def _update_spawning(self):
+    for pid in self.index.entries():
+      self._spawning.pop(pid, None)
+      self._spawning_capabilities.pop(pid, None)
+    now = time.time()
+    for pid, start_time in list(self._spawning.items()):
+      if now - start_time > self.spawn_timeout or not psutil.pid_exists(pid):
+        self._try_log(logging.warning, f'Towerfall process {pid} did not register in pool {self.pool_name}.')
+        del self._spawning[pid]
+        del self._spawning_capabilities[pid]
+
+  def _expire_reservations(self):
+    now = time.time()
+    for pid, reserve_time in list(self._reserved.items()):
+      if now - reserve_time > self.spawn_timeout:
+        del self._reserved[pid]
+
+  def _satisfies(self, capabilities: Mapping[str, Any], require: Mapping[str, Any]) -> bool:
+    capabilities = {**_DEFAULT_CAPABILITIES, **capabilities}
+    return all(capabilities.get(key) == value for key, value in require.items())
+
+  def _spawn(self, capabilities: Mapping[str, Any]):
+    self._try_log(logging.info, f'Starting new process in pool {self.pool_name}. Capabilities: {dict(capabilities)}')
+    process = spawn_process(self.towerfall_path, self.pool_name, capabilities)
+    self._spawning[process.pid] = time.time()
+    self._spawning_capabilities[process.pid] = capabilities
+    self._spawned_pids.append(process.pid)
+
+  def _on_lease_closed(self, pid: int):
+    with self._lock:
+      self.leases.pop(pid, None)
+
+  def _kill(self, pid: int):
+    try:
+      os.kill(pid, signal.SIGTERM)
+    except (ProcessLookupError, OSError):
+      pass
+
+  def _try_log(self, log_fn: Callable[[str], None], message: str):
+    if self.verbose > 0:
+      log_fn(message)
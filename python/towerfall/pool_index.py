@@ -0,0 +1,202 @@
+import json
+import os
+import threading
+import time
+from io import TextIOWrapper
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import psutil
+
+# Capabilities of a process started without flags, also assumed for the ones missing from a metadata file.
+_DEFAULT_CAPABILITIES = dict(fastrun=True, nographics=False)
+# Directory mtimes this close to the scan time are not trusted, since files created within the same tick would be missed.
+_RACY_MTIME_WINDOW = 2
+
+
+class PoolIndex:
+  '''
+  In-memory index of the idle processes registered in a pool directory, keyed by pid.
+
+  The directory is only listed again when its mtime changes, and a metadata file is only parsed again when its own mtime or
+  size changes. Liveness is checked once per pid when an entry is taken, instead of for every file on every scan.
+  A taken entry is not listed again until the game rewrites its file.
+  Use get_pool_index to share one index per directory.
+
+  params pool_path: The pool directory.
+  params poll_interval: Seconds between checks of the directory mtime while waiting.
+  '''
+  def __init__(self, pool_path: str, poll_interval: float = 0.05):
+    self.pool_path = pool_path
+    self.poll_interval = poll_interval
+    self.log_fn: Optional[Callable[[str], None]] = None
+    self._lock = threading.RLock()
+    self._dir_mtime: Optional[int] = None
+    self._scan_time = 0.0
+    # pid -> ((mtime, size) of the file, metadata)
+    self._entries: Dict[int, Tuple[Tuple[int, int], Dict[str, Any]]] = {}
+    # pid -> (mtime, size) of the file when it was taken. The game rewrites the file when the process is free again.
+    self._taken: Dict[int, Tuple[int, int]] = {}
+
+  def refresh(self) -> bool:
+    '''
+    Rescans the directory if it changed since the last scan.
+
+    returns: Whether the directory was rescanned.
+    '''
+    with self._lock:
+      try:
+        dir_mtime = os.stat(self.pool_path).st_mtime_ns
+      except FileNotFoundError:
+        self._entries.clear()
+        self._dir_mtime = None
+        return False
+      racy = self._scan_time - dir_mtime / 1e9 < _RACY_MTIME_WINDOW
+      if dir_mtime == self._dir_mtime and not racy:
+        return False
+      self._scan_time = time.time()
+      self._dir_mtime = dir_mtime
+      self._scan()
+      return True
+
+  def entries(self) -> Dict[int, Dict[str, Any]]:
+    '''
+    Metadata of the registered processes by pid. Entries of processes that died are only dropped once they are taken.
+    '''
+    with self._lock:
+      self.refresh()
+      return {pid: metadata for pid, (_, metadata) in self._entries.items()}
+
+  def take(self, select: Callable[[List[Dict[str, Any]]], Optional[Dict[str, Any]]]) -> Optional[Dict[str, Any]]:
+    '''
+    Picks an entry with select and removes it from the index. Entries of dead processes are discarded and select is called again.
+
+    params select: Receives the metadata of the registered processes and returns the chosen one, or None.
+    '''
+    with self._lock:
+      self.refresh()
+      while True:
+        metadata = select([metadata for _, metadata in self._entries.values()])
+        if metadata is None:
+          return None
+        pid = metadata['pid']
+        self._taken[pid] = self._entries.pop(pid)[0]
+        if self._is_alive(pid):
+          return metadata
+        self._remove_file(pid)
+
+  def wait_take(self,
+      select: Callable[[List[Dict[str, Any]]], Optional[Dict[str, Any]]],
+      timeout: float) -> Optional[Dict[str, Any]]:
+    '''
+    Like take, but waits up to timeout seconds for a matching process to register.
+    '''
+    deadline = time.time() + timeout
+    while True:
+      metadata = self.take(select)
+      if metadata is not None or time.time() > deadline:
+        return metadata
+      time.sleep(self.poll_interval)
+
+  def prune(self) -> List[int]:
+    '''
+    Drops the entries of processes that died and removes their files.
+
+    returns: The pids that were dropped.
+    '''
+    with self._lock:
+      dead = [pid for pid in self._entries if not self._is_alive(pid)]
+      for pid in dead:
+        del self._entries[pid]
+        self._remove_file(pid)
+      return dead
+
+  def discard(self, pid: int):
+    '''
+    Removes a pid from the index, for example after it was leased through another path.
+    '''
+    with self._lock:
+      self._entries.pop(pid, None)
+
+  def _scan(self):
+    seen = set()
+    for file_name in os.listdir(self.pool_path):
+      try:
+        pid = int(file_name)
+      except ValueError:
+        continue
+      path = os.path.join(self.pool_path, file_name)
+      try:
+        stat = os.stat(path)
+      except FileNotFoundError:
+        continue
+      seen.add(pid)
+      key = (stat.st_mtime_ns, stat.st_size)
+      if self._taken.get(pid) == key:
+        continue
+      self._taken.pop(pid, None)
+      cached = self._entries.get(pid)
+      if cached and cached[0] == key:
+        continue
+      if not cached and not psutil.pid_exists(pid):
+        self._remove_file(pid)
+        seen.discard(pid)
+        continue
+      try:
+        with open(path, 'r') as file:
+          metadata = load_metadata(file)
+      except (ValueError, json.JSONDecodeError, FileNotFoundError, PermissionError) as ex:
+        # The game may still be writing it. It will be parsed again once its mtime or size changes.
+        if self.log_fn:
+          self.log_fn(f'Invalid metadata file {file_name}. Exception: {ex}')
+        self._entries.pop(pid, None)
+        seen.discard(pid)
+        continue
+      metadata['pid'] = pid
+      self._entries[pid] = (key, metadata)
+    for pid in list(self._entries):
+      if pid not in seen:
+        del self._entries[pid]
+    for pid in list(self._taken):
+      if pid not in seen:
+        del self._taken[pid]
+
+  def _is_alive(self, pid: int) -> bool:
+    try:
+      return psutil.Process(pid).status() != psutil.STATUS_ZOMBIE
+    except psutil.NoSuchProcess:
+      return False
+
+  def _remove_file(self, pid: int):
+    try:
+      os.remove(os.path.join(self.pool_path, str(pid)))
+    except (FileNotFoundError, PermissionError):
+      pass
+
+
+_indices: Dict[str, PoolIndex] = {}
+_indices_lock = threading.Lock()
+
+
+def get_pool_index(pool_path: str) -> PoolIndex:
+  '''
+  Returns the index shared by all clients of a pool directory in this process.
+  '''
+  key = os.path.abspath(pool_path)
+  with _indices_lock:
+    if key not in _indices:
+      _indices[key] = PoolIndex(key)
+    return _indices[key]
+
+
+def load_metadata(file: TextIOWrapper) -> Dict[str, Any]:
+  metadata = json.load(file)
+  if 'port' not in metadata:
+    raise ValueError('Port not found in metadata.')
+  try:
+    metadata['port'] = int(metadata['port'])
+  except ValueError:
+    raise ValueError(f'Port is not an integer. Port: {metadata["port"]}')
+
+  for capability, default in _DEFAULT_CAPABILITIES.items():
+    metadata.setdefault(capability, default)
+  return metadata
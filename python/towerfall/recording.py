@@ -0,0 +1,456 @@
+import mmap
+import os
+import struct
+import sys
+import zlib
+from abc import ABC, abstractmethod
+from array import array
+from bisect import bisect_right
+from io import BufferedWriter
+from typing import Any, Dict, Iterator, List, Mapping, NamedTuple, Optional, Tuple
+
+from .codec import Codec, get_codec, peek_update_id
+
+# Recordings with this extension use the binary format. Any other path gets one json message per line.
+BINARY_RECORD_EXTENSION = '.tfr'
+
+_MAGIC = b'TFRC'
+_INDEX_MAGIC = b'TFRI'
+_VERSION = 1
+# magic, version, compressor id, reserved
+_HEADER = struct.Struct('<4sBBH')
+# compressed size, raw size, frame count
+_BLOCK_HEADER = struct.Struct('<III')
+# direction, payload size
+_FRAME_HEADER = struct.Struct('<BI')
+# block count, frame count, episode count
+_INDEX_HEADER = struct.Struct('<III')
+# index offset, index compressed size, index raw size, magic
+_TRAILER = struct.Struct('<QII4s')
+
+RECEIVED = 0
+SENT = 1
+
+
+class Compressor(ABC):
+  name: str
+  id: int
+
+  @abstractmethod
+  def compress(self, data: bytes) -> bytes:
+    raise NotImplementedError
+
+  @abstractmethod
+  def decompress(self, data: bytes, raw_size: int) -> bytes:
+    raise NotImplementedError
+
+
+class ZlibCompressor(Compressor):
+  name = 'zlib'
+  id = 1
+
+  def __init__(self, level: int = 6):
+    self.level = level
+
+  def compress(self, data: bytes) -> bytes:
+    return zlib.compress(data, self.level)
+
+  def decompress(self, data: bytes, raw_size: int) -> bytes:
+    return zlib.decompress(data, bufsize=raw_size)
+
+
+class ZstdCompressor(Compressor):
+  name = 'zstd'
+  id = 2
+
+  def __init__(self, level: int = 3):
+    import zstandard
+    self._compressor = zstandard.ZstdCompressor(level=level)
+    self._decompressor = zstandard.ZstdDecompressor()
+
+  def compress(self, data: bytes) -> bytes:
+    return self._compressor.compress(data)
+
+  def decompress(self, data: bytes, raw_size: int) -> bytes:
+    return self._decompressor.decompress(data, max_output_size=raw_size)
+
+
+class Lz4Compressor(Compressor):
+  name = 'lz4'
+  id = 3
+
+  def __init__(self):
+    import lz4.block
+    self._block = lz4.block
+
+  def compress(self, data: bytes) -> bytes:
+    return self._block.compress(data, store_size=False)
+
+  def decompress(self, data: bytes, raw_size: int) -> bytes:
+    return self._block.decompress(data, uncompressed_size=raw_size)
+
+
+# In order of preference.
+_COMPRESSORS = [ZstdCompressor, Lz4Compressor, ZlibCompressor]
+
+
+def get_compressor(name: Optional[str] = None) -> Compressor:
+  '''
+  Returns the compressor with the given name, or the preferred one that is installed if name is None.
+  zstd and lz4 need the zstandard and lz4 packages. zlib is always available.
+  '''
+  for compressor_cls in _COMPRESSORS:
+    if name is not None and compressor_cls.name != name:
+      continue
+    try:
+      return compressor_cls()
+    except ImportError:
+      if name is not None:
+        raise
+  raise ValueError(f'Unknown compressor: {name}')
+
+
+def _compressor_by_id(compressor_id: int) -> Compressor:
+  for compressor_cls in _COMPRESSORS:
+    if compressor_cls.id == compressor_id:
+      return compressor_cls()
+  raise ValueError(f'Unknown compressor id: {compressor_id}')
+
+
+class Recorder(ABC):
+  '''
+  Receives every message sent and received by a connection.
+  '''
+  @abstractmethod
+  def record(self, payload: bytes, direction: int):
+    raise NotImplementedError
+
+  def mark_episode(self):
+    '''
+    Marks that the next update starts an episode. Formats without episode boundaries ignore it.
+    '''
+    pass
+
+  @abstractmethod
+  def close(self):
+    raise NotImplementedError
+
+
+class TextRecorder(Recorder):
+  '''
+  Appends one json message per line, in both directions.
+  '''
+  def __init__(self, path: str):
+    self.path = path
+    self._file: Optional[BufferedWriter] = None
+
+  def record(self, payload: bytes, direction: int):
+    if not self._file:
+      self._file = open(self.path, 'ab')
+    self._file.write(payload)
+    self._file.write(b'\n')
+
+  def close(self):
+    if self._file:
+      self._file.close()
+      self._file = None
+
+
+class BinaryRecorder(Recorder):
+  '''
+  Writes messages in compressed blocks, followed by an index of every frame by update id and of the episode boundaries.
+  Read it back with ReplayReader.
+
+  Layout: a header, then blocks of frames each prefixed by their compressed size, raw size and frame count, then the
+  compressed index and a fixed size trailer pointing to it. The index is only written on close. Files that were not closed
+  are still readable, since ReplayReader rebuilds the index by walking the blocks.
+
+  params path: The file to write. It is overwritten, unlike with TextRecorder which appends, because a recording has a single
+    header and index.
+  params compressor: Compression of the blocks. Defaults to zstd, then lz4, then zlib, depending on what is installed.
+  params block_size: Uncompressed bytes buffered before a block is written. Larger blocks compress better, smaller blocks
+    are faster to seek into.
+  params codec: Decodes the received messages whose update id can't be peeked at. Defaults to the fastest installed codec.
+  '''
+  def __init__(self, path: str, compressor: Optional[Compressor] = None, block_size: int = 1 << 16, codec: Optional[Codec] = None):
+    self.path = path
+    self.codec = codec if codec else get_codec()
+    self.compressor = compressor if compressor else get_compressor()
+    self.block_size = block_size
+    self._file = open(path, 'wb')
+    self._file.write(_HEADER.pack(_MAGIC, _VERSION, self.compressor.id, 0))
+    # A recording cut short before its first block is still recognized as one.
+    self._file.flush()
+    self._block = bytearray()
+    self._block_frames = 0
+    self._block_offsets = array('Q')
+    self._frame_blocks = array('I')
+    self._frame_offsets = array('I')
+    self._frame_directions = array('B')
+    self._frame_update_ids = array('q')
+    self._episodes = array('I')
+    self._pending_episode = False
+
+  def record(self, payload: bytes, direction: int):
+    update_id = peek_update_id(payload, self.codec) if direction == RECEIVED else None
+    frame = len(self._frame_blocks)
+    if update_id is not None and self._pending_episode:
+      self._episodes.append(frame)
+      self._pending_episode = False
+    self._frame_blocks.append(len(self._block_offsets))
+    self._frame_offsets.append(len(self._block))
+    self._frame_directions.append(direction)
+    self._frame_update_ids.append(-1 if update_id is None else update_id)
+    self._block += _FRAME_HEADER.pack(direction, len(payload))
+    self._block += payload
+    self._block_frames += 1
+    if len(self._block) >= self.block_size:
+      self._flush_block()
+
+  def mark_episode(self):
+    self._pending_episode = True
+
+  def flush(self):
+    '''
+    Writes the buffered frames as a block, so they are on disk even if the process dies.
+    '''
+    self._flush_block()
+    self._file.flush()
+
+  def close(self):
+    if not self._file:
+      return
+    self._flush_block()
+    index = _encode_index(self._block_offsets, self._frame_blocks, self._frame_offsets, self._frame_directions,
+                          self._frame_update_ids, self._episodes)
+    compressed = self.compressor.compress(index)
+    index_offset = self._file.tell()
+    self._file.write(compressed)
+    self._file.write(_TRAILER.pack(index_offset, len(compressed), len(index), _INDEX_MAGIC))
+    self._file.close()
+    self._file = None
+
+  def _flush_block(self):
+    if not self._block_frames:
+      return
+    compressed = self.compressor.compress(bytes(self._block))
+    self._block_offsets.append(self._file.tell())
+    self._file.write(_BLOCK_HEADER.pack(len(compressed), len(self._block), self._block_frames))
+    self._file.write(compressed)
+    self._block = bytearray()
+    self._block_frames = 0
+
+
+def open_recorder(path: str, codec: Optional[Codec] = None) -> Recorder:
+  '''
+  Creates the recorder for a record_path: binary if it ends with BINARY_RECORD_EXTENSION, json lines otherwise.
+
+  params codec: Used by the binary recorder to index update messages that can't be peeked at without decoding.
+  '''
+  if path.endswith(BINARY_RECORD_EXTENSION):
+    return BinaryRecorder(path, codec=codec)
+  return TextRecorder(path)
+
+
+def _little_endian(values: array) -> bytes:
+  if sys.byteorder != 'little':
+    values = array(values.typecode, values)
+    values.byteswap()
+  return values.tobytes()
+
+
+def _from_little_endian(typecode: str, data: bytes) -> array:
+  values = array(typecode)
+  values.frombytes(data)
+  if sys.byteorder != 'little':
+    values.byteswap()
+  return values
+
+
+def _encode_index(block_offsets: array, frame_blocks: array, frame_offsets: array, frame_directions: array,
+                  frame_update_ids: array, episodes: array) -> bytes:
+  return b''.join([
+    _INDEX_HEADER.pack(len(block_offsets), len(frame_blocks), len(episodes)),
+    _little_endian(block_offsets),
+    _little_endian(frame_blocks),
+    _little_endian(frame_offsets),
+    _little_endian(frame_update_ids),
+    _little_endian(episodes),
+    frame_directions.tobytes(),
+  ])
+
+
+class ReplayFrame(NamedTuple):
+  direction: int
+  # Update id, or -1 if the frame is not an update.
+  update_id: int
+  payload: bytes
+
+
+class ReplayReader:
+  '''
+  Random access to a recording written by BinaryRecorder. The file is memory mapped, and only the blocks that are read are
+  decompressed. The last decompressed block is cached, so reading frames in order decompresses every block once.
+
+  params path: The recording.
+  params codec: Used by read_json.
+  '''
+  def __init__(self, path: str, codec: Optional[Codec] = None):
+    self.path = path
+    self.codec = codec if codec else get_codec()
+    self._file = open(path, 'rb')
+    if os.fstat(self._file.fileno()).st_size < _HEADER.size:
+      self._file.close()
+      raise ValueError(f'Recording is empty or truncated before the end of its header: {path}')
+    self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, compressor_id, _ = _HEADER.unpack_from(self._mmap, 0)
+    if magic != _MAGIC:
+      self.close()
+      raise ValueError(f'Not a Towerfall recording: {path}')
+    if version != _VERSION:
+      self.close()
+      raise ValueError(f'Unsupported recording version: {version}')
+    self.compressor = _compressor_by_id(compressor_id)
+    self._cached_block = -1
+    self._cached_data = b''
+    if not self._load_index():
+      self._rebuild_index()
+    self._frame_by_update_id: Optional[Dict[int, int]] = None
+
+  def __len__(self) -> int:
+    return len(self._frame_blocks)
+
+  def __getitem__(self, i: int) -> ReplayFrame:
+    return self.frame(i)
+
+  def __iter__(self) -> Iterator[ReplayFrame]:
+    return self.frames()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+  @property
+  def n_episodes(self) -> int:
+    return len(self._episodes)
+
+  def frame(self, i: int) -> ReplayFrame:
+    '''
+    Reads frame i, counting messages in both directions.
+    '''
+    if i < 0:
+      i += len(self)
+    data = self._block_data(self._frame_blocks[i])
+    offset = self._frame_offsets[i]
+    direction, size = _FRAME_HEADER.unpack_from(data, offset)
+    start = offset + _FRAME_HEADER.size
+    return ReplayFrame(direction, self._frame_update_ids[i], data[start:start + size])
+
+  def frames(self, start: int = 0, stop: Optional[int] = None) -> Iterator[ReplayFrame]:
+    for i in range(start, len(self) if stop is None else min(stop, len(self))):
+      yield self.frame(i)
+
+  def read_json(self, i: int) -> Mapping[str, Any]:
+    return self.codec.loads(self.frame(i).payload)
+
+  def find_update(self, update_id: int) -> int:
+    '''
+    Returns the frame of the first update with the given id. Raises KeyError if there is none.
+    '''
+    if self._frame_by_update_id is None:
+      self._frame_by_update_id = {}
+      for i, frame_update_id in enumerate(self._frame_update_ids):
+        if frame_update_id >= 0 and frame_update_id not in self._frame_by_update_id:
+          self._frame_by_update_id[frame_update_id] = i
+    return self._frame_by_update_id[update_id]
+
+  def episode_frames(self, episode: int) -> range:
+    '''
+    The frames of an episode, from its first update to the frame before the next episode starts.
+    '''
+    if episode < 0:
+      episode += len(self._episodes)
+    start = self._episodes[episode]
+    stop = self._episodes[episode + 1] if episode + 1 < len(self._episodes) else len(self)
+    return range(start, stop)
+
+  def episode_of(self, frame: int) -> int:
+    '''
+    The episode a frame belongs to, or -1 if it comes before the first episode.
+    '''
+    return bisect_right(self._episodes, frame) - 1
+
+  def direction_frames(self, direction: int) -> array:
+    '''
+    The frames of the messages in a direction, in order.
+    '''
+    directions = self._frame_directions
+    return array('I', [i for i in range(len(directions)) if directions[i] == direction])
+
+  def update_ids(self) -> List[int]:
+    return [update_id for update_id in self._frame_update_ids if update_id >= 0]
+
+  def close(self):
+    self._mmap.close()
+    self._file.close()
+
+  def _block_data(self, block: int) -> bytes:
+    if block != self._cached_block:
+      offset = self._block_offsets[block]
+      compressed_size, raw_size, _ = _BLOCK_HEADER.unpack_from(self._mmap, offset)
+      start = offset + _BLOCK_HEADER.size
+      self._cached_data = self.compressor.decompress(self._mmap[start:start + compressed_size], raw_size)
+      self._cached_block = block
+    return self._cached_data
+
+  def _load_index(self) -> bool:
+    if len(self._mmap) < _HEADER.size + _TRAILER.size:
+      return False
+    index_offset, compressed_size, raw_size, magic = _TRAILER.unpack_from(self._mmap, len(self._mmap) - _TRAILER.size)
+    if magic != _INDEX_MAGIC or index_offset + compressed_size > len(self._mmap) - _TRAILER.size:
+      return False
+    index = self.compressor.decompress(self._mmap[index_offset:index_offset + compressed_size], raw_size)
+    n_blocks, n_frames, n_episodes = _INDEX_HEADER.unpack_from(index, 0)
+    offset = _INDEX_HEADER.size
+    sections: List[Tuple[str, int]] = [('Q', n_blocks), ('I', n_frames), ('I', n_frames), ('q', n_frames), ('I', n_episodes)]
+    arrays = []
+    for typecode, count in sections:
+      size = array(typecode).itemsize * count
+      arrays.append(_from_little_endian(typecode, index[offset:offset + size]))
+      offset += size
+    self._block_offsets, self._frame_blocks, self._frame_offsets, self._frame_update_ids, self._episodes = arrays
+    self._frame_directions = array('B', index[offset:offset + n_frames])
+    return True
+
+  def _rebuild_index(self):
+    '''
+    Walks the blocks of a recording that has no index, because it was not closed. Episode boundaries are lost, so the whole
+    recording is a single episode.
+    '''
+    self._block_offsets = array('Q')
+    self._frame_blocks = array('I')
+    self._frame_offsets = array('I')
+    self._frame_directions = array('B')
+    self._frame_update_ids = array('q')
+    offset = _HEADER.size
+    while offset + _BLOCK_HEADER.size <= len(self._mmap):
+      compressed_size, raw_size, n_frames = _BLOCK_HEADER.unpack_from(self._mmap, offset)
+      if offset + _BLOCK_HEADER.size + compressed_size > len(self._mmap):
+        break
+      block = len(self._block_offsets)
+      self._block_offsets.append(offset)
+      data = self._block_data(block)
+      frame_offset = 0
+      for _ in range(n_frames):
+        direction, size = _FRAME_HEADER.unpack_from(data, frame_offset)
+        payload_start = frame_offset + _FRAME_HEADER.size
+        update_id = peek_update_id(data[payload_start:payload_start + size], self.codec) if direction == RECEIVED else None
+        self._frame_blocks.append(block)
+        self._frame_offsets.append(frame_offset)
+        self._frame_directions.append(direction)
+        self._frame_update_ids.append(-1 if update_id is None else update_id)
+        frame_offset = payload_start + size
+      offset += _BLOCK_HEADER.size + compressed_size
+    self._episodes = array('I', [0] if len(self._frame_blocks) else [])
@@ -0,0 +1,119 @@
+from bisect import bisect_left, bisect_right
+from typing import Any, Callable, List, Mapping, Optional, Sequence
+
+from .codec import Codec, get_codec, peek_type
+from .recording import BINARY_RECORD_EXTENSION, RECEIVED, ReplayReader
+
+# Messages the game sends to an agent. Text recordings do not store the direction, so these are told apart by type.
+_GAME_MESSAGE_TYPES = ('init', 'scenario', 'update')
+
+
+class ReplayConnection:
+  '''
+  Stands in for the Connection returned by Towerfall.join, serving the init, scenario and update messages of a recording as
+  fast as they are read. Messages written to it are discarded. Pass it to TowerfallEnv to run observations and objectives
+  without a game process.
+
+  Recordings ending with .tfr are served lazily by ReplayReader, which only decompresses the blocks being replayed. Any
+  other path is read as the json lines written by Connection, whose types are peeked to keep the game messages.
+
+  params path: The recording.
+  params loop: Whether to start over from the first update once the recording is exhausted, instead of raising ConnectionError.
+  params codec: Json codec used by read_json. If None, the fastest installed codec is used.
+  '''
+  def __init__(self, path: str, loop: bool = False, codec: Optional[Codec] = None):
+    self.path = path
+    self.loop = loop
+    self.codec = codec if codec else get_codec()
+    self.port = 0
+    self.on_close: Callable
+    self.record_path = None
+    self._reader: Optional[ReplayReader] = None
+    # Positions of the first update of every episode. Empty for text recordings.
+    self._episodes: List[int] = []
+    self._lines: List[bytes] = []
+    self._closed = False
+    if path.endswith(BINARY_RECORD_EXTENSION):
+      self._reader = ReplayReader(path, codec=self.codec)
+      # Frames of the reader served in order. The payloads are only read when served.
+      self._frames: Sequence[int] = self._reader.direction_frames(RECEIVED)
+      for episode in range(self._reader.n_episodes):
+        self._episodes.append(bisect_left(self._frames, self._reader.episode_frames(episode).start))
+      self._first_update = next((i for i, frame in enumerate(self._frames) if self._reader.frame(frame).update_id >= 0), len(self._frames))
+    else:
+      self._lines = self._load_text(path)
+      self._frames = range(len(self._lines))
+      self._first_update = next((i for i, line in enumerate(self._lines) if peek_type(line, self.codec) == 'update'), len(self._lines))
+    if not self._frames:
+      self.close()
+      raise ValueError(f'No game messages in recording: {path}')
+    self._next = 0
+    self.messages_read = 0
+
+  def __len__(self) -> int:
+    return len(self._frames)
+
+  def close(self):
+    if self._reader and not self._closed:
+      self._reader.close()
+    self._closed = True
+    if hasattr(self, 'on_close'):
+      self.on_close()
+
+  def is_open(self) -> bool:
+    return not self._closed and (self.loop or self._next < len(self._frames))
+
+  def has_frame(self) -> bool:
+    return self.is_open()
+
+  def mark_episode(self):
+    '''
+    Called on reset. Skips the rest of the current episode of the recording, unless it is at the start of one.
+    Text recordings have no episode boundaries, so they are replayed in order.
+    '''
+    if not self._episodes or self._next <= self._first_update:
+      return
+    i = bisect_left(self._episodes, self._next)
+    if i < len(self._episodes) and self._episodes[i] == self._next:
+      return
+    i = bisect_right(self._episodes, self._next)
+    self._next = self._episodes[i] if i < len(self._episodes) else len(self._frames)
+
+  def write(self, msg: str):
+    pass
+
+  def write_bytes(self, payload: bytes):
+    pass
+
+  def send_json(self, obj: Mapping[str, Any]):
+    pass
+
+  def read(self) -> str:
+    return self.read_bytes().decode('utf-8')
+
+  def read_bytes(self) -> bytes:
+    if self._closed:
+      raise ConnectionError('Replay is closed')
+    if self._next >= len(self._frames):
+      if not self.loop or self._first_update >= len(self._frames):
+        raise ConnectionError('End of replay')
+      self._next = self._first_update
+    if self._reader:
+      payload = self._reader.frame(self._frames[self._next]).payload
+    else:
+      payload = self._lines[self._next]
+    self._next += 1
+    self.messages_read += 1
+    return payload
+
+  def read_json(self) -> Mapping[str, Any]:
+    return self.codec.loads(self.read_bytes())
+
+  def _load_text(self, path: str) -> List[bytes]:
+    lines = []
+    with open(path, 'rb') as file:
+      for line in file:
+        line = line.rstrip(b'\n')
+        if line and peek_type(line, self.codec) in _GAME_MESSAGE_TYPES:
+          lines.append(line)
+    return lines
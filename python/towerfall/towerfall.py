@@ -1,51 +1,187 @@
-import json
 import logging
 import os
 import random
 import signal
-import time
-from io import TextIOWrapper
-from typing import Any, Callable, Dict, List, Mapping, Optional
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Mapping, Optional
 
 import psutil
 from psutil import Popen
 
 from .connection import Connection
+from .pool_index import _DEFAULT_CAPABILITIES, get_pool_index
+
+if TYPE_CHECKING:
+  from .pool import TowerfallPool
 
 _DEFAULT_STEAM_PATH_WINDOWS = 'J:\SteamLibrary\steamapps\common\TowerFall'
 _ENV_TOWERFALL_PATH = 'TOWERFALL_PATH'
+_DEFAULT_POOL_NAME = 'default'
+_SPAWN_TIMEOUT = 20
+# Command line flags that start the game with a capability different from its default.
+_CAPABILITY_ARGS = {
+  ('fastrun', False): '--no-fastrun',
+  ('nographics', True): '--nographics',
+}
 
 class TowerfallError(Exception):
   pass
 
-class Towerfall:
+class _TowerfallBase:
+  '''
+  Locates the Towerfall installation and attains a game process from the pool. Shared by the blocking and asyncio clients.
+  '''
+  def __init__(self,
+      config: Mapping[str, Any],
+      towerfall_path: str,
+      timeout: float,
+      verbose: int,
+      pool_name: str = _DEFAULT_POOL_NAME,
+      pool: Optional['TowerfallPool'] = None,
+      require: Mapping[str, Any] = {},
+      prefer: Mapping[str, Any] = {}):
+    if pool:
+      towerfall_path = pool.towerfall_path
+      pool_name = pool.pool_name
+    self.config: Mapping[str, Any] = config
+    self.towerfall_path = resolve_towerfall_path(towerfall_path)
+    self.towerfall_path_exe = os.path.join(self.towerfall_path, 'TowerFall.exe')
+    self.pool_name = pool_name
+    self.pool_path = get_pool_path(self.towerfall_path, self.pool_name)
+    self.pool = pool
+    self.require = require
+    self.prefer = prefer
+    self.timeout = timeout
+    self.verbose = verbose
+    self.port: int
+    self.pid: int
+
+  def _check_response(self, response: Mapping[str, Any], action: str):
+    if response['type'] != 'result':
+      raise TowerfallError(f'Unexpected response type: {response["type"]}')
+    if not response['success']:
+      raise TowerfallError(f'Failed to {action}. Port: {self.port}, Response: {response["message"]}')
+
+  def _attain_game_port(self) -> int:
+    if self.pool:
+      metadata = self.pool.acquire_metadata(self.require, self.prefer)
+      self.pid = metadata['pid']
+      return metadata['port']
+
+    metadata = self._find_compatible_metadata()
+
+    if not metadata:
+      self._try_log(logging.info, f'Starting new process from {self.towerfall_path_exe}.')
+      spawn_process(self.towerfall_path, self.pool_name, {**self.prefer, **self.require})
+      self._try_log(logging.info, f'Waiting for available process.')
+      metadata = get_pool_index(self.pool_path).wait_take(self._select_metadata, _SPAWN_TIMEOUT)
+    if not metadata:
+      raise TowerfallError(f'Could not find or create a Towerfall process. Required capabilities: {dict(self.require)}')
+
+    self.pid = metadata['pid']
+    return metadata['port']
+
+  def _end_reservation(self):
+    '''
+    Called once the process is configured. It no longer registers as idle, so the pool can stop holding it for this client.
+    '''
+    if self.pool:
+      self.pool.end_reservation(self.pid)
+
+  def _find_compatible_metadata(self) -> Optional[Mapping[str, Any]]:
+    return get_pool_index(self.pool_path).take(self._select_metadata)
+
+  def _select_metadata(self, metadatas: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    return select_metadata(metadatas, self.require, self.prefer)
+
+  def _try_log(self, log_fn: Callable[[str], None], message: str):
+    if self.verbose > 0:
+      log_fn(message)
+
+
+def resolve_towerfall_path(towerfall_path: str) -> str:
+  '''
+  Returns towerfall_path if it exists, otherwise the path in the TOWERFALL_PATH env variable.
+  '''
+  if os.path.exists(towerfall_path):
+    return towerfall_path
+  env_towerfall_path = os.environ.get(_ENV_TOWERFALL_PATH)
+  if env_towerfall_path:
+    if not os.path.exists(env_towerfall_path):
+      raise TowerfallError(f'\n\nInstallation path defined in env variable {_ENV_TOWERFALL_PATH} does not exist: {env_towerfall_path}. Make sure {_ENV_TOWERFALL_PATH} is set to the installation path of Towerfall.')
+    return env_towerfall_path
+  raise TowerfallError(f'\n\nThe default installation path does not exist: {towerfall_path}. You have 2 options:\n  a) Set env variable {_ENV_TOWERFALL_PATH} with the installation path.\n  b) Set the towerfall_path parameter in Towerfall constructor with the installation path.')
+
+
+def get_pool_path(towerfall_path: str, pool_name: str) -> str:
+  '''
+  Directory where the game processes of a pool register their metadata while they are idle.
+  '''
+  return os.path.join(towerfall_path, 'aimod', 'pools', pool_name)
+
+
+def select_metadata(metadatas: List[Dict[str, Any]],
+    require: Mapping[str, Any] = {},
+    prefer: Mapping[str, Any] = {}) -> Optional[Dict[str, Any]]:
+  '''
+  Chooses a process by its capabilities, as registered in its metadata (fastrun, nographics).
+
+  params metadatas: The metadata of the idle processes.
+  params require: Capabilities the process must have. Processes that don't match are never chosen.
+  params prefer: Capabilities to prefer, in order of priority. The first one outweighs all the following ones.
+    Ties are broken randomly.
+
+  returns: The chosen metadata, or None if no process has the required capabilities.
+  '''
+  candidates = [m for m in metadatas if all(m.get(key) == value for key, value in require.items())]
+  if not candidates:
+    return None
+  if prefer:
+    def score(metadata: Dict[str, Any]):
+      return tuple(metadata.get(key) == value for key, value in prefer.items())
+    best = max(score(m) for m in candidates)
+    candidates = [m for m in candidates if score(m) == best]
+  return random.choice(candidates)
+
+
+def spawn_process(towerfall_path: str, pool_name: str = _DEFAULT_POOL_NAME, capabilities: Mapping[str, Any] = {}) -> Popen:
+  '''
+  Starts a new Towerfall process without waiting for it to register in the pool.
+
+  params capabilities: Capabilities to start the process with, like dict(nographics=True). Unknown ones are ignored.
+  '''
+  pargs = [os.path.join(towerfall_path, 'TowerFall.exe')]
+  if pool_name != _DEFAULT_POOL_NAME:
+    pargs += ['--pool', pool_name]
+  for key, value in capabilities.items():
+    arg = _CAPABILITY_ARGS.get((key, value))
+    if arg:
+      pargs.append(arg)
+  return Popen(pargs, cwd=towerfall_path)
+
+
+class Towerfall(_TowerfallBase):
   '''
   Creates or reuses a Towerfall game process.
 
   params towerfall_path: The parent path where Towerfall.exe is located.
   params timeout: The timeout for the management API (Config, Reset).
   params verbose: The verbosity level. 0: no logging, 1: much logging.
+  params pool_name: The pool to take the process from.
+  params pool: If set, the process is leased from this pool, which also determines towerfall_path and pool_name.
+  params require: Capabilities the process must have, like dict(nographics=True, fastrun=True). If no idle process has them,
+    a new one is started with them.
+  params prefer: Capabilities to prefer when several processes qualify, in order of priority.
   '''
   def __init__(self,
       config: Mapping[str, Any] = {},
       towerfall_path: str = _DEFAULT_STEAM_PATH_WINDOWS,
       timeout: float = 2,
-      verbose: int = 0):
-    if not os.path.exists(towerfall_path):
-      env_towerfall_path = os.environ.get(_ENV_TOWERFALL_PATH)
-      if env_towerfall_path:
-        if not os.path.exists(env_towerfall_path):
-          raise TowerfallError(f'\n\nInstallation path defined in env variable {_ENV_TOWERFALL_PATH} does not exist: {env_towerfall_path}. Make sure {_ENV_TOWERFALL_PATH} is set to the installation path of Towerfall.')
-        towerfall_path = env_towerfall_path
-      else:
-        raise TowerfallError(f'\n\nThe default installation path does not exist: {towerfall_path}. You have 2 options:\n  a) Set env variable {_ENV_TOWERFALL_PATH} with the installation path.\n  b) Set the towerfall_path parameter in Towerfall constructor with the installation path.')
-    self.config: Mapping[str, Any] = config
-    self.towerfall_path = towerfall_path
-    self.towerfall_path_exe = os.path.join(self.towerfall_path, 'TowerFall.exe')
-    self.pool_name = 'default'
-    self.pool_path = os.path.join(self.towerfall_path, 'aimod', 'pools', self.pool_name)
-    self.timeout = timeout
-    self.verbose = verbose
+      verbose: int = 0,
+      pool_name: str = _DEFAULT_POOL_NAME,
+      pool: Optional['TowerfallPool'] = None,
+      require: Mapping[str, Any] = {},
+      prefer: Mapping[str, Any] = {}):
+    super().__init__(config, towerfall_path, timeout, verbose, pool_name, pool, require, prefer)
     tries = 0
     while True:
       self.port = self._attain_game_port()
@@ -53,6 +189,7 @@ class Towerfall:
       try:
         self.open_connection = Connection(self.port, timeout=timeout, verbose=verbose)
         self.send_config(config)
+        self._end_reservation()
         break
       except TowerfallError:
         if tries > 3:
@@ -70,10 +207,7 @@ class Towerfall:
     connection = Connection(self.port, timeout=timeout, verbose=verbose)
     connection.send_json(dict(type='join'))
     response = connection.read_json()
-    if response['type'] != 'result':
-      raise TowerfallError(f'Unexpected response type: {response["type"]}')
-    if not response['success']:
-      raise TowerfallError(f'Failed to join the game. Port: {self.port}, Response: {response["message"]}')
+    self._check_response(response, 'join the game')
     self._try_log(logging.info, f'Successfully joined the game. Port: {self.port}')
     return connection
 
@@ -83,12 +217,22 @@ class Towerfall:
 
     params entities: The entities to reset. If None, the entities specified in the last reset will be used.
     '''
+    self.request_reset(entities)
+    self.wait_reset()
 
-    response = self.send_request_json(dict(type='reset', entities=entities))
-    if response['type'] != 'result':
-      raise TowerfallError(f'Unexpected response type: {response["type"]}')
-    if not response['success']:
-      raise TowerfallError(f'Failed to reset the game. Port: {self.port}, Response: {response["message"]}')
+  def request_reset(self, entities: Optional[List[Dict[str, Any]]] = None):
+    '''
+    First half of send_reset. Sends the reset without waiting for the result, so the agents can reply in the meantime.
+    Call wait_reset before any other request.
+    '''
+    self.open_connection.send_json(dict(type='reset', entities=entities))
+
+  def wait_reset(self):
+    '''
+    Second half of send_reset. Waits for the result of request_reset.
+    '''
+    response = self.open_connection.read_json()
+    self._check_response(response, 'reset the game')
     self._try_log(logging.info, f'Successfully reset the game. Port: {self.port}')
 
   def send_config(self, config = None):
@@ -103,10 +247,7 @@ class Towerfall:
       config = self.config
 
     response = self.send_request_json(dict(type='config', config=config))
-    if response['type'] != 'result':
-      raise TowerfallError(f'Unexpected response type: {response["type"]}')
-    if not response['success']:
-      raise TowerfallError(f'Failed to configure the game. Port: {self.port}, Response: {response["message"]}')
+    self._check_response(response, 'configure the game')
     self.config = config
 
   def send_request_json(self, obj: Mapping[str, Any]):
@@ -130,73 +271,19 @@ class Towerfall:
         logging.error(f'Failed to kill process {process.pid}: {ex}')
         continue
 
+  def is_healthy(self) -> bool:
+    '''
+    Checks that the game process is alive and the management connection was not closed by it.
+    '''
+    try:
+      if psutil.Process(self.pid).status() == psutil.STATUS_ZOMBIE:
+        return False
+    except psutil.NoSuchProcess:
+      return False
+    return self.open_connection.is_open()
+
   def close(self):
     '''
     Close the management connection. This will free the Towerfall process to be used by other clients.
     '''
     self.open_connection.close()
-
-  def _attain_game_port(self) -> int:
-    metadata = self._find_compatible_metadata()
-
-    if not metadata:
-      self._try_log(logging.info, f'Starting new process from {self.towerfall_path_exe}.')
-      pargs = [self.towerfall_path_exe]
-      Popen(pargs, cwd=self.towerfall_path)
-
-    tries = 0
-    self._try_log(logging.info, f'Waiting for available process.')
-    while not metadata and tries < 10:
-      time.sleep(2)
-      metadata = self._find_compatible_metadata()
-      tries += 1
-    if not metadata:
-      raise TowerfallError('Could not find or create a Towerfall process.')
-
-    return metadata['port']
-
-  def _find_compatible_metadata(self) -> Optional[Mapping[str, Any]]:
-    if not os.path.exists(self.pool_path):
-      return None
-    dirs = list(os.listdir(self.pool_path))
-    random.shuffle(dirs)
-    for file_name in os.listdir(self.pool_path):
-      try:
-        pid = int(file_name)
-        psutil.Process(pid)
-      except (ValueError, psutil.NoSuchProcess):
-        os.remove(os.path.join(self.pool_path, file_name))
-        continue
-      try:
-        with open(os.path.join(self.pool_path, file_name), 'r') as file:
-          try:
-            metadata = Towerfall._load_metadata(file)
-          except (ValueError, json.JSONDecodeError, FileNotFoundError) as ex:
-            self._try_log(logging.warning, f'Invalid metadata file {file_name}. Exception: {ex}')
-            continue
-          return metadata
-      except PermissionError as ex:
-        self._try_log(logging.warning, f'Failed to access {file_name}. Exception: {ex}')
-        continue
-    return None
-
-  @staticmethod
-  def _load_metadata(file: TextIOWrapper) -> Mapping[str, Any]:
-    metadata = json.load(file)
-    if 'port' not in metadata:
-      raise ValueError('Port not found in metadata.')
-    try:
-      metadata['port'] = int(metadata['port'])
-    except ValueError:
-      raise ValueError(f'Port is not an integer. Port: {metadata["port"]}')
-
-    if 'fastrun' not in metadata:
-      metadata['fastrun'] = False
-    if 'nographics' not in metadata:
-      metadata['nographics'] = False
-    return metadata
-
-  def _try_log(self, log_fn: Callable[[str], None], message: str):
-    if self.verbose > 0:
-      log_fn(message)
-